@@ -0,0 +1,318 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Union
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Every cache registers itself here so its counters can be scraped in one place
+caches: Dict[str, Union["TTLCache", "ByteBudgetCache"]] = {}
+
+class TTLCache:
+    """
+    Bounded in-process cache with per-entry TTL and LRU eviction.
+
+    Entries older than ttl are stale. A stale entry can still be served by
+    get_or_load in stale-while-revalidate mode (up to max_stale seconds past
+    expiry) while a background task refreshes it. Not thread-safe; meant to be
+    used from the event loop only.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: float, max_stale: float = 0.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict() # key -> (value, expires_at)
+        self._refreshing: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set() # Keep background refreshes referenced until done
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.evictions = 0
+        caches[name] = self
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: Hashable, allow_stale: bool):
+        # Returns (value, is_stale) or None; drops entries too old to serve
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        now = time.monotonic()
+        if now < expires_at:
+            self._entries.move_to_end(key)
+            return value, False
+        if allow_stale and now < expires_at + self.max_stale:
+            self._entries.move_to_end(key)
+            return value, True
+        if now >= expires_at + self.max_stale:
+            del self._entries[key]
+        return None
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get a fresh value, or None on a miss or if the entry has expired."""
+        found = self._lookup(key, allow_stale=False)
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return found[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entries past max_entries."""
+        self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Optional[Any]]],
+        stale_while_revalidate: bool = False,
+        refresh_loader: Optional[Callable[[], Awaitable[Optional[Any]]]] = None
+    ) -> Optional[Any]:
+        """
+        Get a value, calling loader on a miss. Loader results of None are not cached.
+
+        With stale_while_revalidate, a stale entry is returned immediately and
+        refresh_loader (default: loader) runs in a background task to replace it.
+        """
+        found = self._lookup(key, allow_stale=stale_while_revalidate)
+        if found is not None:
+            value, is_stale = found
+            if not is_stale:
+                self.hits += 1
+                return value
+            self.stale_hits += 1
+            self._schedule_refresh(key, refresh_loader or loader)
+            return value
+
+        self.misses += 1
+        value = await loader()
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def _schedule_refresh(self, key: Hashable, loader: Callable[[], Awaitable[Optional[Any]]]) -> None:
+        if key in self._refreshing:
+            return # One refresh per key is enough
+        self._refreshing.add(key)
+        task = asyncio.create_task(self._refresh(key, loader))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, key: Hashable, loader: Callable[[], Awaitable[Optional[Any]]]) -> None:
+        try:
+            value = await loader()
+            if value is not None:
+                self.set(key, value)
+                self.refreshes += 1
+            else:
+                self.refresh_failures += 1
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.warning("Background refresh of %s[%s] failed: %s", self.name, key, e)
+        finally:
+            self._refreshing.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "evictions": self.evictions,
+        }
+
+class ByteBudgetCache:
+    """
+    In-process cache bounded by the total size of its values rather than their count,
+    with an optional on-disk tier.
+
+    Values must be JSON-serializable; an entry's size is the length of its JSON
+    encoding. Least recently used entries are evicted once max_bytes is exceeded.
+    With disk_dir set, every entry is also written there (one file per key, up to
+    max_disk_bytes, oldest files removed first), so entries evicted from memory or
+    lost to a restart are read back from disk instead of being refetched. Disk
+    I/O runs in a worker thread.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int,
+        ttl: float,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 0
+    ):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict() # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._disk_index: Optional["OrderedDict[str, int]"] = None # file name -> size, oldest first
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock() # Disk reads/writes can run in several worker threads at once
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        caches[name] = self
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Get a value from memory, then disk; None on a miss or if expired."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at, size = entry
+            if time.time() < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._drop(key)
+
+        if self.disk_dir:
+            stored = await asyncio.to_thread(self._disk_read, key)
+            if stored is not None:
+                value, expires_at = stored
+                self._remember(key, value, expires_at, len(json.dumps(value)))
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value in memory (and on disk), evicting LRU entries past max_bytes."""
+        encoded = json.dumps(value)
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._remember(key, value, expires_at, len(encoded))
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_write, key, encoded, expires_at)
+
+    def _remember(self, key: str, value: Any, expires_at: float, size: int) -> None:
+        if size > self.max_bytes:
+            return # Would evict everything else; leave it to the disk tier
+        self._drop(key)
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    # --- Disk tier (called in a worker thread) ---
+
+    def _file_name(self, key: str) -> str:
+        return hashlib.sha1(key.encode()).hexdigest() + ".json"
+
+    def _ensure_disk_index(self) -> "OrderedDict[str, int]":
+        if self._disk_index is None:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            files = []
+            for entry in os.scandir(self.disk_dir):
+                if entry.is_file() and entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name, stat.st_size))
+            self._disk_index = OrderedDict((file_name, size) for _, file_name, size in sorted(files))
+            self._disk_bytes = sum(self._disk_index.values())
+        return self._disk_index
+
+    def _disk_read(self, key: str) -> Optional[tuple]:
+        with self._disk_lock:
+            return self._disk_read_locked(key)
+
+    def _disk_read_locked(self, key: str) -> Optional[tuple]:
+        index = self._ensure_disk_index()
+        file_name = self._file_name(key)
+        if file_name not in index:
+            return None
+        try:
+            with open(os.path.join(self.disk_dir, file_name), encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            self._disk_remove(file_name)
+            return None
+        if stored.get("key") != key or time.time() >= stored.get("expires_at", 0):
+            self._disk_remove(file_name)
+            return None
+        return stored["value"], stored["expires_at"]
+
+    def _disk_write(self, key: str, encoded_value: str, expires_at: float) -> None:
+        with self._disk_lock:
+            self._disk_write_locked(key, encoded_value, expires_at)
+
+    def _disk_write_locked(self, key: str, encoded_value: str, expires_at: float) -> None:
+        index = self._ensure_disk_index()
+        file_name = self._file_name(key)
+        data = f'{{"key": {json.dumps(key)}, "expires_at": {expires_at}, "value": {encoded_value}}}'
+        if len(data) > self.max_disk_bytes:
+            return
+        path = os.path.join(self.disk_dir, file_name)
+        try:
+            # Write then rename so a reader never sees a half-written file
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning("Could not write %s disk entry: %s", self.name, e)
+            return
+        self._disk_bytes -= index.pop(file_name, 0)
+        index[file_name] = len(data)
+        self._disk_bytes += len(data)
+        while self._disk_bytes > self.max_disk_bytes and index:
+            self._disk_remove(next(iter(index)))
+            self.disk_evictions += 1
+
+    def _disk_remove(self, file_name: str) -> None:
+        self._disk_bytes -= self._disk_index.pop(file_name, 0)
+        try:
+            os.remove(os.path.join(self.disk_dir, file_name))
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk_bytes": self._disk_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_evictions": self.disk_evictions,
+        }
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Counters for every registered cache, keyed by cache name."""
+    return {name: cache.stats() for name, cache in caches.items()}
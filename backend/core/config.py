@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import List, Optional
 
 class Settings(BaseSettings):
     DISCORD_CLIENT_ID: str = "YOUR_DISCORD_CLIENT_ID_HERE"
@@ -13,6 +13,29 @@ class Settings(BaseSettings):
     DISCORD_TOKEN_URL: str = "https://discord.com/api/oauth2/token"
     DISCORD_USER_INFO_URL: str = "https://discord.com/api/users/@me"
     DISCORD_USER_GUILDS_URL: str = "https://discord.com/api/users/@me/guilds"
+    DISCORD_API_BASE_URL: str = "https://discord.com/api/v10" # Base for all calls made through the shared client
+
+    # Shared Discord HTTP client settings
+    DISCORD_HTTP2: bool = True
+    DISCORD_HTTP_MAX_CONNECTIONS: int = 100
+    DISCORD_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    DISCORD_HTTP_KEEPALIVE_EXPIRY: float = 30.0 # Seconds an idle connection is kept open
+    DISCORD_HTTP_CONNECT_TIMEOUT: float = 5.0
+    DISCORD_HTTP_READ_TIMEOUT: float = 10.0
+
+    # Discord rate limit scheduling
+    DISCORD_GLOBAL_RATE_LIMIT_PER_SECOND: int = 50 # Discord's global limit for bot tokens
+    DISCORD_RATE_LIMIT_MAX_RETRIES: int = 3 # 429 retries before giving the response back to the caller
+
+    # Startup: with FAST_STARTUP the app serves as soon as it is up. The storage connection
+    # check and missing indexes happen in the background and the Discord client is created on
+    # first use; GET /health/ready answers 503 until storage is ready.
+    FAST_STARTUP: bool = False
+    HEALTH_PROBE_TIMEOUT_SECONDS: float = 2.0 # Storage ping timeout for GET /health/ready
+
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json" # "json" for one JSON object per line, "text" for human-readable lines
 
     # For session management (example, you might use a more robust secret)
     SECRET_KEY: str = "a_very_secret_key_for_jwt_or_sessions"
@@ -20,25 +43,93 @@ class Settings(BaseSettings):
     # JWT settings
     JWT_ALGORITHM: str = "HS256"
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 # e.g., 24 hours
+    JWT_VERIFIED_TOKEN_CACHE_MAX_ENTRIES: int = 10000 # Decoded tokens kept until their exp
+
+    # Storage engine: "mongo" (settings below), "sqlite" (one file at SQLITE_PATH) or "memory" (lost on restart)
+    STORAGE_ENGINE: str = "mongo"
+    SQLITE_PATH: str = "social_credit.db"
 
     # MongoDB settings
     MONGODB_URI: str = "mongodb://localhost:27017"
     MONGODB_DB_NAME: str = "social_credit_db"
     MONGODB_USER_COLLECTION: str = "users"
     MONGODB_SERVER_COLLECTION: str = "servers"
+    MONGODB_RATING_COLLECTION: str = "ratings" # Append-only ledger, one document per rating
+    MONGODB_ROLLUP_COLLECTION: str = "rating_rollups" # Per minute/hour/day sums of the ledger
+
+    # Rollup retention; day rollups are kept forever
+    ROLLUP_MINUTE_RETENTION_DAYS: int = 7
+    ROLLUP_HOUR_RETENTION_DAYS: int = 90
+    SCORE_SERIES_MAX_POINTS: int = 2000
+
+    # Discord profile cache settings
+    DISCORD_PROFILE_CACHE_MAX_ENTRIES: int = 10000
+    DISCORD_PROFILE_CACHE_TTL_SECONDS: float = 300.0
+    DISCORD_PROFILE_CACHE_STALE_WHILE_REVALIDATE: bool = True # Serve stale entries and refresh in the background
+    DISCORD_PROFILE_CACHE_MAX_STALE_SECONDS: float = 3600.0 # How long past TTL a stale entry may still be served
+
+    # Discord message content cache (GET /discord/channels/{c}/messages/{m} and POST /discord/messages/batch)
+    MESSAGE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024 # In memory, counted as JSON-encoded size
+    MESSAGE_CACHE_TTL_SECONDS: float = 6 * 3600.0 # Edits show up after this
+    MESSAGE_CACHE_MISSING_TTL_SECONDS: float = 300.0 # Deleted/inaccessible messages are remembered this long
+    MESSAGE_CACHE_DISK_DIR: Optional[str] = None # Set to enable the on-disk tier
+    MESSAGE_CACHE_MAX_DISK_BYTES: int = 512 * 1024 * 1024
+    MESSAGE_BATCH_MAX_ITEMS: int = 200
+    MESSAGE_BATCH_FETCH_CONCURRENCY: int = 10 # Concurrent Discord fetches per batch request
+
+    # Plugin ingest settings
+    PLUGIN_RATING_BATCH_MAX_ITEMS: int = 100 # Max ratings accepted by POST /plugin/ratings/batch
+    RATING_IDEMPOTENCY_CACHE_MAX_ENTRIES: int = 100000 # Recent rating keys answered without a DB round trip
+    RATING_IDEMPOTENCY_CACHE_TTL_SECONDS: float = 3600.0
+
+    # Background enrichment of placeholder guild/user records written on the plugin rating path
+    ENRICHMENT_WORKERS: int = 4
+    ENRICHMENT_MAX_QUEUE: int = 10000 # Jobs past this are dropped and keep their placeholder names
+    ENRICHMENT_MAX_ATTEMPTS: int = 5
+    ENRICHMENT_RETRY_BASE_SECONDS: float = 2.0 # Doubled after each failed attempt
+
+    # Write-behind scoring: plugin ratings are summed in memory per (acting, target) and
+    # written with one bulk write per flush. Reads merge in what is still buffered.
+    SCORE_WRITE_BEHIND: bool = False
+    SCORE_WRITE_BEHIND_FLUSH_SECONDS: float = 1.0
+    SCORE_WRITE_BEHIND_MAX_PENDING: int = 5000 # Buffered pairs + events that trigger an early flush
+
+    # Max concurrent ensure_user_in_db calls when GET /users/{id}/rated-users finds unknown targets
+    RATED_USERS_RESOLVE_CONCURRENCY: int = 10
+
+    # Tier lists: "quantile" cutoffs are cumulative fractions of the board (top 10% = S, ...),
+    # "threshold" cutoffs are minimum scores per tier. One cutoff each for S, A, B and C; the rest are D.
+    TIERLIST_MODE: str = "quantile"
+    TIERLIST_QUANTILES: List[float] = [0.1, 0.3, 0.6, 0.85]
+    TIERLIST_THRESHOLDS: List[float] = [50.0, 20.0, 0.0, -20.0]
+    TIERLIST_MAX_LIMIT: int = 500
+
+    # Push events (GET /events/stream)
+    PUSH_MAX_PENDING_EVENTS: int = 100 # Per client; past this the oldest is dropped and the client told to resync
+    PUSH_HEARTBEAT_SECONDS: float = 15.0
+
+    # GET /servers and GET /servers/{id}/users pagination
+    LISTING_DEFAULT_PAGE_SIZE: int = 100
+    LISTING_MAX_PAGE_SIZE: int = 1000
+    LISTING_STREAM_BATCH_SIZE: int = 500 # Documents fetched per round trip in ?format=ndjson mode
 
     # API Key settings
     API_KEY_SALT: str = "your_api_key_salt_here"  # Used for hashing API keys
     API_KEY_ALGORITHM: str = "sha256"  # Algorithm for hashing API keys
+    PLUGIN_AUTH_CACHE_TTL_SECONDS: float = 30.0 # How long a verified plugin key is trusted without a DB read
+    PLUGIN_AUTH_CACHE_MAX_ENTRIES: int = 10000
 
-    model_config = SettingsConfigDict(env_file=".env", env_file_encoding='utf-8', extra='ignore')
+    # Admin endpoints (/admin/...) take this in the X-Admin-API-Key header; they are disabled while it is unset
+    ADMIN_API_KEY: Optional[str] = None
 
-    def __init__(self, **values):
-        super().__init__(**values)
-        print(f"--- Settings Initialized ---")
-        print(f"API_KEY_SALT: {self.API_KEY_SALT}")
-        print(f"API_KEY_ALGORITHM: {self.API_KEY_ALGORITHM}")
-        print(f"---------------------------")
+    # Sampling profiler, off until started through POST /admin/profiler/start (which can override these)
+    PROFILER_SAMPLE_INTERVAL_MS: float = 5.0
+    PROFILER_DEFAULT_SAMPLE_RATE: float = 0.1 # Fraction of requests profiled
+    PROFILER_MAX_STACKS: int = 20000 # Distinct stacks kept; samples of new stacks past this are dropped
+    PROFILER_MAX_DEPTH: int = 128
+    PROFILER_BLOCKING_THRESHOLD_MS: float = 100.0 # Event loop stalls longer than this are logged with the blocking stack
+    PROFILER_MAX_BLOCKING_EVENTS: int = 100 # Recent stalls kept for GET /admin/profiler/stats
+
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding='utf-8', extra='ignore')
 
 settings = Settings()
-print(f"--- Global settings object created (config.py) --- API_KEY_SALT: {settings.API_KEY_SALT} ---") # Log when global is set 
\ No newline at end of file
@@ -1,43 +1,23 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import asyncio
 import hashlib
-from typing import Optional, Dict, Any
+import hmac
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timezone
 
 from .config import settings
+from .log import get_logger
+from .metrics import STORAGE_ENGINE_INFO, timed_storage
+from .storage import ROLLUP_RESOLUTIONS, StorageEngine, create_engine
+from .storage.base import rollup_retention
 
-# MongoDB client
-client: Optional[AsyncIOMotorClient] = None
-db = None
+logger = get_logger(__name__)
 
-async def connect_to_mongodb():
-    """Connect to MongoDB and initialize the database."""
-    global client, db
-    try:
-        client = AsyncIOMotorClient(settings.MONGODB_URI)
-        # Verify connection
-        await client.admin.command('ping')
-        db = client[settings.MONGODB_DB_NAME]
-        print("Connected to MongoDB!")
-    except ConnectionFailure as e:
-        print(f"Failed to connect to MongoDB: {e}")
-        raise
-
-async def close_mongodb_connection():
-    """Close the MongoDB connection."""
-    global client
-    if client:
-        client.close()
-        print("Closed MongoDB connection.")
+# The storage engine picked by settings.STORAGE_ENGINE, set by init_db().
+# Each operation below is timed under its collection for /metrics.
+engine: Optional[StorageEngine] = None
 
 def hash_api_key(api_key: str) -> str:
     """Hash an API key using the configured salt and algorithm."""
-    # --- Start Debug Logging for hash_api_key ---
-    print(f"--- hash_api_key called ---")
-    print(f"Using API_KEY_SALT (from settings object ID: {id(settings)}): '{settings.API_KEY_SALT}'")
-    print(f"Using API_KEY_ALGORITHM: '{settings.API_KEY_ALGORITHM}'")
-    # --- End Debug Logging for hash_api_key ---
     salted_key = f"{api_key}{settings.API_KEY_SALT}"
     hasher = hashlib.new(settings.API_KEY_ALGORITHM)
     hasher.update(salted_key.encode())
@@ -45,91 +25,436 @@ def hash_api_key(api_key: str) -> str:
 
 def verify_api_key(api_key: str, hashed_key: str) -> bool:
     """Verify an API key against its hash."""
-    # --- Start Debug Logging ---
-    print(f"--- Verifying API Key --- START ---")
-    print(f"Received Key (len={len(api_key)}): '{api_key[:4]}...{api_key[-4:]}'") # Avoid logging full key
-    print(f"Stored Hash (DB): '{hashed_key}'")
-    rehashed_provided_key = hash_api_key(api_key)
-    print(f"Re-hashed Received Key: '{rehashed_provided_key}'")
-    is_match = rehashed_provided_key == hashed_key
-    print(f"Comparison Result: {is_match}")
-    print(f"--- Verifying API Key --- END ---")
-    # --- End Debug Logging ---
-    return is_match
+    return hashed_digests_match(hash_api_key(api_key), hashed_key)
+
+def hashed_digests_match(provided_hash: str, stored_hash: str) -> bool:
+    """Constant-time comparison of two API key hashes."""
+    return hmac.compare_digest(provided_hash.encode(), stored_hash.encode())
+
+# Named projections ("views") of a user document. Pass one as `projection` so a read
+# only transfers the fields the caller uses; social_credits_given grows with every rating.
+USER_VIEWS: Dict[str, Dict[str, Any]] = {
+    # Everything except the score arrays: plugin key hash, key timestamp, guild list
+    "auth": {"_id": 0, "social_credits_given": 0},
+    # Display fields plus the IDs of the user's guilds
+    "profile": {"_id": 0, "user_id": 1, "username": 1, "profile_picture_url": 1, "servers.id": 1},
+    # The scores this user has given, for the credit/given endpoints
+    "scores": {"_id": 0, "user_id": 1, "social_credits_given": 1},
+}
 
 # User operations
-async def get_user(user_id: str) -> Optional[Dict[str, Any]]:
-    """Get a user by their ID."""
-    if db is None:
+@timed_storage("users")
+async def get_user(user_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Get a user by their ID, optionally projected (e.g. USER_VIEWS["profile"])."""
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.get_user(user_id, projection)
+
+@timed_storage("users")
+async def get_users_by_ids(user_ids: List[str], projection: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Get all users whose ID is in user_ids with a single query."""
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    if not user_ids:
+        return []
+    return await engine.get_users_by_ids(user_ids, projection)
+
+@timed_storage("users")
+async def upsert_user(user_data: Dict[str, Any], defaults: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Create or update a user.
+
+    Fields in defaults are only written when the user is created, so existing
+    values (scores, API key) are kept without reading them first.
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    await engine.upsert_user(user_data, defaults)
+
+@timed_storage("users")
+async def insert_user_if_missing(user_data: Dict[str, Any]) -> bool:
+    """Create the user from user_data unless it already exists. Returns True if it was created."""
+    if engine is None:
         raise RuntimeError("Database not initialized")
-    return await db[settings.MONGODB_USER_COLLECTION].find_one({"user_id": user_id})
+    return await engine.insert_user_if_missing(user_data)
 
-async def upsert_user(user_data: Dict[str, Any]) -> None:
-    """Create or update a user."""
-    if db is None:
+@timed_storage("users")
+async def update_user_fields(user_id: str, fields: Dict[str, Any]) -> None:
+    """Set only the given top-level fields on a user."""
+    if engine is None:
         raise RuntimeError("Database not initialized")
-    
-    await db[settings.MONGODB_USER_COLLECTION].update_one(
-        {"user_id": user_data["user_id"]},
-        {"$set": user_data},
-        upsert=True
-    )
+    await engine.update_user_fields(user_id, fields)
 
+@timed_storage("users")
 async def update_user_api_key(user_id: str, api_key: str, generated_at: datetime) -> None:
     """Update a user's API key."""
-    if db is None:
-        raise RuntimeError("Database not initialized")
-    
-    hashed_key = hash_api_key(api_key)
-    await db[settings.MONGODB_USER_COLLECTION].update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
-                "plugin_api_key": hashed_key,
-                "plugin_api_key_generated_at": generated_at
-            }
-        }
-    )
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    await engine.update_user_fields(user_id, {
+        "plugin_api_key": hash_api_key(api_key),
+        "plugin_api_key_generated_at": generated_at
+    })
 
 async def verify_user_api_key(user_id: str, provided_key: str) -> bool:
     """Verify a user's API key."""
-    if db is None:
+    if engine is None:
         raise RuntimeError("Database not initialized")
-    
-    print(f"--- verify_user_api_key called for user: {user_id} ---") # Add context log
-    user = await get_user(user_id)
+
+    user = await get_user(user_id, {"_id": 0, "plugin_api_key": 1})
     if not user or not user.get("plugin_api_key"):
-        print(f"API Key Verification FAIL: User {user_id} or stored key hash not found in DB.") # Add log
+        logger.info("API key verification failed: user %s or stored key hash not found.", user_id)
         return False
-    
-    # The detailed logs are now in the helper verify_api_key
+
     result = verify_api_key(provided_key, user["plugin_api_key"])
-    print(f"--- verify_user_api_key result for user {user_id}: {result} ---") # Add context log
+    logger.debug("API key verification for user %s: %s", user_id, result)
     return result
 
+# Score operations
+@timed_storage("users")
+async def apply_score_delta(
+    acting_user_id: str,
+    target_user_id: str,
+    score_delta: float,
+    server_id: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Atomically add score_delta to the acting user's entry for target_user_id.
+
+    Concurrent ratings from the same user never overwrite each other. The entry
+    is created on first rating. Returns the updated entry, or None if the acting
+    user does not exist.
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.apply_score_delta(acting_user_id, target_user_id, score_delta, server_id)
+
+@timed_storage("users")
+async def apply_score_deltas_bulk(
+    acting_user_id: str,
+    deltas: Dict[str, Dict[str, Any]]
+) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """
+    Apply many score deltas from one acting user in a single bulk write.
+
+    deltas maps target_user_id -> {"score_delta": float, "server_ids": [str, ...]}.
+    Returns (target_user_id -> updated entry for the applied targets, the
+    target_user_ids that were not applied).
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    if not deltas:
+        return {}, []
+
+    unapplied = await engine.apply_score_deltas({(acting_user_id, target_user_id): delta for target_user_id, delta in deltas.items()})
+    unapplied_targets = [target_user_id for _, target_user_id in unapplied]
+    if unapplied:
+        logger.error("Could not apply score deltas for %s -> %s", acting_user_id, ", ".join(unapplied_targets))
+    applied_targets = [target_user_id for target_user_id in deltas if target_user_id not in unapplied_targets]
+    if not applied_targets:
+        return {}, unapplied_targets
+    return await get_score_entries(acting_user_id, applied_targets) or {}, unapplied_targets
+
+@timed_storage("users")
+async def apply_score_deltas_many(
+    deltas: Dict[Tuple[str, str], Dict[str, Any]]
+) -> List[Tuple[str, str]]:
+    """
+    Apply summed deltas for many (acting_user_id, target_user_id) pairs in one bulk write.
+
+    Same per-pair updates as apply_score_deltas_bulk, without the read-back. If the
+    write fails partway, every pair before the failure has been applied and none
+    after it has. Returns the pairs that were not applied (empty on success) so the
+    caller can retry exactly those.
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    if not deltas:
+        return []
+    return await engine.apply_score_deltas(deltas)
+
+@timed_storage("users")
+async def get_score_entries(acting_user_id: str, target_ids: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Get the acting user's entries for target_ids.
+    Returns target_user_id -> entry, or None if the acting user does not exist.
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.get_score_entries(acting_user_id, target_ids)
+
+@timed_storage("users")
+async def get_rated_users_with_profiles(acting_user_id: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Get every entry in the acting user's social_credits_given joined with the target's profile.
+
+    Each entry comes back with target = {username, profile_picture_url}, or
+    target = None if the target has no user document. Returns None if the acting
+    user doesn't exist.
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.get_rated_users_with_profiles(acting_user_id)
+
+@timed_storage("users")
+async def get_server_score_entries(server_id: str) -> List[Dict[str, Any]]:
+    """
+    Every social_credits_given entry associated with a server, as
+    {acting_user_id, target_user_id, current_score} rows.
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.get_server_score_entries(server_id)
+
+@timed_storage("users")
+async def remove_score_entry(acting_user_id: str, target_user_id: str) -> Optional[bool]:
+    """
+    Remove the acting user's entry for target_user_id.
+    Returns whether an entry was removed, or None if the acting user does not exist.
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.remove_score_entry(acting_user_id, target_user_id)
+
+@timed_storage("users")
+async def add_user_server(user_id: str, server_info: Dict[str, Any]) -> bool:
+    """Add a server to a user's servers list if it isn't already there. Returns True if it was added."""
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.add_user_server(user_id, server_info)
+
+@timed_storage("users")
+async def update_server_info(server_info: Dict[str, Any]) -> None:
+    """Overwrite the stored name/icon of a server in every user's servers list."""
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    await engine.update_server_info(server_info)
+
+@timed_storage("users")
+async def search_server_members(server_id: str, query: str = "", limit: int = 25) -> Optional[List[Dict[str, Any]]]:
+    """
+    Users listing server_id whose username contains query (case-insensitive), in
+    user_id order, as {user_id, username, profile_picture_url}.
+    Returns None if no user lists the server.
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.search_server_members(server_id, query, limit)
+
+# Rating ledger operations
+@timed_storage("ratings")
+async def insert_rating_event(event: Dict[str, Any]) -> bool:
+    """
+    Append one immutable rating event to the ledger.
+
+    An event with an idempotency_key that is already in the ledger is not
+    inserted and its rollups are not counted. Returns True if the event was inserted.
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.insert_rating_event(event)
+
+@timed_storage("ratings")
+async def delete_rating_events(events: List[Dict[str, Any]]) -> int:
+    """
+    Take inserted events back out of the ledger and their rollups, matched by idempotency_key.
+
+    For ratings whose score could not be applied: while the event stays, a retry
+    of the rating is taken for a replay. Returns how many events were removed.
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    if not events:
+        return 0
+    return await engine.delete_rating_events(events)
+
+@timed_storage("ratings")
+async def find_rating_idempotency_keys(keys: List[str]) -> List[str]:
+    """The subset of keys already recorded in the ledger."""
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    if not keys:
+        return []
+    return await engine.find_rating_idempotency_keys(keys)
+
+@timed_storage("ratings")
+async def get_rating_history(
+    acting_user_id: str,
+    target_user_id: str,
+    from_ts: Optional[datetime] = None,
+    to_ts: Optional[datetime] = None,
+    limit: int = 500
+) -> List[Dict[str, Any]]:
+    """Get rating events from acting_user_id to target_user_id in [from_ts, to_ts), oldest first."""
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.get_rating_history(acting_user_id, target_user_id, from_ts, to_ts, limit)
+
+@timed_storage("ratings")
+async def get_server_rating_history(
+    server_id: str,
+    from_ts: Optional[datetime] = None,
+    to_ts: Optional[datetime] = None,
+    limit: int = 500
+) -> List[Dict[str, Any]]:
+    """Get rating events made in server_id in [from_ts, to_ts), oldest first."""
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.get_server_rating_history(server_id, from_ts, to_ts, limit)
+
+@timed_storage("ratings")
+async def insert_rating_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Append many rating events to the ledger in one write.
+
+    Events whose idempotency_key is already in the ledger are skipped (and left
+    out of the rollups); they are returned so the caller can leave their deltas out too.
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    if not events:
+        return []
+    return await engine.insert_rating_events(events)
+
+# Rollups: every event is also summed into minute, hour and day buckets per
+# (acting user, target) and per (server, target); see storage/base.py.
+def pick_rollup_resolution(from_ts: datetime, to_ts: datetime, points: int, now: Optional[datetime] = None) -> str:
+    """
+    The coarsest resolution that still gives at least `points` buckets over
+    [from_ts, to_ts) and is still retained at from_ts. Falls back to the finest
+    retained resolution when none gives enough buckets.
+    """
+    now = now or datetime.now(timezone.utc)
+    span = (to_ts - from_ts).total_seconds()
+    retained = [
+        resolution for resolution in ROLLUP_RESOLUTIONS
+        if rollup_retention(resolution) is None or from_ts >= now - rollup_retention(resolution)
+    ]
+    for resolution in retained:
+        if span / ROLLUP_RESOLUTIONS[resolution] >= points:
+            return resolution
+    return retained[-1]
+
+@timed_storage("rating_rollups")
+async def get_rollup_series(
+    scope: str,
+    subject: str,
+    target_user_id: str,
+    resolution: str,
+    from_ts: datetime,
+    to_ts: datetime
+) -> List[Dict[str, Any]]:
+    """Rollup buckets ({bucket, delta, count}) for one scope key in [from_ts, to_ts), oldest first."""
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return await engine.get_rollup_series(scope, subject, target_user_id, resolution, from_ts, to_ts)
+
 # Server operations
+@timed_storage("servers")
 async def get_server(server_id: str) -> Optional[Dict[str, Any]]:
     """Get a server by its ID."""
-    if db is None:
+    if engine is None:
         raise RuntimeError("Database not initialized")
-    return await db[settings.MONGODB_SERVER_COLLECTION].find_one({"server_id": server_id})
+    return await engine.get_server(server_id)
 
+@timed_storage("servers")
 async def upsert_server(server_data: Dict[str, Any]) -> None:
     """Create or update a server."""
-    if db is None:
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    await engine.upsert_server(server_data)
+
+def find_servers_after(after: Optional[str] = None, limit: int = 0, batch_size: int = 100):
+    """
+    Cursor over servers ordered by server_id, starting after the given ID (keyset pagination).
+
+    limit=0 means no limit. Iterate with `async for` to handle one document at a
+    time, or read it all with to_list().
+    """
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return engine.find_servers_after(after, limit, batch_size)
+
+@timed_storage("servers")
+async def get_server_member_ids_page(server_id: str, after: Optional[str], limit: int) -> Optional[List[str]]:
+    """
+    Next `limit` member IDs of a server in user_id order, starting after the given ID.
+
+    Only one page of IDs is read. Returns None if the server does not exist.
+    """
+    if engine is None:
         raise RuntimeError("Database not initialized")
-    await db[settings.MONGODB_SERVER_COLLECTION].update_one(
-        {"server_id": server_data["server_id"]},
-        {"$set": server_data},
-        upsert=True
-    )
+    return await engine.get_server_member_ids_page(server_id, after, limit)
+
+def find_members_by_ids(user_ids: List[str]):
+    """Cursor over the given users in user_id order, with MEMBER_LIST_PROJECTION applied."""
+    if engine is None:
+        raise RuntimeError("Database not initialized")
+    return engine.find_members_by_ids(user_ids)
 
 # Initialize database connection
-async def init_db():
-    """Initialize the database connection and create indexes."""
-    await connect_to_mongodb()
-    if db is not None:
-        # Create indexes
-        await db[settings.MONGODB_USER_COLLECTION].create_index("user_id", unique=True)
-        await db[settings.MONGODB_SERVER_COLLECTION].create_index("server_id", unique=True)
-        print("Database indexes created.") 
\ No newline at end of file
+# True once the engine answered a ping and its indexes were confirmed
+storage_prepared = False
+_prepare_task: Optional[asyncio.Task] = None
+
+async def init_db(background: bool = False):
+    """
+    Open the configured storage engine, check the connection and create missing indexes.
+
+    With background, only the open happens here (no round trip for Mongo); the
+    check and the indexes are done by a task that retries until it succeeds, and
+    storage_health() reports not ready until then.
+    """
+    global engine, _prepare_task
+    storage = create_engine()
+    await storage.open()
+    engine = storage
+    STORAGE_ENGINE_INFO.labels(storage.name).set(1)
+    if background:
+        _prepare_task = asyncio.create_task(_prepare_storage(storage))
+        logger.info("Storage engine opened: %s (connection check and indexes in the background)", storage.name)
+        return
+    await _prepare_storage(storage, retry=False)
+    logger.info("Storage engine ready: %s", storage.name)
+
+async def _prepare_storage(storage: StorageEngine, retry: bool = True) -> None:
+    global storage_prepared
+    delay = 1.0
+    while True:
+        try:
+            await storage.ping()
+            await storage.ensure_indexes()
+            break
+        except Exception as e:
+            if not retry:
+                logger.error("Failed to prepare storage engine %s: %s", storage.name, e)
+                raise
+            logger.warning("Storage engine %s not ready, retrying in %.0fs: %s", storage.name, delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+    storage_prepared = True
+    if retry:
+        logger.info("Storage engine ready: %s", storage.name)
+
+async def storage_health() -> Dict[str, Any]:
+    """Readiness of the storage engine: prepared (see init_db) and answering a ping right now."""
+    if engine is None:
+        return {"engine": None, "prepared": False, "reachable": False, "ready": False}
+    try:
+        await asyncio.wait_for(engine.ping(), settings.HEALTH_PROBE_TIMEOUT_SECONDS)
+        reachable = True
+    except Exception as e:
+        logger.warning("Storage health probe failed: %s", e)
+        reachable = False
+    return {"engine": engine.name, "prepared": storage_prepared, "reachable": reachable, "ready": storage_prepared and reachable}
+
+async def close_db():
+    """Close the storage engine."""
+    global engine, storage_prepared, _prepare_task
+    if _prepare_task is not None:
+        _prepare_task.cancel()
+        await asyncio.gather(_prepare_task, return_exceptions=True)
+        _prepare_task = None
+    storage_prepared = False
+    if engine is not None:
+        await engine.close()
+        engine = None
@@ -0,0 +1,302 @@
+import asyncio
+import time
+from typing import Optional, Dict, Any, List
+
+from .config import settings
+from .lazy import lazy_import
+from .log import get_logger
+from .metrics import DISCORD_RATE_LIMITED, DISCORD_REQUEST_DURATION, DISCORD_RESPONSES
+
+logger = get_logger(__name__)
+
+# Loaded with the first client; annotations naming it are strings for that reason
+httpx = lazy_import("httpx")
+
+# Shared Discord HTTP client, one per process.
+# Keeps TCP/TLS connections alive between calls instead of handshaking per request.
+client: Optional["httpx.AsyncClient"] = None
+# Set by open_discord_client(on_demand=True): the client is created by the first get_discord_client()
+_open_on_demand = False
+
+def metrics_route(path: str) -> str:
+    """Low-cardinality label for a request path: API prefix dropped, every ID replaced, e.g. '/channels/{id}/messages/{id}'."""
+    segments = [segment for segment in path.split("?", 1)[0].split("/") if segment]
+    if segments and segments[0] == "api":
+        segments = segments[2:] if len(segments) > 1 and segments[1][:1] == "v" and segments[1][1:].isdigit() else segments[1:]
+    return "/" + "/".join("{id}" if segment.isdigit() else segment for segment in segments)
+
+async def _start_request_timer(request: "httpx.Request") -> None:
+    request.extensions["metrics_started"] = time.perf_counter()
+
+async def _record_response(response: "httpx.Response") -> None:
+    # Runs once headers are in, before the body is read
+    request = response.request
+    started = request.extensions.get("metrics_started")
+    route = metrics_route(request.url.path)
+    if started is not None:
+        DISCORD_REQUEST_DURATION.labels(request.method, route).observe(time.perf_counter() - started)
+    DISCORD_RESPONSES.labels(request.method, route, str(response.status_code)).inc()
+    if response.status_code == 429:
+        DISCORD_RATE_LIMITED.labels(request.method, route).inc()
+
+async def open_discord_client(on_demand: bool = False):
+    """
+    Create the shared Discord HTTP client from the configured pool and timeout settings.
+
+    With on_demand, creating it (importing httpx and h2, loading the CA bundle) is
+    left to the first call that needs it, which keeps it out of startup.
+    """
+    global _open_on_demand
+    if on_demand:
+        _open_on_demand = True
+    else:
+        _create_client()
+
+def _create_client() -> None:
+    global client
+    if client is not None:
+        return
+    client = httpx.AsyncClient(
+        base_url=settings.DISCORD_API_BASE_URL,
+        http2=settings.DISCORD_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.DISCORD_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.DISCORD_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.DISCORD_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            settings.DISCORD_HTTP_READ_TIMEOUT,
+            connect=settings.DISCORD_HTTP_CONNECT_TIMEOUT,
+        ),
+        # Every call through the shared client (bot and OAuth) is timed for /metrics
+        event_hooks={"request": [_start_request_timer], "response": [_record_response]},
+    )
+    logger.info("Discord HTTP client opened (http2=%s).", settings.DISCORD_HTTP2)
+
+async def close_discord_client():
+    """Close the shared Discord HTTP client and its connection pool."""
+    global client, _open_on_demand
+    _open_on_demand = False
+    if client is not None:
+        await client.aclose()
+        client = None
+        logger.info("Closed Discord HTTP client.")
+
+def get_discord_client() -> "httpx.AsyncClient":
+    """Get the shared Discord HTTP client. Paths are relative to DISCORD_API_BASE_URL."""
+    if client is None:
+        if not _open_on_demand:
+            raise RuntimeError("Discord client not initialized")
+        _create_client()
+    return client
+
+def bot_auth_headers() -> Dict[str, str]:
+    """Authorization header for bot-token calls."""
+    return {"Authorization": f"Bot {settings.DISCORD_BOT_TOKEN}"}
+
+# --- Rate Limit Scheduling ---
+# Lower number = served first when requests are queued behind a rate limit
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Path segments whose ID is a "major parameter": Discord keeps separate buckets per value
+_MAJOR_PARAM_SEGMENTS = ("channels", "guilds", "webhooks")
+
+def route_key(method: str, path: str) -> str:
+    """Normalize a request to its rate-limit route, e.g. 'GET /channels/123/messages/{id}'."""
+    segments = path.split("?", 1)[0].strip("/").split("/")
+    normalized = []
+    for index, segment in enumerate(segments):
+        if segment.isdigit() and not (index > 0 and segments[index - 1] in _MAJOR_PARAM_SEGMENTS):
+            normalized.append("{id}")
+        else:
+            normalized.append(segment)
+    return f"{method.upper()} /{'/'.join(normalized)}"
+
+class _Bucket:
+    __slots__ = ("limit", "remaining", "reset_at", "window")
+
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None # None until Discord tells us the limit
+        self.reset_at = 0.0
+        self.window = 0.0 # Longest Reset-After seen, used as the window length when refilling
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "bucket_key", "future")
+
+    def __init__(self, priority: int, seq: int, bucket_key: str, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.bucket_key = bucket_key
+        self.future = future
+
+class DiscordRateLimiter:
+    """
+    Schedules Discord requests so they stay inside the rate limits instead of hitting 429s.
+
+    Per-route buckets are learned from X-RateLimit-* response headers (routes
+    sharing an X-RateLimit-Bucket hash share one bucket). A proactive global
+    requests-per-second cap is applied to everything, and a global 429 blocks
+    all requests until its retry_after. Requests that can't go yet are queued
+    and granted by priority, then arrival order.
+    """
+
+    def __init__(self, global_per_second: int):
+        self.global_per_second = global_per_second
+        self._buckets: Dict[str, _Bucket] = {}
+        self._route_buckets: Dict[str, str] = {} # route -> bucket hash from X-RateLimit-Bucket
+        self._waiters: List[_Waiter] = []
+        self._seq = 0
+        self._window_start = 0.0
+        self._window_count = 0
+        self._global_blocked_until = 0.0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self.delayed = 0 # Requests that had to queue
+        self.rate_limited = 0 # 429s received despite scheduling
+
+    def bucket_key(self, route: str, path: str) -> str:
+        major = ""
+        segments = path.strip("/").split("/")
+        if len(segments) > 1 and segments[0] in _MAJOR_PARAM_SEGMENTS:
+            major = segments[1]
+        return f"{self._route_buckets.get(route, route)}:{major}"
+
+    async def acquire(self, bucket_key: str, priority: int = PRIORITY_INTERACTIVE) -> None:
+        """Wait until a request on bucket_key may be sent."""
+        self._seq += 1
+        waiter = _Waiter(priority, self._seq, bucket_key, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._dispatch()
+        if not waiter.future.done():
+            self.delayed += 1
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def update(self, route: str, bucket_key: str, response: "httpx.Response") -> Optional[float]:
+        """Record rate-limit headers from a response. Returns retry_after seconds on a 429."""
+        now = time.monotonic()
+        headers = response.headers
+
+        bucket_hash = headers.get("X-RateLimit-Bucket")
+        if bucket_hash and self._route_buckets.get(route) != bucket_hash:
+            self._route_buckets[route] = bucket_hash
+            # Carry what we know over to the hashed key so later requests find it
+            hashed_key = f"{bucket_hash}:{bucket_key.split(':', 1)[1]}"
+            self._buckets[hashed_key] = self._buckets.pop(bucket_key, _Bucket())
+            bucket_key = hashed_key
+
+        bucket = self._buckets.setdefault(bucket_key, _Bucket())
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if remaining is not None and reset_after is not None:
+            limit = headers.get("X-RateLimit-Limit")
+            if limit is not None:
+                bucket.limit = int(limit)
+            # Responses for requests already granted arrive out of order; within a window
+            # never let a late header raise the count we've been handing out
+            if bucket.remaining is not None and now < bucket.reset_at:
+                bucket.remaining = min(bucket.remaining, int(remaining))
+            else:
+                bucket.remaining = int(remaining)
+            bucket.window = max(bucket.window, float(reset_after))
+            bucket.reset_at = now + float(reset_after)
+
+        retry_after = None
+        if response.status_code == 429:
+            self.rate_limited += 1
+            retry_after = _retry_after(response)
+            is_global = headers.get("X-RateLimit-Global", "").lower() == "true" or headers.get("X-RateLimit-Scope") == "global"
+            if is_global:
+                self._global_blocked_until = max(self._global_blocked_until, now + retry_after)
+            else:
+                bucket.remaining = 0
+                bucket.reset_at = max(bucket.reset_at, now + retry_after)
+
+        self._dispatch()
+        return retry_after
+
+    def _dispatch(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start = now
+            self._window_count = 0
+
+        next_wake = None
+        if now < self._global_blocked_until:
+            next_wake = self._global_blocked_until
+        else:
+            self._waiters.sort(key=lambda w: (w.priority, w.seq))
+            still_waiting = []
+            for waiter in self._waiters:
+                if waiter.future.done():
+                    continue
+                if self._window_count >= self.global_per_second:
+                    still_waiting.append(waiter)
+                    next_wake = self._window_start + 1.0
+                    continue
+                bucket = self._buckets.get(waiter.bucket_key)
+                if bucket is not None and bucket.remaining is not None:
+                    if bucket.remaining <= 0 and now >= bucket.reset_at:
+                        # Window has reset; refill to the last known limit (the next response corrects it)
+                        bucket.remaining = bucket.limit
+                        bucket.reset_at = now + bucket.window
+                    if bucket.remaining is not None and bucket.remaining <= 0:
+                        still_waiting.append(waiter)
+                        next_wake = bucket.reset_at if next_wake is None else min(next_wake, bucket.reset_at)
+                        continue
+                    if bucket.remaining is not None:
+                        bucket.remaining -= 1
+                self._window_count += 1
+                waiter.future.set_result(None)
+            self._waiters = still_waiting
+
+        if self._waiters and next_wake is not None:
+            self._wakeup = asyncio.get_running_loop().call_later(max(0.0, next_wake - now), self._dispatch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._waiters),
+            "buckets": len(self._buckets),
+            "delayed": self.delayed,
+            "rate_limited": self.rate_limited,
+        }
+
+def _retry_after(response: "httpx.Response") -> float:
+    try:
+        return float(response.json().get("retry_after", 1.0))
+    except Exception:
+        return float(response.headers.get("Retry-After", 1.0))
+
+rate_limiter = DiscordRateLimiter(settings.DISCORD_GLOBAL_RATE_LIMIT_PER_SECOND)
+
+async def discord_request(
+    method: str,
+    path: str,
+    priority: int = PRIORITY_INTERACTIVE,
+    **kwargs
+) -> "httpx.Response":
+    """
+    Send a request through the shared client, scheduled by the rate limiter.
+
+    429s are retried after Discord's retry_after up to DISCORD_RATE_LIMIT_MAX_RETRIES
+    times; the last response is returned either way.
+    """
+    route = route_key(method, path)
+    for attempt in range(settings.DISCORD_RATE_LIMIT_MAX_RETRIES + 1):
+        bucket_key = rate_limiter.bucket_key(route, path)
+        await rate_limiter.acquire(bucket_key, priority)
+        response = await get_discord_client().request(method, path, **kwargs)
+        retry_after = rate_limiter.update(route, bucket_key, response)
+        if retry_after is None:
+            return response
+        logger.warning("Discord rate limited %s (attempt %d); retrying after %ss.", route, attempt + 1, retry_after)
+    return response
@@ -0,0 +1,146 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+class JobPool:
+    """
+    In-process background workers for work that shouldn't hold up a request.
+
+    Jobs are deduplicated by key: submitting a key that is already queued is a
+    no-op, and submitting one that is running queues it once more after the
+    current run so it sees whatever changed in between. A job that raises is
+    retried with exponential backoff up to max_attempts. The queue is bounded;
+    when it is full new jobs are dropped (and counted) rather than blocking the
+    caller. Jobs only live in memory, so anything queued at shutdown is lost.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int, max_attempts: int, retry_base_seconds: float):
+        self.name = name
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self._queue: "asyncio.Queue[Tuple[Hashable, Job, int]]" = asyncio.Queue(maxsize=max_queue)
+        self._queued: Set[Hashable] = set() # In the queue or waiting out a retry backoff
+        self._running: Dict[Hashable, Job] = {}
+        self._rerun: Dict[Hashable, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._retry_handles: Set[asyncio.TimerHandle] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.submitted = 0
+        self.deduped = 0
+        self.dropped = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel the workers and pending retries; queued jobs are discarded."""
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._queued or self._running:
+            logger.info("Job pool %s stopped with %d jobs unfinished.", self.name, len(self._queued) + len(self._running))
+
+    def submit(self, key: Hashable, fn: Job) -> bool:
+        """Queue fn under key. Returns False if it was deduplicated or dropped."""
+        if key in self._queued:
+            self.deduped += 1
+            return False
+        if key in self._running:
+            self._rerun[key] = fn
+            self.deduped += 1
+            return False
+        if not self._enqueue(key, fn, 1):
+            return False
+        self.submitted += 1
+        return True
+
+    async def join(self) -> None:
+        """Wait until no job is queued, running or waiting to retry."""
+        await self._idle.wait()
+
+    def _enqueue(self, key: Hashable, fn: Job, attempt: int) -> bool:
+        try:
+            self._queue.put_nowait((key, fn, attempt))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Job pool %s is full; dropping job %s.", self.name, key)
+            self._queued.discard(key)
+            self._update_idle()
+            return False
+        self._queued.add(key)
+        self._idle.clear()
+        return True
+
+    def _update_idle(self) -> None:
+        if not self._queued and not self._running:
+            self._idle.set()
+
+    def _schedule_retry(self, key: Hashable, fn: Job, attempt: int) -> None:
+        delay = self.retry_base_seconds * (2 ** (attempt - 2))
+        handle: Optional[asyncio.TimerHandle] = None
+
+        def requeue() -> None:
+            self._retry_handles.discard(handle)
+            self._queued.discard(key)
+            self._enqueue(key, fn, attempt)
+
+        self._queued.add(key)
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retry_handles.add(handle)
+
+    async def _worker(self) -> None:
+        while True:
+            key, fn, attempt = await self._queue.get()
+            self._queued.discard(key)
+            self._running[key] = fn
+            try:
+                await fn()
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt < self.max_attempts and key not in self._rerun:
+                    self.retried += 1
+                    logger.debug("Job %s in pool %s failed (attempt %d): %s; retrying.", key, self.name, attempt, e)
+                    self._schedule_retry(key, fn, attempt + 1)
+                elif key not in self._rerun:
+                    self.failed += 1
+                    logger.warning("Job %s in pool %s failed after %d attempts: %s", key, self.name, attempt, e)
+            finally:
+                self._running.pop(key, None)
+                rerun = self._rerun.pop(key, None)
+                if rerun is not None:
+                    self._enqueue(key, rerun, 1)
+                self._queue.task_done()
+                self._update_idle()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize(),
+            "retrying": len(self._retry_handles),
+            "running": len(self._running),
+            "submitted": self.submitted,
+            "deduped": self.deduped,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
@@ -0,0 +1,30 @@
+import importlib.util
+import sys
+from types import ModuleType
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Module `name`, executed on first attribute access instead of now.
+
+    For heavy dependencies only some requests need (jose for tokens, httpx for
+    Discord calls), so importing the app stays cheap. The module is registered in
+    sys.modules right away, so a plain `import name` elsewhere gets the same
+    object. Annotations that name its attributes must be strings, or evaluating
+    them loads the module.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        # What the import system does for a submodule, so `import a.b; a.b.x` works
+        setattr(sys.modules[parent], child, module)
+    return module
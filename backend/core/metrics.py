@@ -0,0 +1,308 @@
+import bisect
+import functools
+import math
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Prometheus text exposition format, version 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers in-process storage calls (sub-millisecond) up to slow Discord requests
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class _Metric:
+    """
+    A metric family: one child per distinct set of label values.
+
+    labels() creates or finds a child; callers on hot paths resolve their child
+    once and keep it, so recording an observation is plain attribute arithmetic
+    with no lookups and no new objects. Children are only touched from the event
+    loop thread, which is what makes the unlocked increments safe.
+    """
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        registry.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def _samples(self) -> Iterable[str]:
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def _samples(self) -> Iterable[str]:
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # Per bucket, not cumulative; the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.sum += value
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def _samples(self) -> Iterable[str]:
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), list(child.counts)):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+# (name, type, documentation, [(label values dict, value), ...])
+CollectedFamily = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+class Registry:
+    """
+    Every metric plus collectors: callbacks that read counters other modules
+    already keep (cache hits, say) when /metrics is scraped, at no cost in between.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[CollectedFamily]]] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def register_collector(self, collector: Callable[[], Iterable[CollectedFamily]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception:
+                logger.exception("Metrics collector %r failed.", collector)
+                continue
+            for name, type_name, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {type_name}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def render_metrics() -> str:
+    """Everything registered, in Prometheus text format."""
+    return registry.render()
+
+# --- HTTP routes ---
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time spent in route handlers.", ["method", "route"]
+)
+HTTP_RESPONSES = Counter(
+    "http_responses_total", "Responses by route and status code.", ["method", "route", "status"]
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently inside a route handler.", ["method", "route"]
+)
+
+def instrument_route_handler(method: str, route: str, handler: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """
+    Wrap a route's request handler to time it and count its responses.
+
+    The children are resolved here, once per route, so a request only does
+    arithmetic on them. Streaming responses are timed until the response object
+    is returned, not until the stream ends.
+    """
+    duration = HTTP_REQUEST_DURATION.labels(method, route)
+    in_flight = HTTP_IN_FLIGHT.labels(method, route)
+    responses: Dict[int, _CounterChild] = {}
+
+    def count(status: int) -> None:
+        child = responses.get(status)
+        if child is None:
+            child = responses[status] = HTTP_RESPONSES.labels(method, route, str(status))
+        child.inc()
+
+    @functools.wraps(handler)
+    async def instrumented(request):
+        in_flight.inc()
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status_code
+            return response
+        except HTTPException as e:
+            status = e.status_code
+            raise
+        finally:
+            duration.observe(time.perf_counter() - started)
+            in_flight.dec()
+            count(status)
+    return instrumented
+
+class InstrumentedRoute(APIRoute):
+    """APIRoute whose handler is timed; set as app.router.route_class before routes are declared."""
+
+    def get_route_handler(self):
+        return instrument_route_handler(",".join(sorted(self.methods)), self.path_format, super().get_route_handler())
+
+# --- Storage ---
+STORAGE_OPERATION_DURATION = Histogram(
+    "storage_operation_duration_seconds", "Time spent in storage engine calls.", ["collection", "operation"]
+)
+STORAGE_OPERATION_ERRORS = Counter(
+    "storage_operation_errors_total", "Storage engine calls that raised.", ["collection", "operation"]
+)
+STORAGE_ENGINE_INFO = Gauge("storage_engine_info", "The storage engine in use (always 1).", ["engine"])
+
+def timed_storage(collection: str, operation: Optional[str] = None):
+    """Decorator timing an async storage function under (collection, operation name)."""
+    def decorate(fn):
+        name = operation or fn.__name__
+        duration = STORAGE_OPERATION_DURATION.labels(collection, name)
+        errors = STORAGE_OPERATION_ERRORS.labels(collection, name)
+
+        @functools.wraps(fn)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                duration.observe(time.perf_counter() - started)
+        return timed
+    return decorate
+
+# --- Discord ---
+DISCORD_REQUEST_DURATION = Histogram(
+    "discord_request_duration_seconds", "Discord API calls, until response headers arrive.", ["method", "route"]
+)
+DISCORD_RESPONSES = Counter(
+    "discord_responses_total", "Discord API responses by route and status code.", ["method", "route", "status"]
+)
+DISCORD_RATE_LIMITED = Counter(
+    "discord_rate_limited_total", "Discord API responses that were 429s.", ["method", "route"]
+)
+
+# --- Caches ---
+# Cache stats() keys that only ever grow; everything else is reported as a gauge
+_CACHE_COUNTER_KEYS = ("hits", "stale_hits", "disk_hits", "misses", "refreshes", "refresh_failures", "evictions", "disk_evictions")
+
+def _collect_caches() -> Iterable[CollectedFamily]:
+    from .cache import get_cache_stats
+
+    families: Dict[str, CollectedFamily] = {}
+    for cache_name, stats in get_cache_stats().items():
+        for key, value in stats.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if key in _CACHE_COUNTER_KEYS:
+                name, type_name = f"cache_{key}_total", "counter"
+            else:
+                name, type_name = f"cache_{key}", "gauge"
+            family = families.setdefault(name, (name, type_name, f"Cache {key.replace('_', ' ')}.", []))
+            family[3].append(({"cache": cache_name}, value))
+    return families.values()
+
+registry.register_collector(_collect_caches)
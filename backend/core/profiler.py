@@ -0,0 +1,375 @@
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from starlette.routing import compile_path
+
+from .log import get_logger
+from .metrics import Counter, Histogram
+
+logger = get_logger(__name__)
+
+EVENT_LOOP_BLOCKS = Counter(
+    "event_loop_blocks_total", "Times the event loop was blocked past the profiler's threshold."
+)
+EVENT_LOOP_BLOCK_DURATION = Histogram(
+    "event_loop_block_duration_seconds", "How long each detected event loop block lasted."
+)
+
+# The task currently running on each loop. The C accelerated asyncio keeps this as a
+# plain dict, so the sampler thread can read it to tell which request a stack belongs to.
+_current_tasks: Optional[Dict[Any, Any]] = getattr(asyncio.tasks, "_current_tasks", None)
+
+# Frames from here down to the thread's root are event loop machinery, not the request
+_HANDLE_RUN_CODE = asyncio.events.Handle._run.__code__
+
+# (name, file, line) of a function
+Frame = Tuple[str, str, int]
+
+def _short_path(filename: str) -> str:
+    """filename relative to the longest sys.path entry containing it."""
+    best = ""
+    for entry in sys.path:
+        if entry and filename.startswith(entry + os.sep) and len(entry) > len(best):
+            best = entry
+    return filename[len(best) + 1:] if best else filename
+
+class SamplingProfiler:
+    """
+    Statistical profiler for a fraction of requests, switched on and off at runtime.
+
+    While enabled, ProfilerMiddleware picks requests (sample_rate, optionally only
+    one route) and registers their asyncio task. A daemon thread wakes every
+    interval and, if the task running on the event loop at that moment is a
+    picked one, records the loop thread's Python stack. Identical stacks are
+    summed, labelled with the request's route, and dumped as collapsed stacks
+    (flamegraph.pl, speedscope, ...) or speedscope JSON. Only the event loop thread
+    is sampled; time a request spends awaiting I/O shows up as no samples at all.
+
+    Separately, a heartbeat task and a watchdog thread detect the event loop being
+    blocked for longer than blocking_threshold: the watchdog grabs the loop's stack
+    mid-stall, so the event records what was blocking it, not just that it happened.
+
+    Disabled, the middleware costs one attribute check per request and no threads
+    or tasks are running. Aggregated stacks survive stop() so they can still be
+    downloaded; start() clears them unless told otherwise.
+    """
+
+    def __init__(self, interval: float, max_stacks: int, max_depth: int, blocking_threshold: float, max_blocking_events: int):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.blocking_threshold = blocking_threshold
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.route: Optional[str] = None
+        self.method: Optional[str] = None
+        self.started_at: Optional[datetime] = None
+        self.stopped_at: Optional[datetime] = None
+        self._route_regex = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._sampled: Dict[Any, Dict[str, Any]] = {} # Task -> ASGI scope of a picked request
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._beat = 0.0 # time.monotonic() of the heartbeat's last wake-up
+        self._stall_stack: Optional[List[Frame]] = None
+        self._lock = threading.Lock() # Sampler thread writes, dumps read
+        self._frames: Dict[Any, int] = {} # Code object -> index into _frame_list
+        self._frame_list: List[Frame] = []
+        self._stacks: Dict[Tuple[str, Tuple[int, ...]], int] = {} # (label, frame indexes root first) -> samples
+        self.blocking_events: Deque[Dict[str, Any]] = deque(maxlen=max_blocking_events)
+        self.requests_seen = 0
+        self.requests_sampled = 0
+        self.samples = 0
+        self.dropped_samples = 0 # New stacks once max_stacks distinct ones were kept
+        self.blocking_detected = 0
+
+    # --- Control ---
+
+    def start(
+        self,
+        sample_rate: float,
+        route: Optional[str] = None,
+        method: Optional[str] = None,
+        interval: Optional[float] = None,
+        blocking_threshold: Optional[float] = None,
+        reset: bool = True
+    ) -> None:
+        """
+        Start (or reconfigure) profiling. Must be called on the event loop.
+
+        route is a path template as declared on the app ("/servers/{server_id}/users");
+        with it only matching requests are considered. A blocking_threshold of 0 turns
+        blocking detection off.
+        """
+        self._stop_threads()
+        if reset:
+            self.reset()
+        self.sample_rate = sample_rate
+        self.route = route
+        self.method = method.upper() if method else None
+        self._route_regex = compile_path(route)[0] if route else None
+        if interval is not None:
+            self.interval = interval
+        if blocking_threshold is not None:
+            self.blocking_threshold = blocking_threshold
+
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._run_sampler, name="profiler-sampler", daemon=True)]
+        if self.blocking_threshold > 0:
+            self._beat = time.monotonic()
+            self._stall_stack = None
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+            self._threads.append(threading.Thread(target=self._run_watchdog, name="profiler-watchdog", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        self.started_at = datetime.now(timezone.utc)
+        self.stopped_at = None
+        self.enabled = True
+        logger.info(
+            "Profiler started.",
+            extra={"sample_rate": sample_rate, "route": route, "method": self.method, "interval": self.interval, "blocking_threshold": self.blocking_threshold}
+        )
+
+    async def stop(self) -> None:
+        """Stop sampling and blocking detection; collected stacks are kept."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._sampled.clear()
+        threads = self._stop_threads()
+        # Joining waits out at most one interval; keep that off the loop
+        await asyncio.to_thread(lambda: [thread.join() for thread in threads])
+        self.stopped_at = datetime.now(timezone.utc)
+        logger.info("Profiler stopped.", extra={"samples": self.samples, "requests_sampled": self.requests_sampled})
+
+    def _stop_threads(self) -> List[threading.Thread]:
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        threads, self._threads = self._threads, []
+        return threads
+
+    def reset(self) -> None:
+        """Forget collected stacks, blocking events and counters."""
+        with self._lock:
+            self._frames.clear()
+            self._frame_list.clear()
+            self._stacks.clear()
+        self.blocking_events.clear()
+        self.requests_seen = 0
+        self.requests_sampled = 0
+        self.samples = 0
+        self.dropped_samples = 0
+        self.blocking_detected = 0
+
+    # --- Request side (event loop) ---
+
+    def should_sample(self, scope: Dict[str, Any]) -> bool:
+        if self.method is not None and scope["method"] != self.method:
+            return False
+        if self._route_regex is not None and self._route_regex.match(scope["path"]) is None:
+            return False
+        self.requests_seen += 1
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def begin(self, scope: Dict[str, Any]) -> Any:
+        task = asyncio.current_task()
+        self._sampled[task] = scope
+        self.requests_sampled += 1
+        return task
+
+    def end(self, task: Any) -> None:
+        self._sampled.pop(task, None)
+
+    # --- Sampling (profiler thread) ---
+
+    def _run_sampler(self) -> None:
+        stop = self._stop
+        loop = self._loop
+        thread_id = self._loop_thread_id
+        while not stop.wait(self.interval):
+            if not self._sampled:
+                continue
+            if _current_tasks is not None:
+                task = _current_tasks.get(loop)
+                scope = self._sampled.get(task)
+                if scope is None:
+                    continue
+            else:
+                # No way to see the running task; attribute to whichever picked request is in flight
+                task, scope = None, next(iter(self._sampled.values()), None)
+                if scope is None:
+                    continue
+            frame = sys._current_frames().get(thread_id)
+            # The loop may have switched tasks while we were looking
+            if frame is None or (task is not None and _current_tasks.get(loop) is not task):
+                continue
+            self._record(_scope_label(scope), frame)
+
+    def _record(self, label: str, frame) -> None:
+        with self._lock:
+            stack = self._stack_indexes(frame)
+            key = (label, stack)
+            count = self._stacks.get(key)
+            if count is None and len(self._stacks) >= self.max_stacks:
+                self.dropped_samples += 1
+                return
+            self._stacks[key] = (count or 0) + 1
+            self.samples += 1
+
+    def _stack_indexes(self, frame) -> Tuple[int, ...]:
+        indexes: List[int] = []
+        while frame is not None and len(indexes) < self.max_depth:
+            code = frame.f_code
+            if code is _HANDLE_RUN_CODE:
+                break
+            index = self._frames.get(code)
+            if index is None:
+                index = self._frames[code] = len(self._frame_list)
+                self._frame_list.append((code.co_qualname, _short_path(code.co_filename), code.co_firstlineno))
+            indexes.append(index)
+            frame = frame.f_back
+        indexes.reverse()
+        return tuple(indexes)
+
+    # --- Blocking detection ---
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        interval = min(self.blocking_threshold / 4, 0.05)
+        while True:
+            expected = loop.time() + interval
+            self._beat = time.monotonic()
+            await asyncio.sleep(interval)
+            lag = loop.time() - expected
+            if lag >= self.blocking_threshold:
+                self._record_block(lag)
+            else:
+                self._stall_stack = None
+
+    def _run_watchdog(self) -> None:
+        stop = self._stop
+        interval = min(self.blocking_threshold / 4, 0.05)
+        while not stop.wait(interval):
+            if self._stall_stack is not None or time.monotonic() - self._beat < self.blocking_threshold + interval:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            with self._lock:
+                stack = self._stack_indexes(frame)
+                self._stall_stack = [self._frame_list[i] for i in stack]
+
+    def _record_block(self, lag: float) -> None:
+        stack, self._stall_stack = self._stall_stack, None
+        self.blocking_detected += 1
+        EVENT_LOOP_BLOCKS.labels().inc()
+        EVENT_LOOP_BLOCK_DURATION.labels().observe(lag)
+        event = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(lag * 1000, 1),
+            "stack": [_frame_name(frame) for frame in stack] if stack else None # Root first
+        }
+        self.blocking_events.append(event)
+        logger.warning(
+            "Event loop blocked for %.0f ms.", lag * 1000,
+            extra={"blocked_in": event["stack"][-1] if event["stack"] else None, "stack": event["stack"]}
+        )
+
+    # --- Output ---
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "stopped_at": self.stopped_at.isoformat() if self.stopped_at else None,
+            "sample_rate": self.sample_rate,
+            "route": self.route,
+            "method": self.method,
+            "interval_ms": self.interval * 1000,
+            "blocking_threshold_ms": self.blocking_threshold * 1000,
+            "requests_seen": self.requests_seen,
+            "requests_sampled": self.requests_sampled,
+            "in_flight_sampled": len(self._sampled),
+            "samples": self.samples,
+            "dropped_samples": self.dropped_samples,
+            "distinct_stacks": len(self._stacks),
+            "blocking_detected": self.blocking_detected,
+            "recent_blocking": list(self.blocking_events)
+        }
+
+    def _snapshot(self) -> Tuple[List[Frame], Dict[Tuple[str, Tuple[int, ...]], int]]:
+        with self._lock:
+            return list(self._frame_list), dict(self._stacks)
+
+    def collapsed(self) -> str:
+        """One "route;frame;frame... count" line per distinct stack, root first."""
+        frames, stacks = self._snapshot()
+        names = [_frame_name(frame) for frame in frames]
+        lines = []
+        for (label, stack), count in sorted(stacks.items(), key=lambda item: -item[1]):
+            lines.append(";".join([label] + [names[i] for i in stack]) + f" {count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def speedscope(self) -> Dict[str, Any]:
+        """speedscope file format: one sampled profile per route, weights in milliseconds."""
+        frames, stacks = self._snapshot()
+        interval_ms = self.interval * 1000
+        profiles: Dict[str, Dict[str, Any]] = {}
+        for (label, stack), count in stacks.items():
+            profile = profiles.get(label)
+            if profile is None:
+                profile = profiles[label] = {
+                    "type": "sampled", "name": label, "unit": "milliseconds",
+                    "startValue": 0, "endValue": 0, "samples": [], "weights": []
+                }
+            profile["samples"].append(list(stack))
+            profile["weights"].append(count * interval_ms)
+            profile["endValue"] += count * interval_ms
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"social-credit-backend {self.started_at.isoformat() if self.started_at else ''}".strip(),
+            "exporter": "backend.core.profiler",
+            "shared": {"frames": [{"name": name, "file": file, "line": line} for name, file, line in frames]},
+            "profiles": sorted(profiles.values(), key=lambda profile: -profile["endValue"])
+        }
+
+def _frame_name(frame: Frame) -> str:
+    name, file, line = frame
+    return f"{name} ({file}:{line})"
+
+def _scope_label(scope: Dict[str, Any]) -> str:
+    # Routing fills in scope["route"]; before that (or for 404s) fall back to the raw path
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path_format', None) or scope['path']}"
+
+class ProfilerMiddleware:
+    """ASGI middleware handing requests to the profiler; a pass-through while it is disabled."""
+
+    def __init__(self, app, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if not profiler.enabled or scope["type"] != "http" or not profiler.should_sample(scope):
+            await self.app(scope, receive, send)
+            return
+
+        task = profiler.begin(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.end(task)
@@ -0,0 +1,115 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+def user_topic(user_id: str) -> str:
+    return f"user:{user_id}"
+
+def server_topic(server_id: str) -> str:
+    return f"server:{server_id}"
+
+# Sent in place of events a subscriber lost to overflow: refetch instead of trusting the stream
+RESYNC_EVENT = {"type": "resync"}
+
+class Subscription:
+    """
+    One client's bounded queue of pending events.
+
+    Events with the same coalesce key replace the pending one (score deltas are
+    summed), so a slow client only ever sees the latest state per key. When the
+    queue is full the oldest event is dropped and the client gets a resync
+    event before anything else.
+    """
+
+    def __init__(self, topics: Iterable[str], max_pending: int):
+        self.topics: Set[str] = set(topics)
+        self.max_pending = max_pending
+        self._pending: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self._overflowed = False
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def put(self, key: Hashable, event: Dict[str, Any]) -> None:
+        pending = self._pending.get(key)
+        if pending is not None:
+            merged = dict(event)
+            if "score_delta" in pending and "score_delta" in event:
+                merged["score_delta"] = pending["score_delta"] + event["score_delta"]
+            self._pending[key] = merged
+            self.coalesced += 1
+        else:
+            if len(self._pending) >= self.max_pending:
+                self._pending.popitem(last=False)
+                self._overflowed = True
+                self.dropped += 1
+            self._pending[key] = event
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None if nothing arrived within timeout."""
+        if not self._pending and not self._overflowed:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if self._overflowed:
+            self._overflowed = False
+            return RESYNC_EVENT
+        self.delivered += 1
+        return self._pending.popitem(last=False)[1]
+
+class PushHub:
+    """
+    In-process fan-out of events to subscribers by topic ("user:<id>", "server:<id>").
+
+    publish() never blocks and never awaits: it only appends to the matching
+    subscribers' queues, so a slow client can't hold up a rating request.
+    Subscribers in other processes are not reached.
+    """
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        subscription = Subscription(topics, self.max_pending)
+        for topic in subscription.topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def publish(self, topics: Iterable[str], key: Hashable, event: Dict[str, Any]) -> None:
+        """Queue event for every subscriber of any of topics (once per subscriber)."""
+        self.published += 1
+        seen: Set[Subscription] = set()
+        for topic in topics:
+            for subscription in self._subscribers.get(topic, ()):
+                if subscription not in seen:
+                    seen.add(subscription)
+                    subscription.put(key, event)
+
+    def stats(self) -> Dict[str, Any]:
+        subscriptions = {s for subscribers in self._subscribers.values() for s in subscribers}
+        return {
+            "subscribers": len(subscriptions),
+            "topics": len(self._subscribers),
+            "published": self.published,
+            "pending": sum(len(s._pending) for s in subscriptions),
+            "coalesced": sum(s.coalesced for s in subscriptions),
+            "dropped": sum(s.dropped for s in subscriptions),
+        }
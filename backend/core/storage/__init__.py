@@ -0,0 +1,30 @@
+"""
+Storage engines behind backend.core.database.
+
+STORAGE_ENGINE picks one: "mongo" (MongoDB through Motor, the default), "sqlite"
+(one file at SQLITE_PATH) or "memory" (process memory, for development and load
+tests). They share the StorageEngine contract in base.py; engines are imported on
+demand so the others' drivers need not be installed.
+"""
+from typing import Optional
+
+from ..config import settings
+from .base import MEMBER_LIST_PROJECTION, ROLLUP_RESOLUTIONS, PagedCursor, StorageEngine, apply_projection
+
+ENGINES = ("mongo", "sqlite", "memory")
+
+def create_engine(name: Optional[str] = None) -> StorageEngine:
+    """A new, unopened engine by name (default: settings.STORAGE_ENGINE)."""
+    name = (name or settings.STORAGE_ENGINE).lower()
+    if name == "mongo":
+        from .mongo import MongoStorage
+        return MongoStorage()
+    if name == "sqlite":
+        from .sqlite import SQLiteStorage
+        return SQLiteStorage()
+    if name == "memory":
+        from .memory import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage engine {name!r}; expected one of {', '.join(ENGINES)}")
+
+__all__ = ["ENGINES", "MEMBER_LIST_PROJECTION", "ROLLUP_RESOLUTIONS", "PagedCursor", "StorageEngine", "apply_projection", "create_engine"]
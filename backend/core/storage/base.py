@@ -0,0 +1,267 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..config import settings
+
+Pair = Tuple[str, str] # (acting_user_id, target_user_id)
+
+class StorageEngine:
+    """
+    What the app needs from a database: users (with their servers and the scores
+    they have given), servers, plugin API key hashes, the rating ledger and its rollups.
+
+    Documents go in and come out as plain dicts shaped like the Mongo documents
+    (a user has "servers" and "social_credits_given" lists, a server has "user_ids"),
+    whatever the engine stores underneath. Reads take Mongo-style projections; see
+    apply_projection for the subset every engine understands.
+    """
+
+    name = "base"
+
+    async def open(self) -> None:
+        """Get ready to serve, without waiting on the database server; see ping and ensure_indexes."""
+        raise NotImplementedError
+
+    async def ping(self) -> None:
+        """One cheap round trip; raises if the database can't be reached."""
+
+    async def ensure_indexes(self) -> None:
+        """Create whatever indexes are missing; a no-op once they all exist."""
+
+    async def close(self) -> None:
+        raise NotImplementedError
+
+    # Users
+    async def get_user(self, user_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def get_users_by_ids(self, user_ids: List[str], projection: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def upsert_user(self, user_data: Dict[str, Any], defaults: Optional[Dict[str, Any]] = None) -> None:
+        """Set user_data's fields, creating the user (with defaults filled in) if missing."""
+        raise NotImplementedError
+
+    async def insert_user_if_missing(self, user_data: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    async def update_user_fields(self, user_id: str, fields: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def add_user_server(self, user_id: str, server_info: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    async def update_server_info(self, server_info: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def search_server_members(self, server_id: str, query: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Users listing server_id whose username contains query (case-insensitive), in
+        user_id order, as {user_id, username, profile_picture_url}. None if no user lists the server.
+        """
+        raise NotImplementedError
+
+    # Scores
+    async def apply_score_delta(self, acting_user_id: str, target_user_id: str, score_delta: float,
+                                server_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def apply_score_deltas(self, deltas: Dict[Pair, Dict[str, Any]]) -> List[Pair]:
+        """Apply summed deltas in order; returns the pairs (a suffix of the input) not applied."""
+        raise NotImplementedError
+
+    async def get_score_entries(self, acting_user_id: str, target_ids: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        raise NotImplementedError
+
+    async def get_rated_users_with_profiles(self, acting_user_id: str) -> Optional[List[Dict[str, Any]]]:
+        raise NotImplementedError
+
+    async def get_server_score_entries(self, server_id: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def remove_score_entry(self, acting_user_id: str, target_user_id: str) -> Optional[bool]:
+        raise NotImplementedError
+
+    # Rating ledger and rollups
+    async def insert_rating_event(self, event: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    async def insert_rating_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def delete_rating_events(self, events: List[Dict[str, Any]]) -> int:
+        raise NotImplementedError
+
+    async def find_rating_idempotency_keys(self, keys: List[str]) -> List[str]:
+        raise NotImplementedError
+
+    async def get_rating_history(self, acting_user_id: str, target_user_id: str, from_ts: Optional[datetime],
+                                 to_ts: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def get_server_rating_history(self, server_id: str, from_ts: Optional[datetime],
+                                        to_ts: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def get_rollup_series(self, scope: str, subject: str, target_user_id: str, resolution: str,
+                                from_ts: datetime, to_ts: datetime) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    # Servers
+    async def get_server(self, server_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def upsert_server(self, server_data: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def find_servers_after(self, after: Optional[str], limit: int, batch_size: int):
+        """Async-iterable cursor (with to_list) over servers in server_id order after `after`."""
+        raise NotImplementedError
+
+    async def get_server_member_ids_page(self, server_id: str, after: Optional[str], limit: int) -> Optional[List[str]]:
+        raise NotImplementedError
+
+    def find_members_by_ids(self, user_ids: List[str]):
+        """Async-iterable cursor (with to_list) over the given users in user_id order, MEMBER_LIST_PROJECTION applied."""
+        raise NotImplementedError
+
+# Fields needed to list a server's members; the score arrays and key hash stay in the database
+MEMBER_LIST_PROJECTION = {"_id": 0, "social_credits_given": 0, "plugin_api_key": 0}
+
+class PagedCursor:
+    """
+    Cursor over documents fetched a page at a time, for engines without native cursors.
+
+    fetch_page(after_key, count) returns the next `count` documents after after_key
+    (None for the first page); key(doc) gives the value the next page starts after.
+    Supports `async for` and to_list(length), like a Motor cursor.
+    """
+
+    def __init__(self, fetch_page: Callable[[Optional[Any], int], Awaitable[List[Dict[str, Any]]]],
+                 key: Callable[[Dict[str, Any]], Any], limit: int = 0, batch_size: int = 100,
+                 after: Optional[Any] = None):
+        self._fetch_page = fetch_page
+        self._key = key
+        self._remaining = limit or None
+        self._batch_size = max(batch_size, 1)
+        self._after = after
+
+    async def _pages(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        while self._remaining is None or self._remaining > 0:
+            count = self._batch_size if self._remaining is None else min(self._batch_size, self._remaining)
+            page = await self._fetch_page(self._after, count)
+            if not page:
+                return
+            if self._remaining is not None:
+                self._remaining -= len(page)
+            self._after = self._key(page[-1])
+            yield page
+            if len(page) < count:
+                return
+
+    async def __aiter__(self) -> AsyncIterator[Dict[str, Any]]:
+        async for page in self._pages():
+            for doc in page:
+                yield doc
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        docs: List[Dict[str, Any]] = []
+        async for page in self._pages():
+            docs.extend(page)
+            if length is not None and len(docs) >= length:
+                return docs[:length]
+        return docs
+
+def apply_projection(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply a Mongo-style projection to a document the engine built itself.
+
+    Supports what the app uses: top-level inclusion or exclusion, "field.sub": 1
+    on arrays of subdocuments (e.g. "servers.id"), and {"$elemMatch": {...}} with
+    equality conditions. "_id" is ignored; non-Mongo documents don't have one.
+    The result shares nested values with doc, so doc must be a fresh copy.
+    """
+    if not projection:
+        return doc
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if not fields:
+        return doc # {"_id": 0} alone: everything else
+    inclusive = any(isinstance(value, dict) or value not in (0, False) for value in fields.values())
+    if not inclusive:
+        return {key: value for key, value in doc.items() if key not in fields}
+
+    result: Dict[str, Any] = {}
+    for path, spec in fields.items():
+        if isinstance(spec, dict) and "$elemMatch" in spec:
+            conditions = spec["$elemMatch"]
+            matches = [item for item in doc.get(path) or [] if all(item.get(k) == v for k, v in conditions.items())]
+            if matches:
+                result[path] = matches[:1]
+            continue
+        field, _, sub_field = path.partition(".")
+        if field not in doc:
+            continue
+        if not sub_field:
+            result[field] = doc[field]
+        elif isinstance(doc[field], list):
+            existing = result.setdefault(field, [{} for _ in doc[field]])
+            for item, projected in zip(doc[field], existing):
+                if isinstance(item, dict) and sub_field in item:
+                    projected[sub_field] = item[sub_field]
+        elif isinstance(doc[field], dict) and sub_field in doc[field]:
+            result.setdefault(field, {})[sub_field] = doc[field][sub_field]
+    return result
+
+# Rollups: per-bucket sums of score_delta, so graphs read one small document per bucket
+# instead of every rating event. scope "pair" is keyed by (acting user, target),
+# scope "server" by (server, target).
+ROLLUP_RESOLUTIONS: Dict[str, int] = {"day": 86400, "hour": 3600, "minute": 60} # Coarsest first
+
+RollupKey = Tuple[str, str, str, str, datetime] # (scope, subject, target_user_id, res, bucket)
+
+def rollup_retention(resolution: str) -> Optional[timedelta]:
+    days = {
+        "minute": settings.ROLLUP_MINUTE_RETENTION_DAYS,
+        "hour": settings.ROLLUP_HOUR_RETENTION_DAYS,
+    }.get(resolution)
+    return timedelta(days=days) if days else None
+
+def bucket_start(ts: datetime, seconds: int) -> datetime:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc) # Mongo hands back naive UTC datetimes
+    return datetime.fromtimestamp(int(ts.timestamp()) // seconds * seconds, timezone.utc)
+
+def rollup_increments(events: List[Dict[str, Any]], now: datetime,
+                      sign: int = 1) -> List[Tuple[RollupKey, float, int, Optional[datetime]]]:
+    """
+    (key, delta, count, expires_at) per rollup bucket the events land in.
+
+    Events in the same bucket are summed first. Buckets that would already be past
+    their retention (backdated events) are left out; day buckets never expire.
+    sign=-1 gives the increments that take the events back out again.
+    """
+    sums: Dict[RollupKey, List[float]] = {}
+    for event in events:
+        keys = [("pair", event["acting_user_id"])]
+        if event.get("server_id"):
+            keys.append(("server", event["server_id"]))
+        for resolution, seconds in ROLLUP_RESOLUTIONS.items():
+            bucket = bucket_start(event["ts"], seconds)
+            for scope, subject in keys:
+                totals = sums.setdefault((scope, subject, event["target_user_id"], resolution, bucket), [0.0, 0])
+                totals[0] += sign * event["score_delta"]
+                totals[1] += sign
+    increments = []
+    for key, (delta, count) in sums.items():
+        expires_at = None
+        retention = rollup_retention(key[3])
+        if retention is not None:
+            if key[4] + retention <= now:
+                continue
+            expires_at = key[4] + retention
+        increments.append((key, delta, int(count), expires_at))
+    return increments
+
+def as_utc(ts: datetime) -> datetime:
+    """Aware UTC datetime; naive values are taken to be UTC already."""
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
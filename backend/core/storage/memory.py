@@ -0,0 +1,350 @@
+import bisect
+import itertools
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..log import get_logger
+from .base import (
+    MEMBER_LIST_PROJECTION, ROLLUP_RESOLUTIONS, Pair, PagedCursor, StorageEngine,
+    apply_projection, as_utc, bucket_start, rollup_increments
+)
+
+logger = get_logger(__name__)
+
+def _clone(value: Any) -> Any:
+    """Copy nested dicts and lists; everything else stored here (str, float, datetime) is immutable."""
+    if isinstance(value, dict):
+        return {key: _clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clone(item) for item in value]
+    return value
+
+class MemoryStorage(StorageEngine):
+    """
+    Everything in process memory, for development and load tests. Nothing survives a restart.
+
+    Documents are kept in Mongo's shape and every query the app makes has a dict
+    index behind it, so no operation scans a whole collection. No operation awaits
+    while it runs, which makes each one atomic on the event loop, and callers only
+    ever see copies.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._users: Dict[str, Dict[str, Any]] = {}
+        # acting user -> target -> the entry object inside the user's social_credits_given
+        self._entries: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # server -> (acting, target) -> entry, for entries associated with the server
+        self._server_entries: Dict[str, Dict[Pair, Dict[str, Any]]] = {}
+        # server -> users listing it under "servers"
+        self._server_listers: Dict[str, Set[str]] = {}
+        self._servers: Dict[str, Dict[str, Any]] = {}
+        self._server_ids: List[str] = [] # Sorted
+        self._server_members: Dict[str, List[str]] = {} # server -> its sorted user_ids
+        # Ledger indexes hold (ts, seq, event), sorted; seq keeps equal timestamps in insertion order
+        self._ratings_by_pair: Dict[Pair, List[Tuple[datetime, int, Dict[str, Any]]]] = {}
+        self._ratings_by_server: Dict[str, List[Tuple[datetime, int, Dict[str, Any]]]] = {}
+        self._idempotency_keys: Set[str] = set()
+        self._rating_seq = itertools.count()
+        # (scope, subject, target, res) -> bucket -> [delta, count, expires_at]
+        self._rollups: Dict[Tuple[str, str, str, str], Dict[datetime, List[Any]]] = {}
+
+    async def open(self) -> None:
+        logger.info("Using in-memory storage; data is lost on shutdown.")
+
+    async def close(self) -> None:
+        pass
+
+    # Index upkeep
+    def _index_scores(self, user_id: str, doc: Dict[str, Any]) -> None:
+        self._unindex_scores(user_id)
+        entries = self._entries[user_id] = {}
+        for entry in doc.get("social_credits_given") or []:
+            entries[entry["target_user_id"]] = entry
+            for server_id in entry.get("associated_server_ids") or []:
+                self._server_entries.setdefault(server_id, {})[(user_id, entry["target_user_id"])] = entry
+
+    def _unindex_scores(self, user_id: str) -> None:
+        for target_user_id, entry in self._entries.pop(user_id, {}).items():
+            self._unindex_entry(user_id, target_user_id, entry)
+
+    def _unindex_entry(self, acting_user_id: str, target_user_id: str, entry: Dict[str, Any]) -> None:
+        for server_id in entry.get("associated_server_ids") or []:
+            pairs = self._server_entries.get(server_id)
+            if pairs is not None:
+                pairs.pop((acting_user_id, target_user_id), None)
+                if not pairs:
+                    del self._server_entries[server_id]
+
+    def _index_servers(self, user_id: str, old_servers: List[Dict[str, Any]], new_servers: List[Dict[str, Any]]) -> None:
+        for server in old_servers or []:
+            listers = self._server_listers.get(server["id"])
+            if listers is not None:
+                listers.discard(user_id)
+                if not listers:
+                    del self._server_listers[server["id"]]
+        for server in new_servers or []:
+            self._server_listers.setdefault(server["id"], set()).add(user_id)
+
+    def _set_user_fields(self, doc: Dict[str, Any], fields: Dict[str, Any]) -> None:
+        user_id = doc["user_id"]
+        if "servers" in fields:
+            self._index_servers(user_id, doc.get("servers"), fields["servers"])
+        doc.update(_clone(fields))
+        if "social_credits_given" in fields:
+            self._index_scores(user_id, doc)
+
+    def _insert_user(self, doc: Dict[str, Any]) -> None:
+        doc = _clone(doc)
+        self._users[doc["user_id"]] = doc
+        self._index_servers(doc["user_id"], [], doc.get("servers"))
+        self._index_scores(doc["user_id"], doc)
+
+    # Users
+    async def get_user(self, user_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        doc = self._users.get(user_id)
+        return _clone(apply_projection(doc, projection)) if doc is not None else None
+
+    async def get_users_by_ids(self, user_ids: List[str], projection: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        docs = []
+        for user_id in dict.fromkeys(user_ids):
+            doc = self._users.get(user_id)
+            if doc is not None:
+                docs.append(_clone(apply_projection(doc, projection)))
+        return docs
+
+    async def upsert_user(self, user_data: Dict[str, Any], defaults: Optional[Dict[str, Any]] = None) -> None:
+        doc = self._users.get(user_data["user_id"])
+        if doc is None:
+            self._insert_user({**(defaults or {}), **user_data})
+        else:
+            self._set_user_fields(doc, user_data)
+
+    async def insert_user_if_missing(self, user_data: Dict[str, Any]) -> bool:
+        if user_data["user_id"] in self._users:
+            return False
+        self._insert_user(user_data)
+        return True
+
+    async def update_user_fields(self, user_id: str, fields: Dict[str, Any]) -> None:
+        doc = self._users.get(user_id)
+        if doc is not None:
+            self._set_user_fields(doc, fields)
+
+    async def add_user_server(self, user_id: str, server_info: Dict[str, Any]) -> bool:
+        doc = self._users.get(user_id)
+        if doc is None or user_id in self._server_listers.get(server_info["id"], ()):
+            return False
+        doc.setdefault("servers", []).append(_clone(server_info))
+        self._server_listers.setdefault(server_info["id"], set()).add(user_id)
+        return True
+
+    async def update_server_info(self, server_info: Dict[str, Any]) -> None:
+        fields = {field: value for field, value in server_info.items() if field != "id"}
+        for user_id in self._server_listers.get(server_info["id"], ()):
+            for server in self._users[user_id].get("servers") or []:
+                if server.get("id") == server_info["id"]:
+                    server.update(fields)
+
+    async def search_server_members(self, server_id: str, query: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        listers = self._server_listers.get(server_id)
+        if not listers:
+            return None
+        query = query.lower()
+        members = []
+        for user_id in sorted(listers):
+            doc = self._users[user_id]
+            if query in (doc.get("username") or "").lower():
+                members.append({field: doc[field] for field in ("user_id", "username", "profile_picture_url") if field in doc})
+                if len(members) >= limit:
+                    break
+        return members
+
+    # Scores
+    def _apply(self, acting_user_id: str, target_user_id: str, score_delta: float, server_ids: List[str]) -> Optional[Dict[str, Any]]:
+        doc = self._users.get(acting_user_id)
+        if doc is None:
+            return None
+        entries = self._entries.setdefault(acting_user_id, {})
+        entry = entries.get(target_user_id)
+        if entry is None:
+            entry = {"target_user_id": target_user_id, "current_score": 0.0, "associated_server_ids": []}
+            doc.setdefault("social_credits_given", []).append(entry)
+            entries[target_user_id] = entry
+        # Entries made by older versions of the web path can lack either field
+        entry["current_score"] = entry.get("current_score", 0.0) + score_delta
+        associated = entry.setdefault("associated_server_ids", [])
+        for server_id in server_ids:
+            if server_id not in associated:
+                associated.append(server_id)
+                self._server_entries.setdefault(server_id, {})[(acting_user_id, target_user_id)] = entry
+        return entry
+
+    async def apply_score_delta(self, acting_user_id: str, target_user_id: str, score_delta: float,
+                                server_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        entry = self._apply(acting_user_id, target_user_id, score_delta, [server_id] if server_id else [])
+        return _clone(entry) if entry is not None else None
+
+    async def apply_score_deltas(self, deltas: Dict[Pair, Dict[str, Any]]) -> List[Pair]:
+        # Like the Mongo bulk write, deltas for acting users that don't exist match nothing and are dropped
+        for (acting_user_id, target_user_id), delta in deltas.items():
+            self._apply(acting_user_id, target_user_id, delta["score_delta"], delta.get("server_ids") or [])
+        return []
+
+    async def get_score_entries(self, acting_user_id: str, target_ids: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        if acting_user_id not in self._users:
+            return None
+        entries = self._entries.get(acting_user_id, {})
+        return {target_id: _clone(entries[target_id]) for target_id in target_ids if target_id in entries}
+
+    async def get_rated_users_with_profiles(self, acting_user_id: str) -> Optional[List[Dict[str, Any]]]:
+        doc = self._users.get(acting_user_id)
+        if doc is None:
+            return None
+        rows = []
+        for entry in doc.get("social_credits_given") or []:
+            target = self._users.get(entry["target_user_id"])
+            if target is not None:
+                target = {field: target[field] for field in ("username", "profile_picture_url") if field in target}
+            rows.append({**_clone(entry), "target": target})
+        return rows
+
+    async def get_server_score_entries(self, server_id: str) -> List[Dict[str, Any]]:
+        return [
+            {"acting_user_id": acting_user_id, "target_user_id": target_user_id, "current_score": entry["current_score"]}
+            for (acting_user_id, target_user_id), entry in self._server_entries.get(server_id, {}).items()
+        ]
+
+    async def remove_score_entry(self, acting_user_id: str, target_user_id: str) -> Optional[bool]:
+        doc = self._users.get(acting_user_id)
+        if doc is None:
+            return None
+        entry = self._entries.get(acting_user_id, {}).pop(target_user_id, None)
+        if entry is None:
+            return False
+        doc["social_credits_given"] = [item for item in doc["social_credits_given"] if item is not entry]
+        self._unindex_entry(acting_user_id, target_user_id, entry)
+        return True
+
+    # Rating ledger and rollups
+    def _insert_rating(self, event: Dict[str, Any]) -> bool:
+        key = event.get("idempotency_key")
+        if key:
+            if key in self._idempotency_keys:
+                return False
+            self._idempotency_keys.add(key)
+        event = dict(event)
+        row = (as_utc(event["ts"]), next(self._rating_seq), event)
+        bisect.insort(self._ratings_by_pair.setdefault((event["acting_user_id"], event["target_user_id"]), []), row)
+        if event.get("server_id"):
+            bisect.insort(self._ratings_by_server.setdefault(event["server_id"], []), row)
+        return True
+
+    def _record_rollups(self, events: List[Dict[str, Any]], sign: int = 1) -> None:
+        for (scope, subject, target_user_id, resolution, bucket), delta, count, expires_at in rollup_increments(events, datetime.now(timezone.utc), sign):
+            totals = self._rollups.setdefault((scope, subject, target_user_id, resolution), {}).get(bucket)
+            if totals is None:
+                if sign < 0:
+                    continue # Already dropped as expired
+                self._rollups[(scope, subject, target_user_id, resolution)][bucket] = [delta, count, expires_at]
+            else:
+                totals[0] += delta
+                totals[1] += count
+                if totals[1] <= 0:
+                    del self._rollups[(scope, subject, target_user_id, resolution)][bucket]
+
+    async def insert_rating_event(self, event: Dict[str, Any]) -> bool:
+        if not self._insert_rating(event):
+            return False
+        self._record_rollups([event])
+        return True
+
+    async def insert_rating_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        inserted: List[Dict[str, Any]] = []
+        duplicates: List[Dict[str, Any]] = []
+        for event in events:
+            (inserted if self._insert_rating(event) else duplicates).append(event)
+        self._record_rollups(inserted)
+        return duplicates
+
+    async def delete_rating_events(self, events: List[Dict[str, Any]]) -> int:
+        deleted = [event for event in events if event.get("idempotency_key") in self._idempotency_keys]
+        for event in deleted:
+            key = event["idempotency_key"]
+            self._idempotency_keys.discard(key)
+            indexes = [self._ratings_by_pair.get((event["acting_user_id"], event["target_user_id"]), [])]
+            if event.get("server_id"):
+                indexes.append(self._ratings_by_server.get(event["server_id"], []))
+            for rows in indexes:
+                rows[:] = [row for row in rows if row[2].get("idempotency_key") != key]
+        self._record_rollups(deleted, -1)
+        return len(deleted)
+
+    async def find_rating_idempotency_keys(self, keys: List[str]) -> List[str]:
+        return [key for key in keys if key in self._idempotency_keys]
+
+    @staticmethod
+    def _ts_slice(rows: List[Tuple[datetime, int, Dict[str, Any]]], from_ts: Optional[datetime],
+                  to_ts: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        start = bisect.bisect_left(rows, (as_utc(from_ts),)) if from_ts is not None else 0
+        end = bisect.bisect_left(rows, (as_utc(to_ts),)) if to_ts is not None else len(rows)
+        return [dict(row[2]) for row in rows[start:min(end, start + limit)]]
+
+    async def get_rating_history(self, acting_user_id: str, target_user_id: str, from_ts: Optional[datetime],
+                                 to_ts: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        return self._ts_slice(self._ratings_by_pair.get((acting_user_id, target_user_id), []), from_ts, to_ts, limit)
+
+    async def get_server_rating_history(self, server_id: str, from_ts: Optional[datetime],
+                                        to_ts: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        return self._ts_slice(self._ratings_by_server.get(server_id, []), from_ts, to_ts, limit)
+
+    async def get_rollup_series(self, scope: str, subject: str, target_user_id: str, resolution: str,
+                                from_ts: datetime, to_ts: datetime) -> List[Dict[str, Any]]:
+        buckets = self._rollups.get((scope, subject, target_user_id, resolution))
+        if not buckets:
+            return []
+        now = datetime.now(timezone.utc)
+        # Expired buckets are dropped as they are read, standing in for Mongo's TTL index
+        for bucket in [bucket for bucket, totals in buckets.items() if totals[2] is not None and totals[2] <= now]:
+            del buckets[bucket]
+        start, end = bucket_start(from_ts, ROLLUP_RESOLUTIONS[resolution]), as_utc(to_ts)
+        return [
+            {"bucket": bucket, "delta": totals[0], "count": totals[1]}
+            for bucket, totals in sorted(buckets.items()) if start <= bucket < end
+        ]
+
+    # Servers
+    async def get_server(self, server_id: str) -> Optional[Dict[str, Any]]:
+        doc = self._servers.get(server_id)
+        return _clone(doc) if doc is not None else None
+
+    async def upsert_server(self, server_data: Dict[str, Any]) -> None:
+        server_id = server_data["server_id"]
+        doc = self._servers.get(server_id)
+        if doc is None:
+            doc = self._servers[server_id] = {}
+            bisect.insort(self._server_ids, server_id)
+        doc.update(_clone(server_data))
+        self._server_members[server_id] = sorted(set(doc.get("user_ids") or []))
+
+    def find_servers_after(self, after: Optional[str], limit: int, batch_size: int):
+        async def fetch_page(after_id: Optional[str], count: int) -> List[Dict[str, Any]]:
+            start = bisect.bisect_right(self._server_ids, after_id) if after_id is not None else 0
+            return [_clone(self._servers[server_id]) for server_id in self._server_ids[start:start + count]]
+        return PagedCursor(fetch_page, lambda doc: doc["server_id"], limit=limit, batch_size=batch_size, after=after)
+
+    async def get_server_member_ids_page(self, server_id: str, after: Optional[str], limit: int) -> Optional[List[str]]:
+        members = self._server_members.get(server_id)
+        if members is None:
+            return None
+        start = bisect.bisect_right(members, after) if after is not None else 0
+        return members[start:start + limit]
+
+    def find_members_by_ids(self, user_ids: List[str]):
+        ordered = sorted(user_id for user_id in set(user_ids) if user_id in self._users)
+
+        async def fetch_page(after_id: Optional[str], count: int) -> List[Dict[str, Any]]:
+            start = bisect.bisect_right(ordered, after_id) if after_id is not None else 0
+            return [_clone(apply_projection(self._users[user_id], MEMBER_LIST_PROJECTION)) for user_id in ordered[start:start + count]]
+        return PagedCursor(fetch_page, lambda doc: doc["user_id"], batch_size=len(ordered) or 1)
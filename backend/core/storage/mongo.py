@@ -0,0 +1,466 @@
+import asyncio
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from ..config import settings
+from ..log import get_logger
+from .base import MEMBER_LIST_PROJECTION, ROLLUP_RESOLUTIONS, Pair, StorageEngine, bucket_start, rollup_increments
+
+logger = get_logger(__name__)
+
+# Index names are fixed so history queries can hint them explicitly
+RATING_PAIR_INDEX = "acting_target_ts"
+RATING_SERVER_INDEX = "server_ts"
+RATING_IDEMPOTENCY_INDEX = "idempotency_key"
+ROLLUP_KEY_INDEX = "scope_subject_target_res_bucket"
+DUPLICATE_KEY_ERROR = 11000
+
+def _ts_range(from_ts: Optional[datetime], to_ts: Optional[datetime]) -> Dict[str, Any]:
+    ts_filter: Dict[str, Any] = {}
+    if from_ts is not None:
+        ts_filter["$gte"] = from_ts
+    if to_ts is not None:
+        ts_filter["$lt"] = to_ts
+    return ts_filter
+
+def _score_delta_operations(acting_user_id: str, target_user_id: str, delta: Dict[str, Any]) -> List[UpdateOne]:
+    """
+    The ordered pair of updates that applies one summed delta: create the entry at 0
+    if it is missing, then $inc it (and add its server IDs).
+    """
+    update: Dict[str, Any] = {"$inc": {"social_credits_given.$.current_score": delta["score_delta"]}}
+    if delta.get("server_ids"):
+        update["$addToSet"] = {"social_credits_given.$.associated_server_ids": {"$each": list(delta["server_ids"])}}
+    return [
+        UpdateOne(
+            {"user_id": acting_user_id, "social_credits_given.target_user_id": {"$ne": target_user_id}},
+            {"$push": {"social_credits_given": {
+                "target_user_id": target_user_id,
+                "current_score": 0.0,
+                "associated_server_ids": []
+            }}}
+        ),
+        UpdateOne(
+            {"user_id": acting_user_id, "social_credits_given.target_user_id": target_user_id},
+            update
+        ),
+    ]
+
+class MongoStorage(StorageEngine):
+    """MongoDB through Motor. Users embed their servers and the scores they have given."""
+
+    name = "mongo"
+
+    def __init__(self, uri: Optional[str] = None, db_name: Optional[str] = None):
+        self.uri = uri or settings.MONGODB_URI
+        self.db_name = db_name or settings.MONGODB_DB_NAME
+        self.client: Optional[AsyncIOMotorClient] = None
+        self.db = None
+
+    @property
+    def users(self):
+        return self.db[settings.MONGODB_USER_COLLECTION]
+
+    @property
+    def servers(self):
+        return self.db[settings.MONGODB_SERVER_COLLECTION]
+
+    @property
+    def ratings(self):
+        return self.db[settings.MONGODB_RATING_COLLECTION]
+
+    @property
+    def rollups(self):
+        return self.db[settings.MONGODB_ROLLUP_COLLECTION]
+
+    async def open(self) -> None:
+        # Motor connects lazily; the first ping or query waits for the server
+        self.client = AsyncIOMotorClient(self.uri)
+        self.db = self.client[self.db_name]
+
+    async def ping(self) -> None:
+        await self.client.admin.command('ping')
+
+    def _index_models(self) -> Dict[str, List[IndexModel]]:
+        """Every index the app relies on, by collection name."""
+        return {
+            self.users.name: [
+                IndexModel("user_id", unique=True),
+                # Raters with entries in a given server, for loading its tier list
+                IndexModel("social_credits_given.associated_server_ids"),
+                # Users listing a server, for patching its name/icon once the guild lookup completes
+                IndexModel("servers.id"),
+            ],
+            self.servers.name: [IndexModel("server_id", unique=True)],
+            self.ratings.name: [
+                IndexModel(
+                    [("acting_user_id", ASCENDING), ("target_user_id", ASCENDING), ("ts", ASCENDING)],
+                    name=RATING_PAIR_INDEX
+                ),
+                IndexModel([("server_id", ASCENDING), ("ts", ASCENDING)], name=RATING_SERVER_INDEX),
+                # Plugin events carry an idempotency key; web events store None and are left out
+                IndexModel(
+                    "idempotency_key",
+                    name=RATING_IDEMPOTENCY_INDEX,
+                    unique=True,
+                    partialFilterExpression={"idempotency_key": {"$type": "string"}}
+                ),
+            ],
+            self.rollups.name: [
+                IndexModel(
+                    [("scope", ASCENDING), ("subject", ASCENDING), ("target_user_id", ASCENDING), ("res", ASCENDING), ("bucket", ASCENDING)],
+                    name=ROLLUP_KEY_INDEX,
+                    unique=True
+                ),
+                # Minute and hour rollups carry expires_at; day rollups don't and are kept
+                IndexModel("expires_at", expireAfterSeconds=0),
+            ],
+        }
+
+    async def ensure_indexes(self) -> None:
+        """
+        List each collection's indexes and create only the missing ones, all
+        collections concurrently: one round trip per collection once they exist,
+        instead of one create_index call per index on every boot.
+        """
+        async def ensure(collection_name: str, models: List[IndexModel]) -> List[str]:
+            collection = self.db[collection_name]
+            existing = set(await collection.index_information())
+            missing = [model for model in models if model.document["name"] not in existing]
+            if missing:
+                await collection.create_indexes(missing)
+            return [f"{collection_name}.{model.document['name']}" for model in missing]
+
+        created = await asyncio.gather(*(ensure(name, models) for name, models in self._index_models().items()))
+        created = [name for names in created for name in names]
+        if created:
+            logger.info("Created database indexes: %s", ", ".join(created))
+        else:
+            logger.info("Database indexes already in place.")
+
+    async def close(self) -> None:
+        if self.client:
+            self.client.close()
+            logger.info("Closed MongoDB connection.")
+
+    # Users
+    async def get_user(self, user_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        return await self.users.find_one({"user_id": user_id}, projection)
+
+    async def get_users_by_ids(self, user_ids: List[str], projection: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        if not user_ids:
+            return []
+        cursor = self.users.find({"user_id": {"$in": user_ids}}, projection)
+        return await cursor.to_list(length=len(user_ids))
+
+    async def upsert_user(self, user_data: Dict[str, Any], defaults: Optional[Dict[str, Any]] = None) -> None:
+        update: Dict[str, Any] = {"$set": user_data}
+        if defaults:
+            update["$setOnInsert"] = {key: value for key, value in defaults.items() if key not in user_data}
+        await self.users.update_one({"user_id": user_data["user_id"]}, update, upsert=True)
+
+    async def insert_user_if_missing(self, user_data: Dict[str, Any]) -> bool:
+        result = await self.users.update_one({"user_id": user_data["user_id"]}, {"$setOnInsert": user_data}, upsert=True)
+        return result.upserted_id is not None
+
+    async def update_user_fields(self, user_id: str, fields: Dict[str, Any]) -> None:
+        await self.users.update_one({"user_id": user_id}, {"$set": fields})
+
+    async def add_user_server(self, user_id: str, server_info: Dict[str, Any]) -> bool:
+        result = await self.users.update_one(
+            {"user_id": user_id, "servers.id": {"$ne": server_info["id"]}},
+            {"$push": {"servers": server_info}}
+        )
+        return result.modified_count > 0
+
+    async def update_server_info(self, server_info: Dict[str, Any]) -> None:
+        await self.users.update_many(
+            {"servers.id": server_info["id"]},
+            {"$set": {f"servers.$[server].{field}": value for field, value in server_info.items() if field != "id"}},
+            array_filters=[{"server.id": server_info["id"]}]
+        )
+
+    async def search_server_members(self, server_id: str, query: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        fields = {"_id": 0, "user_id": 1, "username": 1, "profile_picture_url": 1}
+        members: Dict[str, Any] = {"servers.id": server_id}
+        if query:
+            members["username"] = {"$regex": re.escape(query), "$options": "i"}
+        # The servers.id index narrows this to the server's members before the regex runs
+        cursor = self.users.find(members, fields).sort("user_id", ASCENDING).limit(limit)
+        docs = await cursor.to_list(length=limit)
+        if not docs and await self.users.find_one({"servers.id": server_id}, {"_id": 1}) is None:
+            return None
+        return docs
+
+    # Scores
+    async def apply_score_delta(self, acting_user_id: str, target_user_id: str, score_delta: float,
+                                server_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        # Only pull the one entry we touched back over the wire
+        projection = {"_id": 0, "social_credits_given": {"$elemMatch": {"target_user_id": target_user_id}}}
+        target = {"$literal": target_user_id}
+
+        # Entries made by older versions of the web path have no server list
+        server_ids: Any = {"$ifNull": ["$$this.associated_server_ids", []]}
+        if server_id:
+            server_ids = {"$cond": [
+                {"$in": [{"$literal": server_id}, server_ids]},
+                server_ids,
+                {"$concatArrays": [server_ids, {"$literal": [server_id]}]}
+            ]}
+        new_entry = {
+            "target_user_id": target_user_id,
+            "current_score": score_delta,
+            "associated_server_ids": [server_id] if server_id else []
+        }
+
+        # One pipeline update: increment the entry if it exists, append it otherwise.
+        # The document is rewritten atomically, so concurrent deltas for a new pair
+        # can't both append and none of them is lost.
+        updated = await self.users.find_one_and_update(
+            {"user_id": acting_user_id},
+            [{"$set": {"social_credits_given": {"$cond": [
+                {"$in": [target, {"$ifNull": ["$social_credits_given.target_user_id", []]}]},
+                {"$map": {"input": "$social_credits_given", "in": {"$cond": [
+                    {"$eq": ["$$this.target_user_id", target]},
+                    {
+                        "target_user_id": "$$this.target_user_id",
+                        "current_score": {"$add": [{"$ifNull": ["$$this.current_score", 0]}, score_delta]},
+                        "associated_server_ids": server_ids
+                    },
+                    "$$this"
+                ]}}},
+                {"$concatArrays": [{"$ifNull": ["$social_credits_given", []]}, {"$literal": [new_entry]}]}
+            ]}}}],
+            projection=projection,
+            return_document=ReturnDocument.AFTER
+        )
+        if updated is None:
+            return None
+        return updated["social_credits_given"][0]
+
+    async def apply_score_deltas(self, deltas: Dict[Pair, Dict[str, Any]]) -> List[Pair]:
+        if not deltas:
+            return []
+        pairs = list(deltas.keys())
+        operations = []
+        for acting_user_id, target_user_id in pairs:
+            operations.extend(_score_delta_operations(acting_user_id, target_user_id, deltas[(acting_user_id, target_user_id)]))
+        try:
+            # Ordered, so each push lands before the $inc that depends on it
+            await self.users.bulk_write(operations, ordered=True)
+        except BulkWriteError as e:
+            failed_index = e.details["writeErrors"][0]["index"]
+            logger.error("Score delta write failed at operation %d: %s", failed_index, e.details["writeErrors"][0].get("errmsg"))
+            # Two operations per pair; the pair holding the failed operation was not fully applied
+            return pairs[failed_index // 2:]
+        return []
+
+    async def get_score_entries(self, acting_user_id: str, target_ids: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        cursor = self.users.aggregate([
+            {"$match": {"user_id": acting_user_id}},
+            {"$project": {
+                "_id": 0,
+                "entries": {"$filter": {
+                    "input": "$social_credits_given",
+                    "cond": {"$in": ["$$this.target_user_id", target_ids]}
+                }}
+            }}
+        ])
+        docs = await cursor.to_list(length=1)
+        if not docs:
+            return None
+        return {entry["target_user_id"]: entry for entry in docs[0].get("entries") or []}
+
+    async def get_rated_users_with_profiles(self, acting_user_id: str) -> Optional[List[Dict[str, Any]]]:
+        cursor = self.users.aggregate([
+            {"$match": {"user_id": acting_user_id}},
+            # Keep a marker row so an acting user with no ratings is distinguishable from a missing one
+            {"$project": {"_id": 0, "entry": {"$ifNull": ["$social_credits_given", []]}}},
+            {"$unwind": {"path": "$entry", "preserveNullAndEmptyArrays": True}},
+            {"$lookup": {
+                "from": settings.MONGODB_USER_COLLECTION,
+                "localField": "entry.target_user_id",
+                "foreignField": "user_id",
+                # localField/foreignField with a pipeline needs MongoDB 5.0+
+                "pipeline": [{"$project": {"_id": 0, "username": 1, "profile_picture_url": 1}}],
+                "as": "target"
+            }},
+            {"$project": {"entry": 1, "target": {"$arrayElemAt": ["$target", 0]}}}
+        ])
+        rows = await cursor.to_list(length=None)
+        if not rows:
+            return None
+        return [
+            {**row["entry"], "target": row.get("target")}
+            for row in rows if row.get("entry")
+        ]
+
+    async def get_server_score_entries(self, server_id: str) -> List[Dict[str, Any]]:
+        # The multikey index on associated_server_ids finds the raters; only their entries are unwound
+        cursor = self.users.aggregate([
+            {"$match": {"social_credits_given.associated_server_ids": server_id}},
+            {"$project": {"_id": 0, "user_id": 1, "social_credits_given": 1}},
+            {"$unwind": "$social_credits_given"},
+            {"$match": {"social_credits_given.associated_server_ids": server_id}},
+            {"$project": {
+                "acting_user_id": "$user_id",
+                "target_user_id": "$social_credits_given.target_user_id",
+                "current_score": "$social_credits_given.current_score"
+            }}
+        ])
+        return await cursor.to_list(length=None)
+
+    async def remove_score_entry(self, acting_user_id: str, target_user_id: str) -> Optional[bool]:
+        result = await self.users.update_one(
+            {"user_id": acting_user_id},
+            {"$pull": {"social_credits_given": {"target_user_id": target_user_id}}}
+        )
+        if result.matched_count == 0:
+            return None
+        return result.modified_count > 0
+
+    # Rating ledger and rollups
+    async def insert_rating_event(self, event: Dict[str, Any]) -> bool:
+        # insert_one adds _id to the dict it is given; keep the caller's copy clean
+        if not event.get("idempotency_key"):
+            await asyncio.gather(self.ratings.insert_one(dict(event)), self._record_rollups([event]))
+            return True
+        # Keyed events: the insert decides whether this is a duplicate, so rollups wait for it
+        try:
+            await self.ratings.insert_one(dict(event))
+        except DuplicateKeyError:
+            return False
+        await self._record_rollups([event])
+        return True
+
+    async def insert_rating_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not events:
+            return []
+        duplicates: List[Dict[str, Any]] = []
+        try:
+            await self.ratings.insert_many([dict(event) for event in events], ordered=False)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            failed_indexes = {error["index"] for error in write_errors}
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in write_errors):
+                # Unordered: every event without a write error was stored and still needs its rollups
+                inserted = [event for index, event in enumerate(events) if index not in failed_indexes]
+                if len(inserted) != e.details.get("nInserted", len(inserted)):
+                    logger.error("Rating insert reported %s inserted but %d events without errors; rollups may be off.",
+                                 e.details.get("nInserted"), len(inserted))
+                await self._record_rollups(inserted)
+                raise
+            duplicates = [events[index] for index in sorted(failed_indexes)]
+            events = [event for index, event in enumerate(events) if index not in failed_indexes]
+        await self._record_rollups(events)
+        return duplicates
+
+    async def _record_rollups(self, events: List[Dict[str, Any]], sign: int = 1) -> None:
+        """One upsert per distinct bucket, all sent in a single unordered bulk write."""
+        operations = []
+        buckets = []
+        for (scope, subject, target_user_id, resolution, bucket), delta, count, expires_at in rollup_increments(events, datetime.now(timezone.utc), sign):
+            update: Dict[str, Any] = {"$inc": {"delta": delta, "count": count}}
+            if expires_at is not None:
+                # Picked up by the TTL index
+                update["$setOnInsert"] = {"expires_at": expires_at}
+            buckets.append({"scope": scope, "subject": subject, "target_user_id": target_user_id, "res": resolution, "bucket": bucket})
+            operations.append(UpdateOne(
+                buckets[-1],
+                update,
+                upsert=sign > 0 # Taking events back out never recreates an expired bucket
+            ))
+        if operations:
+            await self.rollups.bulk_write(operations, ordered=False)
+        if buckets and sign < 0:
+            # Buckets left with no events go, as if they had never been written
+            await self.rollups.delete_many({"$or": buckets, "count": {"$lte": 0}})
+
+    async def delete_rating_events(self, events: List[Dict[str, Any]]) -> int:
+        keyed = [event for event in events if event.get("idempotency_key")]
+        results = await asyncio.gather(*(self.ratings.delete_one({"idempotency_key": event["idempotency_key"]}) for event in keyed))
+        deleted = [event for event, result in zip(keyed, results) if result.deleted_count]
+        await self._record_rollups(deleted, -1)
+        return len(deleted)
+
+    async def find_rating_idempotency_keys(self, keys: List[str]) -> List[str]:
+        if not keys:
+            return []
+        cursor = self.ratings.find({"idempotency_key": {"$in": keys}}, {"_id": 0, "idempotency_key": 1})
+        return [doc["idempotency_key"] for doc in await cursor.to_list(length=len(keys))]
+
+    async def get_rating_history(self, acting_user_id: str, target_user_id: str, from_ts: Optional[datetime],
+                                 to_ts: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"acting_user_id": acting_user_id, "target_user_id": target_user_id}
+        ts_filter = _ts_range(from_ts, to_ts)
+        if ts_filter:
+            query["ts"] = ts_filter
+        cursor = self.ratings.find(query, {"_id": 0}).hint(RATING_PAIR_INDEX).sort("ts", ASCENDING).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def get_server_rating_history(self, server_id: str, from_ts: Optional[datetime],
+                                        to_ts: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"server_id": server_id}
+        ts_filter = _ts_range(from_ts, to_ts)
+        if ts_filter:
+            query["ts"] = ts_filter
+        cursor = self.ratings.find(query, {"_id": 0}).hint(RATING_SERVER_INDEX).sort("ts", ASCENDING).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def get_rollup_series(self, scope: str, subject: str, target_user_id: str, resolution: str,
+                                from_ts: datetime, to_ts: datetime) -> List[Dict[str, Any]]:
+        cursor = self.rollups.find(
+            {
+                "scope": scope,
+                "subject": subject,
+                "target_user_id": target_user_id,
+                "res": resolution,
+                # The bucket holding from_ts starts before it
+                "bucket": {"$gte": bucket_start(from_ts, ROLLUP_RESOLUTIONS[resolution]), "$lt": to_ts}
+            },
+            {"_id": 0, "bucket": 1, "delta": 1, "count": 1}
+        ).hint(ROLLUP_KEY_INDEX).sort("bucket", ASCENDING)
+        return await cursor.to_list(length=None)
+
+    # Servers
+    async def get_server(self, server_id: str) -> Optional[Dict[str, Any]]:
+        return await self.servers.find_one({"server_id": server_id}, {"_id": 0})
+
+    async def upsert_server(self, server_data: Dict[str, Any]) -> None:
+        await self.servers.update_one({"server_id": server_data["server_id"]}, {"$set": server_data}, upsert=True)
+
+    def find_servers_after(self, after: Optional[str], limit: int, batch_size: int):
+        # Walks the unique server_id index
+        query = {"server_id": {"$gt": after}} if after is not None else {}
+        return self.servers.find(query, {"_id": 0}).sort("server_id", ASCENDING).limit(limit).batch_size(batch_size)
+
+    async def get_server_member_ids_page(self, server_id: str, after: Optional[str], limit: int) -> Optional[List[str]]:
+        # The filter, sort and limit run in the database so only one page of IDs is transferred
+        pipeline = [
+            {"$match": {"server_id": server_id}},
+            {"$project": {
+                "_id": 0,
+                "user_ids": {"$filter": {"input": {"$ifNull": ["$user_ids", []]}, "cond": {"$gt": ["$$this", after or ""]}}}
+            }},
+            # Keeps one (field-less) document when nothing matches, so "no more members" != "no server"
+            {"$unwind": {"path": "$user_ids", "preserveNullAndEmptyArrays": True}},
+            {"$sort": {"user_ids": 1}},
+            {"$limit": limit},
+        ]
+        docs = await self.servers.aggregate(pipeline).to_list(length=limit)
+        if not docs:
+            return None
+        return [doc["user_ids"] for doc in docs if "user_ids" in doc]
+
+    def find_members_by_ids(self, user_ids: List[str]):
+        return (
+            self.users
+            .find({"user_id": {"$in": user_ids}}, MEMBER_LIST_PROJECTION)
+            .sort("user_id", ASCENDING)
+            .batch_size(len(user_ids) or 1)
+        )
@@ -0,0 +1,581 @@
+import asyncio
+import bisect
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from ..config import settings
+from ..log import get_logger
+from .base import (
+    MEMBER_LIST_PROJECTION, ROLLUP_RESOLUTIONS, Pair, PagedCursor, StorageEngine,
+    apply_projection, as_utc, bucket_start, rollup_increments
+)
+
+logger = get_logger(__name__)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ROLLUP_PURGE_INTERVAL_SECONDS = 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    doc TEXT NOT NULL -- Every field except servers and social_credits_given, as JSON
+);
+CREATE TABLE IF NOT EXISTS user_servers (
+    user_id TEXT NOT NULL,
+    server_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    info TEXT NOT NULL,
+    PRIMARY KEY (user_id, server_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS user_servers_server ON user_servers (server_id, user_id);
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY, -- Keeps entries in the order they were first rated
+    acting_user_id TEXT NOT NULL,
+    target_user_id TEXT NOT NULL,
+    current_score REAL NOT NULL,
+    associated_server_ids TEXT NOT NULL,
+    UNIQUE (acting_user_id, target_user_id)
+);
+CREATE TABLE IF NOT EXISTS score_servers (
+    server_id TEXT NOT NULL,
+    acting_user_id TEXT NOT NULL,
+    target_user_id TEXT NOT NULL,
+    PRIMARY KEY (server_id, acting_user_id, target_user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS score_servers_pair ON score_servers (acting_user_id, target_user_id);
+CREATE TABLE IF NOT EXISTS servers (
+    server_id TEXT PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS server_members (
+    server_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    PRIMARY KEY (server_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ratings (
+    id INTEGER PRIMARY KEY,
+    acting_user_id TEXT NOT NULL,
+    target_user_id TEXT NOT NULL,
+    server_id TEXT,
+    ts INTEGER NOT NULL, -- Microseconds since the epoch, UTC
+    idempotency_key TEXT UNIQUE, -- NULL for web ratings, which SQLite never treats as duplicates
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ratings_acting_target_ts ON ratings (acting_user_id, target_user_id, ts);
+CREATE INDEX IF NOT EXISTS ratings_server_ts ON ratings (server_id, ts) WHERE server_id IS NOT NULL;
+CREATE TABLE IF NOT EXISTS rating_rollups (
+    scope TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    target_user_id TEXT NOT NULL,
+    res TEXT NOT NULL,
+    bucket INTEGER NOT NULL, -- Seconds since the epoch
+    delta REAL NOT NULL,
+    count INTEGER NOT NULL,
+    expires_at INTEGER, -- NULL for day rollups, which are kept
+    PRIMARY KEY (scope, subject, target_user_id, res, bucket)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rating_rollups_expires_at ON rating_rollups (expires_at) WHERE expires_at IS NOT NULL;
+"""
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": as_utc(value).isoformat()}
+    raise TypeError(f"Cannot store {type(value).__name__} in SQLite storage")
+
+def _decode_hook(value: Dict[str, Any]) -> Any:
+    if len(value) == 1 and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, default=_encode_default, separators=(",", ":"))
+
+def _loads(text: str) -> Any:
+    return json.loads(text, object_hook=_decode_hook)
+
+def _micros(ts: datetime) -> int:
+    return (as_utc(ts) - _EPOCH) // timedelta(microseconds=1)
+
+def _seconds(ts: datetime) -> int:
+    return (as_utc(ts) - _EPOCH) // timedelta(seconds=1)
+
+def _wants(projection: Optional[Dict[str, Any]], field: str) -> bool:
+    """Whether a projection keeps any part of a top-level field."""
+    if not projection:
+        return True
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if not fields:
+        return True
+    if any(isinstance(value, dict) or value not in (0, False) for value in fields.values()):
+        return any(key == field or key.startswith(field + ".") for key in fields)
+    return field not in fields
+
+class SQLiteStorage(StorageEngine):
+    """
+    A single SQLite file in WAL mode, for deployments without a MongoDB server.
+
+    Users are split over users/user_servers/scores so a score update touches one
+    small row instead of rewriting the user; every query the app makes is
+    answered from an index. sqlite3 blocks, so all statements run on one worker
+    thread, which also serializes writes within the process. Write transactions
+    are BEGIN IMMEDIATE, so several processes can share the file.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.SQLITE_PATH
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._last_rollup_purge = 0.0
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _transaction(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) inside one write transaction on the worker thread."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(*args)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return result
+
+    async def _write(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await self._run(self._transaction, fn, *args)
+
+    def _open(self) -> None:
+        # Autocommit mode; writes open their own transactions in _transaction
+        self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # Durable across crashes of the app; fsyncs at checkpoints only
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._purge_rollups()
+
+    async def open(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        await self._run(self._open)
+        logger.info("Opened SQLite storage at %s.", self.path)
+
+    async def ping(self) -> None:
+        # Tables are created by open(); this only proves the worker thread and file still answer
+        await self._run(lambda: self._conn.execute("SELECT 1").fetchone())
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+            logger.info("Closed SQLite storage.")
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # User rows
+    def _user_docs(self, user_ids: List[str], projection: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Assemble user documents (in user_ids order), loading only the parts the projection keeps."""
+        if not user_ids:
+            return []
+        placeholders = ",".join("?" * len(user_ids))
+        rows = self._conn.execute(f"SELECT user_id, doc FROM users WHERE user_id IN ({placeholders})", user_ids).fetchall()
+        docs = {user_id: _loads(doc) for user_id, doc in rows}
+        if not docs:
+            return []
+        found = list(docs)
+        placeholders = ",".join("?" * len(found))
+        if _wants(projection, "servers"):
+            for doc in docs.values():
+                doc["servers"] = []
+            for user_id, info in self._conn.execute(
+                f"SELECT user_id, info FROM user_servers WHERE user_id IN ({placeholders}) ORDER BY user_id, position", found
+            ):
+                docs[user_id]["servers"].append(_loads(info))
+        if _wants(projection, "social_credits_given"):
+            for doc in docs.values():
+                doc["social_credits_given"] = []
+            for acting_user_id, target_user_id, current_score, server_ids in self._conn.execute(
+                f"SELECT acting_user_id, target_user_id, current_score, associated_server_ids FROM scores "
+                f"WHERE acting_user_id IN ({placeholders}) ORDER BY id", found
+            ):
+                docs[acting_user_id]["social_credits_given"].append({
+                    "target_user_id": target_user_id, "current_score": current_score, "associated_server_ids": json.loads(server_ids)
+                })
+        return [apply_projection(docs[user_id], projection) for user_id in dict.fromkeys(user_ids) if user_id in docs]
+
+    def _user_exists(self, user_id: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+    def _set_user_fields(self, user_id: str, fields: Dict[str, Any], existing: Optional[Dict[str, Any]]) -> None:
+        scalar = {key: value for key, value in fields.items() if key not in ("servers", "social_credits_given")}
+        if existing is None:
+            self._conn.execute("INSERT INTO users (user_id, doc) VALUES (?, ?)", (user_id, _dumps(scalar)))
+        elif scalar:
+            existing.update(scalar)
+            self._conn.execute("UPDATE users SET doc = ? WHERE user_id = ?", (_dumps(existing), user_id))
+        if "servers" in fields:
+            self._conn.execute("DELETE FROM user_servers WHERE user_id = ?", (user_id,))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO user_servers (user_id, server_id, position, info) VALUES (?, ?, ?, ?)",
+                [(user_id, server["id"], position, _dumps(server)) for position, server in enumerate(fields["servers"] or [])]
+            )
+        if "social_credits_given" in fields:
+            self._conn.execute("DELETE FROM scores WHERE acting_user_id = ?", (user_id,))
+            self._conn.execute("DELETE FROM score_servers WHERE acting_user_id = ?", (user_id,))
+            for entry in fields["social_credits_given"] or []:
+                server_ids = list(entry.get("associated_server_ids") or [])
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO scores (acting_user_id, target_user_id, current_score, associated_server_ids) VALUES (?, ?, ?, ?)",
+                    (user_id, entry["target_user_id"], entry.get("current_score", 0.0), json.dumps(server_ids))
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO score_servers (server_id, acting_user_id, target_user_id) VALUES (?, ?, ?)",
+                    [(server_id, user_id, entry["target_user_id"]) for server_id in server_ids]
+                )
+
+    def _existing_doc(self, user_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT doc FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return _loads(row[0]) if row else None
+
+    # Users
+    async def get_user(self, user_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        docs = await self._run(self._user_docs, [user_id], projection)
+        return docs[0] if docs else None
+
+    async def get_users_by_ids(self, user_ids: List[str], projection: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return await self._run(self._user_docs, list(user_ids), projection)
+
+    async def upsert_user(self, user_data: Dict[str, Any], defaults: Optional[Dict[str, Any]] = None) -> None:
+        def upsert() -> None:
+            existing = self._existing_doc(user_data["user_id"])
+            fields = user_data if existing is not None else {**(defaults or {}), **user_data}
+            self._set_user_fields(user_data["user_id"], fields, existing)
+        await self._write(upsert)
+
+    async def insert_user_if_missing(self, user_data: Dict[str, Any]) -> bool:
+        def insert() -> bool:
+            if self._user_exists(user_data["user_id"]):
+                return False
+            self._set_user_fields(user_data["user_id"], user_data, None)
+            return True
+        return await self._write(insert)
+
+    async def update_user_fields(self, user_id: str, fields: Dict[str, Any]) -> None:
+        def update() -> None:
+            existing = self._existing_doc(user_id)
+            if existing is not None:
+                self._set_user_fields(user_id, fields, existing)
+        await self._write(update)
+
+    async def add_user_server(self, user_id: str, server_info: Dict[str, Any]) -> bool:
+        def add() -> bool:
+            if not self._user_exists(user_id):
+                return False
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO user_servers (user_id, server_id, position, info) "
+                "SELECT ?, ?, COALESCE(MAX(position) + 1, 0), ? FROM user_servers WHERE user_id = ?",
+                (user_id, server_info["id"], _dumps(server_info), user_id)
+            )
+            return cursor.rowcount > 0
+        return await self._write(add)
+
+    async def update_server_info(self, server_info: Dict[str, Any]) -> None:
+        def update() -> None:
+            rows = self._conn.execute("SELECT user_id, info FROM user_servers WHERE server_id = ?", (server_info["id"],)).fetchall()
+            self._conn.executemany(
+                "UPDATE user_servers SET info = ? WHERE user_id = ? AND server_id = ?",
+                [(_dumps({**_loads(info), **server_info}), user_id, server_info["id"]) for user_id, info in rows]
+            )
+        await self._write(update)
+
+    async def search_server_members(self, server_id: str, query: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        def search() -> Optional[List[Dict[str, Any]]]:
+            rows = self._conn.execute(
+                "SELECT u.doc FROM user_servers s JOIN users u ON u.user_id = s.user_id WHERE s.server_id = ? ORDER BY s.user_id",
+                (server_id,)
+            )
+            found = False
+            members = []
+            needle = query.lower()
+            for (doc,) in rows:
+                found = True
+                doc = _loads(doc)
+                if needle in (doc.get("username") or "").lower():
+                    members.append({field: doc[field] for field in ("user_id", "username", "profile_picture_url") if field in doc})
+                    if len(members) >= limit:
+                        break
+            return members if found else None
+        return await self._run(search)
+
+    # Scores
+    def _apply(self, acting_user_id: str, target_user_id: str, score_delta: float, server_ids: List[str]) -> Optional[Dict[str, Any]]:
+        if not self._user_exists(acting_user_id):
+            return None
+        row = self._conn.execute(
+            "SELECT current_score, associated_server_ids FROM scores WHERE acting_user_id = ? AND target_user_id = ?",
+            (acting_user_id, target_user_id)
+        ).fetchone()
+        current_score, associated = (row[0], json.loads(row[1])) if row else (0.0, [])
+        added = [server_id for server_id in dict.fromkeys(server_ids) if server_id not in associated]
+        associated.extend(added)
+        current_score += score_delta
+        if row:
+            self._conn.execute(
+                "UPDATE scores SET current_score = ?, associated_server_ids = ? WHERE acting_user_id = ? AND target_user_id = ?",
+                (current_score, json.dumps(associated), acting_user_id, target_user_id)
+            )
+        else:
+            self._conn.execute(
+                "INSERT INTO scores (acting_user_id, target_user_id, current_score, associated_server_ids) VALUES (?, ?, ?, ?)",
+                (acting_user_id, target_user_id, current_score, json.dumps(associated))
+            )
+        if added:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO score_servers (server_id, acting_user_id, target_user_id) VALUES (?, ?, ?)",
+                [(server_id, acting_user_id, target_user_id) for server_id in added]
+            )
+        return {"target_user_id": target_user_id, "current_score": current_score, "associated_server_ids": associated}
+
+    async def apply_score_delta(self, acting_user_id: str, target_user_id: str, score_delta: float,
+                                server_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return await self._write(self._apply, acting_user_id, target_user_id, score_delta, [server_id] if server_id else [])
+
+    async def apply_score_deltas(self, deltas: Dict[Pair, Dict[str, Any]]) -> List[Pair]:
+        def apply_all() -> None:
+            # Deltas for acting users that don't exist are dropped, as in the Mongo bulk write
+            for (acting_user_id, target_user_id), delta in deltas.items():
+                self._apply(acting_user_id, target_user_id, delta["score_delta"], list(delta.get("server_ids") or []))
+        if deltas:
+            # One transaction, so it is all or nothing
+            await self._write(apply_all)
+        return []
+
+    async def get_score_entries(self, acting_user_id: str, target_ids: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        def read() -> Optional[Dict[str, Dict[str, Any]]]:
+            if not self._user_exists(acting_user_id):
+                return None
+            if not target_ids:
+                return {}
+            placeholders = ",".join("?" * len(target_ids))
+            rows = self._conn.execute(
+                f"SELECT target_user_id, current_score, associated_server_ids FROM scores "
+                f"WHERE acting_user_id = ? AND target_user_id IN ({placeholders})",
+                [acting_user_id, *target_ids]
+            )
+            return {
+                target_user_id: {"target_user_id": target_user_id, "current_score": current_score, "associated_server_ids": json.loads(server_ids)}
+                for target_user_id, current_score, server_ids in rows
+            }
+        return await self._run(read)
+
+    async def get_rated_users_with_profiles(self, acting_user_id: str) -> Optional[List[Dict[str, Any]]]:
+        def read() -> Optional[List[Dict[str, Any]]]:
+            if not self._user_exists(acting_user_id):
+                return None
+            rows = self._conn.execute(
+                "SELECT s.target_user_id, s.current_score, s.associated_server_ids, u.doc FROM scores s "
+                "LEFT JOIN users u ON u.user_id = s.target_user_id WHERE s.acting_user_id = ? ORDER BY s.id",
+                (acting_user_id,)
+            )
+            result = []
+            for target_user_id, current_score, server_ids, doc in rows:
+                target = None
+                if doc is not None:
+                    doc = _loads(doc)
+                    target = {field: doc[field] for field in ("username", "profile_picture_url") if field in doc}
+                result.append({
+                    "target_user_id": target_user_id, "current_score": current_score,
+                    "associated_server_ids": json.loads(server_ids), "target": target
+                })
+            return result
+        return await self._run(read)
+
+    async def get_server_score_entries(self, server_id: str) -> List[Dict[str, Any]]:
+        def read() -> List[Dict[str, Any]]:
+            rows = self._conn.execute(
+                "SELECT s.acting_user_id, s.target_user_id, s.current_score FROM score_servers ss "
+                "JOIN scores s ON s.acting_user_id = ss.acting_user_id AND s.target_user_id = ss.target_user_id "
+                "WHERE ss.server_id = ? ORDER BY s.id",
+                (server_id,)
+            )
+            return [
+                {"acting_user_id": acting_user_id, "target_user_id": target_user_id, "current_score": current_score}
+                for acting_user_id, target_user_id, current_score in rows
+            ]
+        return await self._run(read)
+
+    async def remove_score_entry(self, acting_user_id: str, target_user_id: str) -> Optional[bool]:
+        def remove() -> Optional[bool]:
+            if not self._user_exists(acting_user_id):
+                return None
+            cursor = self._conn.execute(
+                "DELETE FROM scores WHERE acting_user_id = ? AND target_user_id = ?", (acting_user_id, target_user_id)
+            )
+            self._conn.execute(
+                "DELETE FROM score_servers WHERE acting_user_id = ? AND target_user_id = ?", (acting_user_id, target_user_id)
+            )
+            return cursor.rowcount > 0
+        return await self._write(remove)
+
+    # Rating ledger and rollups
+    def _insert_ratings(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert events and count the new ones into their rollups; returns the duplicates."""
+        inserted: List[Dict[str, Any]] = []
+        duplicates: List[Dict[str, Any]] = []
+        for event in events:
+            cursor = self._conn.execute(
+                "INSERT INTO ratings (acting_user_id, target_user_id, server_id, ts, idempotency_key, doc) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (idempotency_key) DO NOTHING",
+                (event["acting_user_id"], event["target_user_id"], event.get("server_id"), _micros(event["ts"]),
+                 event.get("idempotency_key") or None, _dumps(event))
+            )
+            (inserted if cursor.rowcount > 0 else duplicates).append(event)
+        self._record_rollups(inserted)
+        if time.monotonic() - self._last_rollup_purge >= _ROLLUP_PURGE_INTERVAL_SECONDS:
+            self._purge_rollups()
+        return duplicates
+
+    def _record_rollups(self, events: List[Dict[str, Any]], sign: int = 1) -> None:
+        increments = rollup_increments(events, datetime.now(timezone.utc), sign)
+        self._conn.executemany(
+            "INSERT INTO rating_rollups (scope, subject, target_user_id, res, bucket, delta, count, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (scope, subject, target_user_id, res, bucket) "
+            "DO UPDATE SET delta = delta + excluded.delta, count = count + excluded.count",
+            [
+                (scope, subject, target_user_id, resolution, _seconds(bucket), delta, count,
+                 _seconds(expires_at) if expires_at is not None else None)
+                for (scope, subject, target_user_id, resolution, bucket), delta, count, expires_at in increments
+            ]
+        )
+        if sign < 0:
+            # Buckets left with no events go, as if they had never been written
+            self._conn.executemany(
+                "DELETE FROM rating_rollups WHERE scope = ? AND subject = ? AND target_user_id = ? AND res = ? AND bucket = ? AND count <= 0",
+                [(scope, subject, target_user_id, resolution, _seconds(bucket)) for (scope, subject, target_user_id, resolution, bucket), *_ in increments]
+            )
+
+    def _purge_rollups(self) -> None:
+        """Delete expired minute/hour rollups; what Mongo's TTL index does on its own."""
+        self._last_rollup_purge = time.monotonic()
+        self._conn.execute("DELETE FROM rating_rollups WHERE expires_at <= ?", (_seconds(datetime.now(timezone.utc)),))
+
+    async def insert_rating_event(self, event: Dict[str, Any]) -> bool:
+        return not await self._write(self._insert_ratings, [event])
+
+    async def insert_rating_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not events:
+            return []
+        return await self._write(self._insert_ratings, events)
+
+    async def delete_rating_events(self, events: List[Dict[str, Any]]) -> int:
+        def delete() -> int:
+            deleted = [
+                event for event in events
+                if event.get("idempotency_key") and self._conn.execute(
+                    "DELETE FROM ratings WHERE idempotency_key = ?", (event["idempotency_key"],)
+                ).rowcount > 0
+            ]
+            self._record_rollups(deleted, -1)
+            return len(deleted)
+        return await self._write(delete)
+
+    async def find_rating_idempotency_keys(self, keys: List[str]) -> List[str]:
+        def read() -> List[str]:
+            if not keys:
+                return []
+            placeholders = ",".join("?" * len(keys))
+            return [key for (key,) in self._conn.execute(
+                f"SELECT idempotency_key FROM ratings WHERE idempotency_key IN ({placeholders})", keys
+            )]
+        return await self._run(read)
+
+    def _history(self, where: str, params: List[Any], from_ts: Optional[datetime],
+                 to_ts: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        if from_ts is not None:
+            where += " AND ts >= ?"
+            params.append(_micros(from_ts))
+        if to_ts is not None:
+            where += " AND ts < ?"
+            params.append(_micros(to_ts))
+        rows = self._conn.execute(f"SELECT doc FROM ratings WHERE {where} ORDER BY ts, id LIMIT ?", [*params, limit])
+        return [_loads(doc) for (doc,) in rows]
+
+    async def get_rating_history(self, acting_user_id: str, target_user_id: str, from_ts: Optional[datetime],
+                                 to_ts: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        return await self._run(self._history, "acting_user_id = ? AND target_user_id = ?",
+                               [acting_user_id, target_user_id], from_ts, to_ts, limit)
+
+    async def get_server_rating_history(self, server_id: str, from_ts: Optional[datetime],
+                                        to_ts: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        return await self._run(self._history, "server_id = ?", [server_id], from_ts, to_ts, limit)
+
+    async def get_rollup_series(self, scope: str, subject: str, target_user_id: str, resolution: str,
+                                from_ts: datetime, to_ts: datetime) -> List[Dict[str, Any]]:
+        def read() -> List[Dict[str, Any]]:
+            rows = self._conn.execute(
+                "SELECT bucket, delta, count FROM rating_rollups "
+                "WHERE scope = ? AND subject = ? AND target_user_id = ? AND res = ? AND bucket >= ? AND bucket < ? "
+                "AND (expires_at IS NULL OR expires_at > ?) ORDER BY bucket",
+                (scope, subject, target_user_id, resolution,
+                 _seconds(bucket_start(from_ts, ROLLUP_RESOLUTIONS[resolution])), -(-_micros(to_ts) // 1_000_000), # Buckets start on whole seconds
+                 _seconds(datetime.now(timezone.utc)))
+            )
+            return [{"bucket": datetime.fromtimestamp(bucket, timezone.utc), "delta": delta, "count": count} for bucket, delta, count in rows]
+        return await self._run(read)
+
+    # Servers
+    async def get_server(self, server_id: str) -> Optional[Dict[str, Any]]:
+        def read() -> Optional[Dict[str, Any]]:
+            row = self._conn.execute("SELECT doc FROM servers WHERE server_id = ?", (server_id,)).fetchone()
+            return _loads(row[0]) if row else None
+        return await self._run(read)
+
+    async def upsert_server(self, server_data: Dict[str, Any]) -> None:
+        def upsert() -> None:
+            server_id = server_data["server_id"]
+            row = self._conn.execute("SELECT doc FROM servers WHERE server_id = ?", (server_id,)).fetchone()
+            doc = {**(_loads(row[0]) if row else {}), **server_data}
+            self._conn.execute("INSERT OR REPLACE INTO servers (server_id, doc) VALUES (?, ?)", (server_id, _dumps(doc)))
+            if "user_ids" in server_data:
+                self._conn.execute("DELETE FROM server_members WHERE server_id = ?", (server_id,))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO server_members (server_id, user_id) VALUES (?, ?)",
+                    [(server_id, user_id) for user_id in server_data["user_ids"] or []]
+                )
+        await self._write(upsert)
+
+    def find_servers_after(self, after: Optional[str], limit: int, batch_size: int):
+        def read(after_id: Optional[str], count: int) -> List[Dict[str, Any]]:
+            rows = self._conn.execute(
+                "SELECT doc FROM servers WHERE server_id > ? ORDER BY server_id LIMIT ?", (after_id or "", count)
+            ) if after_id is not None else self._conn.execute("SELECT doc FROM servers ORDER BY server_id LIMIT ?", (count,))
+            return [_loads(doc) for (doc,) in rows]
+
+        async def fetch_page(after_id: Optional[str], count: int) -> List[Dict[str, Any]]:
+            return await self._run(read, after_id, count)
+        return PagedCursor(fetch_page, lambda doc: doc["server_id"], limit=limit, batch_size=batch_size, after=after)
+
+    async def get_server_member_ids_page(self, server_id: str, after: Optional[str], limit: int) -> Optional[List[str]]:
+        def read() -> Optional[List[str]]:
+            if self._conn.execute("SELECT 1 FROM servers WHERE server_id = ?", (server_id,)).fetchone() is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT user_id FROM server_members WHERE server_id = ? AND user_id > ? ORDER BY user_id LIMIT ?",
+                (server_id, after or "", limit)
+            )
+            return [user_id for (user_id,) in rows]
+        return await self._run(read)
+
+    def find_members_by_ids(self, user_ids: List[str]):
+        ordered = sorted(set(user_ids))
+
+        async def fetch_page(after_id: Optional[str], count: int) -> List[Dict[str, Any]]:
+            # Pages walk the sorted ID list, so each one is a bounded IN query
+            start = bisect.bisect_right(ordered, after_id) if after_id is not None else 0
+            return await self._run(self._user_docs, ordered[start:start + count], MEMBER_LIST_PROJECTION)
+        return PagedCursor(fetch_page, lambda doc: doc["user_id"], batch_size=len(ordered) or 1)
@@ -0,0 +1,215 @@
+import asyncio
+from bisect import bisect_left, insort
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+TIER_NAMES = ("S", "A", "B", "C", "D")
+
+class ScoreBoard:
+    """
+    Scores for a set of users, kept sorted from highest to lowest.
+
+    Updates move one entry (binary search plus a list insert), so the order is
+    never recomputed from scratch; reading the top k is a slice.
+    """
+
+    def __init__(self):
+        self._scores: Dict[str, float] = {}
+        self._order: List[Tuple[float, str]] = [] # (-score, user_id), ascending = best first
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def get(self, user_id: str) -> Optional[float]:
+        return self._scores.get(user_id)
+
+    def set(self, user_id: str, score: float) -> None:
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._discard(user_id, old)
+        self._scores[user_id] = score
+        insort(self._order, (-score, user_id))
+
+    def add(self, user_id: str, delta: float) -> None:
+        self.set(user_id, self._scores.get(user_id, 0.0) + delta)
+
+    def remove(self, user_id: str) -> None:
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            self._discard(user_id, old)
+
+    def _discard(self, user_id: str, score: float) -> None:
+        index = bisect_left(self._order, (-score, user_id))
+        del self._order[index]
+
+    def top(self, k: int) -> List[Tuple[str, float]]:
+        """The k highest scores as (user_id, score), best first."""
+        return [(user_id, -neg_score) for neg_score, user_id in self._order[:k]]
+
+class TierAssigner:
+    """
+    Maps a rank (or score) to a tier name in O(1).
+
+    "quantile": cutoffs are cumulative fractions of the board, e.g. the top 10% is S.
+    "threshold": cutoffs are minimum scores, e.g. 50 or more is S.
+    One cutoff fewer than there are tiers; whatever is left falls in the last tier.
+    """
+
+    def __init__(self, mode: str, cutoffs: List[float], names: Iterable[str] = TIER_NAMES):
+        self.names = tuple(names)
+        if mode not in ("quantile", "threshold"):
+            raise ValueError(f"Unknown tier mode: {mode}")
+        if len(cutoffs) != len(self.names) - 1:
+            raise ValueError(f"Expected {len(self.names) - 1} tier cutoffs, got {len(cutoffs)}")
+        self.mode = mode
+        self.cutoffs = list(cutoffs)
+
+    def tier(self, rank: int, score: float, total: int) -> str:
+        if self.mode == "quantile":
+            position = rank / total if total else 0.0
+            for name, cutoff in zip(self.names, self.cutoffs):
+                if position < cutoff:
+                    return name
+        else:
+            for name, cutoff in zip(self.names, self.cutoffs):
+                if score >= cutoff:
+                    return name
+        return self.names[-1]
+
+# Loads (acting_user_id, target_user_id, current_score) rows for every entry associated with a server
+ServerLoader = Callable[[str], Awaitable[List[Dict[str, Any]]]]
+
+class TierListEngine:
+    """
+    Per-server tier lists, maintained incrementally as ratings come in.
+
+    Each server has one board per rater (that rater's current_score for every
+    target associated with the server) and an overall board (the sum over raters).
+    A server is loaded from the database the first time its tier list is asked
+    for; after that every rating updates it in place. Updates carry the entry's
+    new current_score rather than a delta, so replaying one is harmless.
+
+    Ratings written by other processes are not seen; run one backend process or
+    treat the tier list as per-process.
+    """
+
+    def __init__(self, loader: ServerLoader, assigner: TierAssigner):
+        self._loader = loader
+        self.assigner = assigner
+        self._overall: Dict[str, ScoreBoard] = {}
+        self._by_rater: Dict[Tuple[str, str], ScoreBoard] = {}
+        self._rater_servers: Dict[str, Set[str]] = {} # rater -> loaded servers they have a board in
+        self._rater_counts: Dict[str, Dict[str, int]] = {} # server -> target -> number of raters
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._pending: Dict[str, List[Tuple[str, str, Optional[float]]]] = {} # updates that arrived mid-load
+        self.loads = 0
+        self.updates = 0
+
+    def is_loaded(self, server_id: str) -> bool:
+        return server_id in self._overall
+
+    async def ensure_loaded(self, server_id: str) -> None:
+        if server_id in self._overall:
+            return
+        task = self._loading.get(server_id)
+        if task is None:
+            self._pending[server_id] = []
+            task = asyncio.create_task(self._load(server_id))
+            self._loading[server_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(server_id, None))
+        await asyncio.shield(task)
+
+    async def _load(self, server_id: str) -> None:
+        try:
+            rows = await self._loader(server_id)
+        except Exception:
+            self._pending.pop(server_id, None)
+            raise
+        self._overall[server_id] = ScoreBoard()
+        self._rater_counts[server_id] = {}
+        for row in rows:
+            self._set(server_id, row["acting_user_id"], row["target_user_id"], row.get("current_score", 0.0))
+        # Replay ratings that came in while the rows were being read; they are at least as new
+        for acting_user_id, target_user_id, score in self._pending.pop(server_id, []):
+            self._set(server_id, acting_user_id, target_user_id, score)
+        self.loads += 1
+        logger.debug("Loaded tier list for server %s (%d rows).", server_id, len(rows))
+
+    def record(self, acting_user_id: str, target_user_id: str, entry: Dict[str, Any]) -> None:
+        """Apply an updated social_credits_given entry to every server it is associated with."""
+        self.updates += 1
+        score = entry.get("current_score", 0.0)
+        for server_id in entry.get("associated_server_ids") or []:
+            self._apply(server_id, acting_user_id, target_user_id, score)
+
+    def remove(self, acting_user_id: str, target_user_id: str) -> None:
+        """Drop a rater's entry for a target from every loaded server."""
+        self.updates += 1
+        for server_id in list(self._rater_servers.get(acting_user_id, ())):
+            self._apply(server_id, acting_user_id, target_user_id, None)
+        for server_id in self._pending:
+            self._pending[server_id].append((acting_user_id, target_user_id, None))
+
+    def _apply(self, server_id: str, acting_user_id: str, target_user_id: str, score: Optional[float]) -> None:
+        if server_id in self._pending:
+            self._pending[server_id].append((acting_user_id, target_user_id, score))
+        elif server_id in self._overall:
+            self._set(server_id, acting_user_id, target_user_id, score)
+        # Servers nobody has asked for yet pick the rating up when they load
+
+    def _set(self, server_id: str, acting_user_id: str, target_user_id: str, score: Optional[float]) -> None:
+        board = self._by_rater.get((server_id, acting_user_id))
+        old = board.get(target_user_id) if board is not None else None
+        if score is None:
+            if old is None:
+                return
+            board.remove(target_user_id)
+            counts = self._rater_counts[server_id]
+            counts[target_user_id] -= 1
+            if counts[target_user_id] == 0:
+                # Last rater gone: the target leaves the overall board too
+                del counts[target_user_id]
+                self._overall[server_id].remove(target_user_id)
+            else:
+                self._overall[server_id].add(target_user_id, -old)
+            return
+        if board is None:
+            board = self._by_rater[(server_id, acting_user_id)] = ScoreBoard()
+            self._rater_servers.setdefault(acting_user_id, set()).add(server_id)
+        if old is None:
+            counts = self._rater_counts[server_id]
+            counts[target_user_id] = counts.get(target_user_id, 0) + 1
+        board.set(target_user_id, score)
+        self._overall[server_id].add(target_user_id, score - (old or 0.0))
+
+    async def top(self, server_id: str, k: int, acting_user_id: Optional[str] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        The top k of a server's tier list, overall or as rated by one user.
+
+        Returns (total entries on the board, [{user_id, score, rank, tier}]).
+        Once the server is loaded this is O(k).
+        """
+        await self.ensure_loaded(server_id)
+        if acting_user_id is None:
+            board = self._overall[server_id]
+        else:
+            board = self._by_rater.get((server_id, acting_user_id)) or ScoreBoard()
+        total = len(board)
+        return total, [
+            {"user_id": user_id, "score": score, "rank": rank + 1, "tier": self.assigner.tier(rank, score, total)}
+            for rank, (user_id, score) in enumerate(board.top(k))
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "servers": len(self._overall),
+            "rater_boards": len(self._by_rater),
+            "loading": len(self._loading),
+            "loads": self.loads,
+            "updates": self.updates,
+        }
@@ -0,0 +1,215 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+Pair = Tuple[str, str] # (acting_user_id, target_user_id)
+
+# Applies summed deltas; returns the pairs that were not applied
+ApplyDeltas = Callable[[Dict[Pair, Dict[str, Any]]], Awaitable[List[Pair]]]
+# Inserts events; returns the ones (the same dicts) the ledger rejected as duplicates
+InsertEvents = Callable[[List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]]
+
+T = TypeVar("T")
+
+class ScoreDeltaBuffer:
+    """
+    Write-behind buffer for score deltas and their ledger events.
+
+    add() only touches memory: deltas are summed per (acting, target) pair, with
+    the set of servers they came from, and events are appended to a list. A
+    background loop writes everything out with one bulk write per flush, every
+    flush_interval seconds or as soon as max_pending pairs + events are waiting.
+    pending() exposes what hasn't reached the database yet (including a flush in
+    progress) so reads can merge it in; read_with_pending() pairs it with a
+    storage read that no score write overlapped, so nothing is counted twice.
+
+    Events go in first: any the ledger rejects as duplicates (same idempotency
+    key as an event already stored) have their deltas taken back out of the
+    batch before it is applied. Pairs a flush fails to apply go back into the
+    buffer for the next flush. Events it fails to insert are retried too, but
+    their deltas still go out with this batch: some of them may have been
+    stored before the error, so on the retry a duplicate among them means
+    "already stored" and has nothing to take back. Anything still buffered
+    when the process dies without close() is lost.
+    """
+
+    def __init__(self, apply_deltas: ApplyDeltas, insert_events: InsertEvents, flush_interval: float, max_pending: int):
+        self.apply_deltas = apply_deltas
+        self.insert_events = insert_events
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # acting_user_id -> target_user_id -> {"score_delta": float, "server_ids": set}
+        self._deltas: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._events: List[Dict[str, Any]] = []
+        # Events to insert again whose deltas have already been applied
+        self._retry_events: List[Dict[str, Any]] = []
+        self._pair_count = 0
+        self._flushing: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Bumped as a flush's score write starts and again as it ends, so odd while one is in flight
+        self._write_epoch = 0
+        self._written = asyncio.Event()
+        self._written.set()
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.added = 0
+        self.flushes = 0
+        self.flushed_pairs = 0
+        self.flushed_events = 0
+        self.flush_errors = 0
+        self.duplicates = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the flush loop and write out whatever is still buffered."""
+        # Not cancelled: a flush cut off mid-write would lose the batch it holds
+        self._closing = True
+        self._wake.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._pair_count or self._events or self._retry_events:
+            logger.error("Score buffer closed with %d pairs and %d events unwritten.",
+                         self._pair_count, len(self._events) + len(self._retry_events))
+
+    def add(self, acting_user_id: str, target_user_id: str, score_delta: float,
+            server_id: Optional[str] = None, event: Optional[Dict[str, Any]] = None) -> None:
+        self._merge(acting_user_id, target_user_id, score_delta, [server_id] if server_id else [])
+        if event is not None:
+            self._events.append(event)
+        self.added += 1
+        if self._pair_count + len(self._events) + len(self._retry_events) >= self.max_pending:
+            self._wake.set()
+
+    def _merge(self, acting_user_id: str, target_user_id: str, score_delta: float, server_ids: List[str]) -> None:
+        targets = self._deltas.setdefault(acting_user_id, {})
+        delta = targets.get(target_user_id)
+        if delta is None:
+            delta = targets[target_user_id] = {"score_delta": 0.0, "server_ids": set()}
+            self._pair_count += 1
+        delta["score_delta"] += score_delta
+        delta["server_ids"].update(server_ids)
+
+    def pending(self, acting_user_id: str) -> Dict[str, Dict[str, Any]]:
+        """target_user_id -> not-yet-written {"score_delta", "server_ids"} for one acting user."""
+        merged: Dict[str, Dict[str, Any]] = {}
+        for source in (self._flushing, self._deltas):
+            for target_user_id, delta in source.get(acting_user_id, {}).items():
+                entry = merged.setdefault(target_user_id, {"score_delta": 0.0, "server_ids": set()})
+                entry["score_delta"] += delta["score_delta"]
+                entry["server_ids"] |= delta["server_ids"]
+        return merged
+
+    async def read_with_pending(self, acting_user_id: str,
+                                read: Callable[[], Awaitable[T]]) -> Tuple[T, Dict[str, Dict[str, Any]]]:
+        """
+        (await read(), pending(acting_user_id)), where read is a storage read of the
+        acting user's scores. Every buffered delta shows up in exactly one of the two:
+        a read that overlaps a flush's score write is done again once the write is over.
+        """
+        while True:
+            await self._written.wait()
+            epoch = self._write_epoch
+            pending = self.pending(acting_user_id)
+            result = await read()
+            if self._write_epoch == epoch:
+                return result, pending
+
+    async def discard(self, acting_user_id: str, target_user_id: str) -> None:
+        """Drop buffered deltas and events for a pair, waiting out any flush that already holds them."""
+        async with self._flush_lock:
+            targets = self._deltas.get(acting_user_id)
+            if targets and targets.pop(target_user_id, None) is not None:
+                self._pair_count -= 1
+                if not targets:
+                    del self._deltas[acting_user_id]
+            pair = (acting_user_id, target_user_id)
+            self._events = [event for event in self._events if (event["acting_user_id"], event["target_user_id"]) != pair]
+            self._retry_events = [event for event in self._retry_events if (event["acting_user_id"], event["target_user_id"]) != pair]
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._deltas and not self._events and not self._retry_events:
+                return
+            self._flushing, self._deltas = self._deltas, {}
+            retry_events, self._retry_events = self._retry_events, []
+            events, self._events = self._events, []
+            self._pair_count = 0
+            batch = {
+                (acting_user_id, target_user_id): delta
+                for acting_user_id, targets in self._flushing.items()
+                for target_user_id, delta in targets.items()
+            }
+            self.flushes += 1
+            try:
+                try:
+                    duplicates = await self.insert_events(retry_events + events)
+                    self.flushed_events += len(retry_events) + len(events) - len(duplicates)
+                except Exception as e:
+                    logger.error("Rating event flush failed: %s", e)
+                    self.flush_errors += 1
+                    self._retry_events[:0] = retry_events + events
+                    duplicates = []
+                # A retried event found in the ledger is one the failed flush stored; its delta is already out
+                retried = {id(event) for event in retry_events}
+                duplicates = [event for event in duplicates if id(event) not in retried]
+                for event in duplicates:
+                    delta = batch.get((event["acting_user_id"], event["target_user_id"]))
+                    if delta is not None:
+                        delta["score_delta"] -= event["score_delta"]
+                self.duplicates += len(duplicates)
+
+                self._write_epoch += 1
+                self._written.clear()
+                try:
+                    try:
+                        unapplied = await self.apply_deltas(batch)
+                    except Exception as e:
+                        # Nothing tells us how far it got; a dropped connection normally means nothing was applied
+                        logger.error("Score delta flush failed: %s", e)
+                        unapplied = list(batch.keys())
+                    if unapplied:
+                        self.flush_errors += 1
+                        for acting_user_id, target_user_id in unapplied:
+                            delta = batch[(acting_user_id, target_user_id)]
+                            self._merge(acting_user_id, target_user_id, delta["score_delta"], list(delta["server_ids"]))
+                    self.flushed_pairs += len(batch) - len(unapplied)
+                finally:
+                    # Written pairs leave pending() in the same step as the write is marked over
+                    self._flushing = {}
+                    self._write_epoch += 1
+                    self._written.set()
+            finally:
+                self._flushing = {}
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Score buffer flush loop error: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_pairs": self._pair_count,
+            "pending_events": len(self._events) + len(self._retry_events),
+            "added": self.added,
+            "flushes": self.flushes,
+            "flushed_pairs": self.flushed_pairs,
+            "flushed_events": self.flushed_events,
+            "flush_errors": self.flush_errors,
+            "duplicates": self.duplicates,
+        }
@@ -0,0 +1 @@
+"""Offline load testing: a fake Discord API, scripted traffic and a storage engine benchmark. See __main__.py."""
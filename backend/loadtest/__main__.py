@@ -0,0 +1,324 @@
+"""
+Load-test runner.
+
+    # Boot the backend (in-memory storage) and a fake Discord, seed 200 users, run the default mix for 60s
+    python -m backend.loadtest run --storage memory --out loadtest-results.json
+
+    # Same on SQLite (a temporary file per run) or a local mongod (a fresh database per run, dropped afterwards)
+    python -m backend.loadtest run --storage sqlite
+    python -m backend.loadtest run --storage mongo --mongodb-uri mongodb://localhost:27017
+
+    # Time the storage engines against each other without HTTP in the way
+    python -m backend.loadtest.storage_bench --engines memory,sqlite
+
+    # The shared Discord client against a new client per request, both calling the fake Discord
+    python -m backend.loadtest.discord_bench
+
+    # Single vs batched ingest of 100-rating bursts: one run each, then compare the scenarios' rps
+    python -m backend.loadtest run --storage memory --mix burst_single --out single.json
+    python -m backend.loadtest run --storage memory --mix burst_batch --out batch.json
+
+    # Plugin key check with and without the auth cache (compare the "(auth miss)" and "(auth hit)" rows)
+    python -m backend.loadtest run --storage memory --mix plugin_auth
+
+    # Compare two runs, e.g. before and after a change
+    python -m backend.loadtest compare before.json after.json
+
+The report is JSON: run metadata (git commit, options), then count, error
+count, status codes, throughput and p50/p95/p99/max latency per endpoint and
+per scenario, for the seeding phase and the measured run separately, plus the
+fake Discord's per-route status counts and the backend's own /x/stats
+endpoints at the end of the run. Keep the options (and the machine) the same
+for runs you want to compare; --seed makes the traffic itself repeatable.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from backend.core.storage import ENGINES
+from backend.loadtest.scenarios import SCENARIOS, LoadContext, run_mix, seed_users, summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BACKEND_STATS_PATHS = ["/cache/stats", "/discord/rate-limits/stats", "/enrichment/stats", "/scores/write-behind/stats"]
+DEFAULT_MIX = "plugin_burst=6,page_load=3,login_storm=1"
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def _parse_range(value: str) -> List[int]:
+    low, _, high = value.partition("-")
+    return [int(low), int(high or low)]
+
+class _Process:
+    """A child process whose output goes to a temp file, shown if it fails to come up."""
+
+    def __init__(self, name: str, args: List[str], env: Dict[str, str]):
+        self.name = name
+        self.log = tempfile.NamedTemporaryFile(prefix=f"loadtest-{name}-", suffix=".log", delete=False)
+        self.process = subprocess.Popen(args, cwd=REPO_ROOT, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    async def wait_ready(self, url: str, timeout: float = 30.0) -> None:
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    break
+                try:
+                    await client.get(url, timeout=1.0)
+                    return
+                except httpx.HTTPError:
+                    await asyncio.sleep(0.1)
+        self.stop()
+        with open(self.log.name) as f:
+            output = f.read()[-4000:]
+        raise RuntimeError(f"{self.name} did not come up at {url}. Output:\n{output}")
+
+    def stop(self) -> None:
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+        os.unlink(self.log.name)
+
+def _child_env(extra: Dict[str, str]) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+    env.update(extra)
+    return env
+
+async def _fetch_json(client: httpx.AsyncClient, url: str) -> Any:
+    try:
+        response = await client.get(url)
+        return response.json() if response.status_code == 200 else {"status": response.status_code}
+    except (httpx.HTTPError, ValueError) as e:
+        return {"error": str(e)}
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    processes: List[_Process] = []
+    database_name = None
+    sqlite_dir = None
+    fake_discord_url = args.fake_discord_url
+    try:
+        if args.target is None:
+            if fake_discord_url is None:
+                port = _free_port()
+                fake_discord_url = f"http://127.0.0.1:{port}"
+                fake = _Process("fake-discord", [
+                    sys.executable, "-m", "backend.loadtest.fake_discord", "--port", str(port),
+                    "--latency-ms", str(args.discord_latency_ms), "--jitter-ms", str(args.discord_jitter_ms),
+                    "--rate-limit", str(args.discord_rate_limit), "--rate-limit-window", str(args.discord_rate_limit_window),
+                    "--forced-429-ratio", str(args.discord_forced_429_ratio), "--seed", str(args.seed),
+                ], _child_env({}))
+                processes.append(fake)
+                await fake.wait_ready(f"{fake_discord_url}/_stats")
+
+            port = _free_port()
+            target = f"http://127.0.0.1:{port}"
+            backend_env = {
+                "DISCORD_API_BASE_URL": f"{fake_discord_url}/api/v10",
+                "DISCORD_USER_GUILDS_URL": f"{fake_discord_url}/api/users/@me/guilds",
+                "DISCORD_BOT_TOKEN": "loadtest-bot-token",
+                "DISCORD_HTTP2": "false", # Plain HTTP to the fake; nothing to negotiate
+                "LOG_LEVEL": args.log_level,
+            }
+            serve_args = [sys.executable, "-m", "backend.loadtest.serve", "--port", str(port)]
+            backend_env["STORAGE_ENGINE"] = args.storage
+            if args.storage == "sqlite":
+                sqlite_dir = tempfile.mkdtemp(prefix="loadtest-sqlite-")
+                backend_env["SQLITE_PATH"] = os.path.join(sqlite_dir, "loadtest.db")
+            elif args.storage == "mongo":
+                database_name = f"loadtest_{int(time.time())}"
+                backend_env.update(MONGODB_URI=args.mongodb_uri, MONGODB_DB_NAME=database_name)
+            for assignment in args.env:
+                key, _, value = assignment.partition("=")
+                backend_env[key] = value
+            backend = _Process("backend", serve_args, _child_env(backend_env))
+            processes.append(backend)
+            await backend.wait_ready(f"{target}/")
+        else:
+            target = args.target.rstrip("/")
+
+        options = {
+            "new_target_ratio": args.new_target_ratio,
+            "retry_ratio": args.retry_ratio,
+            "batch_ratio": args.batch_ratio,
+            "burst_size": args.burst_size,
+            "batch_size": args.batch_size,
+            "storm_size": args.storm_size,
+            "page_messages": args.page_messages,
+            "ingest_burst": args.ingest_burst,
+            "ingest_batch_max": args.ingest_batch_max,
+            "auth_hits": args.auth_hits,
+        }
+        limits = httpx.Limits(max_connections=args.concurrency * 4, max_keepalive_connections=args.concurrency * 4)
+        async with httpx.AsyncClient(base_url=target, limits=limits, timeout=args.timeout) as client:
+            ctx = LoadContext(client, options)
+            if fake_discord_url:
+                await client.post(f"{fake_discord_url}/_stats/reset")
+
+            print(f"Seeding {args.users} users against {target}...", file=sys.stderr)
+            await seed_users(ctx, args.users, args.concurrency, args.seed_ratings, args.seed)
+            ctx.endpoints.stop()
+            seed_summary = {"elapsed_s": round(ctx.endpoints.elapsed(), 3), "endpoints": summarize(ctx.endpoints)}
+
+            print(f"Running {args.mix} with {args.concurrency} clients for {args.duration}s "
+                  f"(+{args.warmup}s warmup)...", file=sys.stderr)
+            await run_mix(ctx, args.mix_weights, args.concurrency, args.duration, args.warmup, args.think_ms / 1000, args.seed)
+            run_summary = {
+                "elapsed_s": round(ctx.endpoints.elapsed(), 3),
+                "endpoints": summarize(ctx.endpoints),
+                "scenarios": summarize(ctx.scenarios),
+            }
+
+            backend_stats = {path: await _fetch_json(client, path) for path in BACKEND_STATS_PATHS}
+            discord_stats = await _fetch_json(client, f"{fake_discord_url}/_stats") if fake_discord_url else None
+    finally:
+        for process in reversed(processes):
+            process.stop()
+        if database_name is not None:
+            _drop_database(args.mongodb_uri, database_name)
+        if sqlite_dir is not None:
+            shutil.rmtree(sqlite_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git("rev-parse", "HEAD"),
+            "git_dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "external" if args.target else args.storage,
+            "target": args.target,
+            "options": {key: value for key, value in vars(args).items() if key not in ("out", "mix_weights")},
+        },
+        "seed": seed_summary,
+        "run": run_summary,
+        "discord": discord_stats,
+        "backend_stats": backend_stats,
+    }
+
+def _drop_database(uri: str, name: str) -> None:
+    from pymongo import MongoClient
+
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    try:
+        client.drop_database(name)
+    finally:
+        client.close()
+
+def _print_summary(report: Dict[str, Any]) -> None:
+    rows = report["run"]["endpoints"]
+    print(f"{'endpoint':<40} {'count':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, row in rows.items():
+        print(f"{name:<40} {row['count']:>7} {row['errors']:>5} {row['rps']:>8.1f} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+
+def compare(args: argparse.Namespace) -> None:
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"before {before['meta'].get('git_commit', '?')[:10]}  after {after['meta'].get('git_commit', '?')[:10]}")
+    print(f"{'endpoint':<40} {'metric':>7} {'before':>10} {'after':>10} {'change':>8}")
+    for section in ("endpoints", "scenarios"):
+        old_rows, new_rows = before["run"].get(section, {}), after["run"].get(section, {})
+        for name in sorted(set(old_rows) | set(new_rows)):
+            old, new = old_rows.get(name), new_rows.get(name)
+            if old is None or new is None:
+                print(f"{name:<40} {'only in ' + ('after' if old is None else 'before'):>28}")
+                continue
+            for metric in ("rps", "p50_ms", "p95_ms", "p99_ms", "errors"):
+                change = f"{(new[metric] - old[metric]) / old[metric] * 100:+.1f}%" if old[metric] else ""
+                print(f"{name:<40} {metric:>7} {old[metric]:>10} {new[metric]:>10} {change:>8}")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m backend.loadtest", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run a load test and write a JSON report")
+    run_parser.add_argument("--storage", choices=ENGINES, default="mongo", help="STORAGE_ENGINE for the booted backend")
+    run_parser.add_argument("--mongodb-uri", default="mongodb://localhost:27017", help="MongoDB for --storage mongo")
+    run_parser.add_argument("--target", help="Load an already running backend at this URL instead of booting one")
+    run_parser.add_argument("--fake-discord-url", help="Use an already running fake Discord instead of starting one")
+    run_parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                            help="Extra backend setting, e.g. --env SCORE_WRITE_BEHIND=true (repeatable)")
+    run_parser.add_argument("--out", default="loadtest-results.json")
+    run_parser.add_argument("--users", type=int, default=200)
+    run_parser.add_argument("--seed-ratings", type=int, default=5, help="Ratings each user makes while seeding")
+    run_parser.add_argument("--concurrency", type=int, default=20, help="Virtual clients running scenarios at once")
+    run_parser.add_argument("--duration", type=float, default=60.0, help="Measured seconds")
+    run_parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before measuring")
+    run_parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between a client's scenarios")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default {DEFAULT_MIX})")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--timeout", type=float, default=30.0)
+    run_parser.add_argument("--burst-size", type=_parse_range, default=[5, 20], metavar="MIN-MAX")
+    run_parser.add_argument("--batch-size", type=_parse_range, default=[10, 50], metavar="MIN-MAX")
+    run_parser.add_argument("--storm-size", type=_parse_range, default=[5, 15], metavar="MIN-MAX")
+    run_parser.add_argument("--batch-ratio", type=float, default=0.3, help="Chance a plugin burst ends with a batch upload")
+    run_parser.add_argument("--retry-ratio", type=float, default=0.05, help="Chance a plugin rating is a retry of the last one")
+    run_parser.add_argument("--new-target-ratio", type=float, default=0.1, help="Chance a rating targets a user never seen before")
+    run_parser.add_argument("--page-messages", type=int, default=20, help="Recent messages a page load fetches content for")
+    run_parser.add_argument("--ingest-burst", type=int, default=100, help="Ratings per burst_single/burst_batch scenario")
+    run_parser.add_argument("--ingest-batch-max", type=int, default=100,
+                            help="Ratings per batch upload in burst_batch; at most the backend's PLUGIN_RATING_BATCH_MAX_ITEMS")
+    run_parser.add_argument("--auth-hits", type=int, default=5, help="Cached-key requests after each cache miss in plugin_auth")
+    run_parser.add_argument("--discord-latency-ms", type=float, default=50.0)
+    run_parser.add_argument("--discord-jitter-ms", type=float, default=20.0)
+    run_parser.add_argument("--discord-rate-limit", type=int, default=50, help="Requests per route bucket per window; 0 for none")
+    run_parser.add_argument("--discord-rate-limit-window", type=float, default=1.0)
+    run_parser.add_argument("--discord-forced-429-ratio", type=float, default=0.0)
+    run_parser.add_argument("--log-level", default="WARNING", help="Backend LOG_LEVEL")
+
+    compare_parser = commands.add_parser("compare", help="Show per-endpoint changes between two reports")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        compare(args)
+        return
+
+    args.mix_weights = _parse_mix(args.mix)
+    report = asyncio.run(run(args))
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    _print_summary(report)
+    print(f"Report written to {args.out}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Discord client benchmark: the shared, pooled client against a fresh client per
+request (what every call site did before), both calling a local fake Discord.
+
+    python -m backend.loadtest.discord_bench
+    python -m backend.loadtest.discord_bench --calls 2000 --concurrency 20 --latency-ms 20 --out discord.json
+
+The fake serves HTTPS with a throwaway self-signed certificate, so a per-request
+client pays for the TCP and TLS handshakes the shared one keeps alive, on top of
+loading the CA bundle again; --plain compares over plain HTTP instead. The shared client is the one the backend uses,
+built from the DISCORD_HTTP_* settings; it offers HTTP/2, but the fake (uvicorn)
+only speaks HTTP/1.1, so the negotiated version is reported next to the numbers.
+The fake's rate limits are off and calls go to the client directly, not through
+the rate-limit scheduler, so only the transport differs between the modes.
+Reported per mode: per-call latency (mean/p50/p95/p99) and calls per second.
+"""
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import certifi
+import httpx
+
+from backend.core import discord_client
+from backend.core.config import settings
+from backend.loadtest.__main__ import _Process, _child_env, _free_port, _git
+from backend.loadtest.scenarios import USER_ID_BASE, percentile
+
+MODES = ("per_request", "pooled")
+
+def write_self_signed_cert(directory: str) -> Dict[str, str]:
+    """A certificate for 127.0.0.1 and localhost, valid for a day; returns the PEM paths."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fake-discord")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5)).not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName("localhost"), x509.IPAddress(ipaddress.ip_address("127.0.0.1"))
+        ]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    paths = {"certfile": os.path.join(directory, "cert.pem"), "keyfile": os.path.join(directory, "key.pem")}
+    with open(paths["certfile"], "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(paths["keyfile"], "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return paths
+
+async def per_request_get(path: str) -> httpx.Response:
+    async with httpx.AsyncClient(base_url=settings.DISCORD_API_BASE_URL, timeout=settings.DISCORD_HTTP_READ_TIMEOUT) as client:
+        return await client.get(path, headers=discord_client.bot_auth_headers())
+
+async def pooled_get(path: str) -> httpx.Response:
+    return await discord_client.get_discord_client().get(path, headers=discord_client.bot_auth_headers())
+
+async def run_calls(get: Callable[[str], Awaitable[httpx.Response]], options: argparse.Namespace) -> Dict[str, Any]:
+    samples: List[float] = []
+    versions: Dict[str, int] = {}
+    errors = 0
+    semaphore = asyncio.Semaphore(options.concurrency)
+
+    async def call(index: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await get(f"/users/{USER_ID_BASE + index % options.users}")
+            except httpx.HTTPError:
+                errors += 1
+                return
+            samples.append(time.perf_counter() - started)
+            versions[response.http_version] = versions.get(response.http_version, 0) + 1
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(index) for index in range(options.calls)))
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    return {
+        "calls": len(samples),
+        "errors": errors,
+        "http_versions": versions,
+        "calls_per_s": round(len(samples) / elapsed, 1),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 2) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+    }
+
+async def bench_mode(mode: str, options: argparse.Namespace) -> Dict[str, Any]:
+    get = pooled_get if mode == "pooled" else per_request_get
+    if mode == "pooled":
+        await discord_client.open_discord_client()
+    try:
+        if options.warmup:
+            await run_calls(get, options)
+        return await run_calls(get, options)
+    finally:
+        await discord_client.close_discord_client()
+
+async def main_async(options: argparse.Namespace) -> None:
+    cert_dir = tempfile.mkdtemp(prefix="discord-bench-")
+    port = _free_port()
+    fake_args = [
+        sys.executable, "-m", "backend.loadtest.fake_discord", "--port", str(port),
+        "--latency-ms", str(options.latency_ms), "--jitter-ms", "0", "--rate-limit", "0",
+    ]
+    scheme = "http"
+    if not options.plain:
+        scheme = "https"
+        cert = write_self_signed_cert(cert_dir)
+        fake_args += ["--ssl-certfile", cert["certfile"], "--ssl-keyfile", cert["keyfile"]]
+        # Trusted by every httpx client made from here on, pooled or not. The usual CA
+        # bundle stays in, so a new client loads as many certificates as in production.
+        ca_bundle = os.path.join(cert_dir, "ca-bundle.pem")
+        with open(ca_bundle, "wb") as out:
+            for path in (certifi.where(), cert["certfile"]):
+                with open(path, "rb") as f:
+                    out.write(f.read())
+        os.environ["SSL_CERT_FILE"] = ca_bundle
+    fake = _Process("fake-discord", fake_args, _child_env({}))
+    base_url = f"{scheme}://127.0.0.1:{port}"
+    settings.DISCORD_API_BASE_URL = f"{base_url}/api/v10"
+    settings.DISCORD_BOT_TOKEN = settings.DISCORD_BOT_TOKEN or "bench-bot-token"
+
+    results: Dict[str, Any] = {}
+    try:
+        await fake.wait_ready(f"{base_url}/_stats")
+        for mode in options.modes:
+            print(f"{options.calls} calls with {mode} clients...", file=sys.stderr)
+            results[mode] = await bench_mode(mode, options)
+    finally:
+        fake.stop()
+        shutil.rmtree(cert_dir, ignore_errors=True)
+
+    report = {
+        "git_commit": _git("rev-parse", "HEAD"),
+        "options": {key: value for key, value in vars(options).items() if key != "out"},
+        "modes": results,
+    }
+    if options.out:
+        with open(options.out, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    print(f"{'mode':<12}{'calls/s':>10}{'mean_ms':>10}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}{'errors':>8}  http")
+    for mode, result in results.items():
+        print(f"{mode:<12}{result['calls_per_s']:>10}{result['mean_ms']:>10}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+              f"{result['p99_ms']:>10}{result['errors']:>8}  {', '.join(result['http_versions'])}")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m backend.loadtest.discord_bench", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma-separated, from {', '.join(MODES)}")
+    parser.add_argument("--calls", type=int, default=1000, help="Timed calls per mode")
+    parser.add_argument("--concurrency", type=int, default=10, help="Calls in flight at once")
+    parser.add_argument("--users", type=int, default=200, help="Distinct /users/{id} paths to cycle through")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="The fake's response delay")
+    parser.add_argument("--plain", action="store_true", help="Plain HTTP instead of HTTPS")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false", help="Skip the untimed first round per mode")
+    parser.add_argument("--out", help="Also write the report as JSON here")
+    options = parser.parse_args(argv)
+    options.modes = [mode.strip() for mode in options.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in options.modes if mode not in MODES]
+    if unknown:
+        parser.error(f"Unknown mode(s): {', '.join(unknown)}")
+    asyncio.run(main_async(options))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Scripted stand-in for the parts of the Discord API this backend calls.
+
+Every ID resolves to a deterministic fake object, so no fixtures are needed:
+
+- POST /api/v10/oauth2/token            code "user-<id>" -> access token "tok-<id>"
+- GET  /api/v10/users/@me               the user behind the Bearer token
+- GET  /api/users/@me/guilds            (and /api/v10/...) that user's guilds
+- GET  /api/v10/users/{id}
+- GET  /api/v10/guilds/{id}
+- GET  /api/v10/guilds/{id}/members/{user_id}
+- GET  /api/v10/channels/{channel_id}/messages/{message_id}
+
+IDs starting with "missing" answer 404. Each route has its own rate-limit
+bucket (limit requests per window, reported through X-RateLimit-* headers and
+answered with 429 + retry_after once used up), and a fraction of requests can
+be forced to 429 regardless. Latency is a fixed base plus uniform jitter.
+
+Run it on its own with: python -m backend.loadtest.fake_discord --port 8900
+(add --ssl-certfile/--ssl-keyfile to serve HTTPS, as Discord does).
+"""
+import argparse
+import asyncio
+import random
+import time
+import urllib.parse
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse
+
+@dataclass
+class FakeDiscordConfig:
+    latency_ms: float = 50.0
+    jitter_ms: float = 20.0
+    rate_limit: int = 50 # Requests per bucket per window; 0 disables bucket limits
+    rate_limit_window: float = 1.0 # Seconds
+    forced_429_ratio: float = 0.0 # Fraction of requests answered 429 whatever the bucket says
+    guilds_per_user: int = 5
+    guild_count: int = 50 # Users are spread over guild IDs 1..guild_count
+    seed: int = 0
+
+class _Bucket:
+    __slots__ = ("remaining", "reset_at")
+
+    def __init__(self):
+        self.remaining = 0
+        self.reset_at = 0.0
+
+def create_app(config: Optional[FakeDiscordConfig] = None) -> FastAPI:
+    config = config or FakeDiscordConfig()
+    app = FastAPI(title="Fake Discord API")
+    rng = random.Random(config.seed)
+    buckets: Dict[Tuple[str, str], _Bucket] = {}
+    stats: Dict[str, Dict[str, int]] = {}
+    app.state.config = config
+    app.state.stats = stats
+
+    def user_guilds(user_id: str) -> List[Dict[str, Any]]:
+        # Stable per user, so repeated logins see the same servers
+        user_rng = random.Random(f"{config.seed}:{user_id}")
+        count = min(config.guilds_per_user, config.guild_count)
+        ids = user_rng.sample(range(1, config.guild_count + 1), count)
+        return [{"id": str(guild_id), "name": f"Guild {guild_id}", "icon": f"icon{guild_id}"} for guild_id in ids]
+
+    def user_object(user_id: str) -> Dict[str, Any]:
+        return {"id": user_id, "username": f"user{user_id}", "discriminator": "0", "avatar": f"av{user_id}"}
+
+    def _count(route: str, status_code: int) -> None:
+        counts = stats.setdefault(route, {})
+        counts[str(status_code)] = counts.get(str(status_code), 0) + 1
+
+    async def respond(route: str, major: str, body: Any, status_code: int = 200) -> JSONResponse:
+        """Apply latency and rate limiting, then answer with body."""
+        delay = config.latency_ms + rng.uniform(0, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        headers: Dict[str, str] = {}
+        now = time.monotonic()
+        bucket_hash = f"{route}:{major}"
+        if config.rate_limit > 0:
+            bucket = buckets.setdefault((route, major), _Bucket())
+            if now >= bucket.reset_at:
+                bucket.remaining = config.rate_limit
+                bucket.reset_at = now + config.rate_limit_window
+            reset_after = max(bucket.reset_at - now, 0.0)
+            if bucket.remaining <= 0:
+                _count(route, 429)
+                return JSONResponse(
+                    {"message": "You are being rate limited.", "retry_after": round(reset_after, 3), "global": False},
+                    status_code=429,
+                    headers={"X-RateLimit-Bucket": bucket_hash, "X-RateLimit-Limit": str(config.rate_limit),
+                             "X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+                             "X-RateLimit-Scope": "user"},
+                )
+            bucket.remaining -= 1
+            headers = {"X-RateLimit-Bucket": bucket_hash, "X-RateLimit-Limit": str(config.rate_limit),
+                       "X-RateLimit-Remaining": str(bucket.remaining), "X-RateLimit-Reset-After": f"{reset_after:.3f}"}
+
+        if config.forced_429_ratio and rng.random() < config.forced_429_ratio:
+            retry_after = round(rng.uniform(0.05, 0.5), 3)
+            _count(route, 429)
+            return JSONResponse({"message": "You are being rate limited.", "retry_after": retry_after, "global": False},
+                                status_code=429, headers=dict(headers, **{"X-RateLimit-Scope": "shared"}))
+
+        _count(route, status_code)
+        return JSONResponse(body, status_code=status_code, headers=headers)
+
+    def _not_found(route: str, major: str):
+        return respond(route, major, {"message": "Unknown", "code": 10000}, status_code=404)
+
+    def _bearer_user(authorization: Optional[str]) -> Optional[str]:
+        if authorization and authorization.startswith("Bearer tok-"):
+            return authorization[len("Bearer tok-"):]
+        return None
+
+    @app.post("/api/v10/oauth2/token")
+    async def oauth_token(request: Request):
+        # Parsed by hand so the fake doesn't need python-multipart for Form()
+        form = urllib.parse.parse_qs((await request.body()).decode())
+        code = form.get("code", [""])[0]
+        if not code.startswith("user-"):
+            return await respond("POST /oauth2/token", "", {"error": "invalid_grant"}, status_code=400)
+        user_id = code[len("user-"):]
+        return await respond("POST /oauth2/token", "", {
+            "access_token": f"tok-{user_id}", "token_type": "Bearer", "expires_in": 604800,
+            "refresh_token": f"refresh-{user_id}", "scope": "identify guilds",
+        })
+
+    @app.get("/api/v10/users/@me")
+    async def current_user(authorization: Optional[str] = Header(None)):
+        user_id = _bearer_user(authorization)
+        if user_id is None:
+            return await respond("GET /users/@me", "", {"message": "401: Unauthorized", "code": 0}, status_code=401)
+        return await respond("GET /users/@me", user_id, user_object(user_id))
+
+    @app.get("/api/users/@me/guilds")
+    @app.get("/api/v10/users/@me/guilds")
+    async def current_user_guilds(authorization: Optional[str] = Header(None)):
+        user_id = _bearer_user(authorization)
+        if user_id is None:
+            return await respond("GET /users/@me/guilds", "", {"message": "401: Unauthorized", "code": 0}, status_code=401)
+        return await respond("GET /users/@me/guilds", user_id, user_guilds(user_id))
+
+    @app.get("/api/v10/users/{user_id}")
+    async def get_user(user_id: str):
+        if user_id.startswith("missing"):
+            return await _not_found("GET /users/{id}", "")
+        return await respond("GET /users/{id}", "", user_object(user_id))
+
+    @app.get("/api/v10/guilds/{guild_id}")
+    async def get_guild(guild_id: str):
+        if guild_id.startswith("missing"):
+            return await _not_found("GET /guilds/{guild_id}", guild_id)
+        return await respond("GET /guilds/{guild_id}", guild_id, {"id": guild_id, "name": f"Guild {guild_id}", "icon": f"icon{guild_id}"})
+
+    @app.get("/api/v10/guilds/{guild_id}/members/{user_id}")
+    async def get_member(guild_id: str, user_id: str):
+        if user_id.startswith("missing") or guild_id.startswith("missing"):
+            return await _not_found("GET /guilds/{guild_id}/members/{id}", guild_id)
+        return await respond("GET /guilds/{guild_id}/members/{id}", guild_id, {"user": user_object(user_id), "nick": None, "roles": []})
+
+    @app.get("/api/v10/channels/{channel_id}/messages/{message_id}")
+    async def get_message(channel_id: str, message_id: str):
+        if message_id.startswith("missing"):
+            return await _not_found("GET /channels/{channel_id}/messages/{id}", channel_id)
+        author_id = str(zlib.crc32(f"{channel_id}/{message_id}".encode()) % 10_000)
+        return await respond("GET /channels/{channel_id}/messages/{id}", channel_id, {
+            "id": message_id, "channel_id": channel_id, "content": f"message {message_id} in {channel_id}",
+            "author": user_object(author_id), "timestamp": "2024-01-01T00:00:00+00:00",
+        })
+
+    @app.get("/_stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/_stats/reset")
+    async def reset_stats():
+        stats.clear()
+        return {}
+
+    return app
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the fake Discord API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=FakeDiscordConfig.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=FakeDiscordConfig.jitter_ms)
+    parser.add_argument("--rate-limit", type=int, default=FakeDiscordConfig.rate_limit)
+    parser.add_argument("--rate-limit-window", type=float, default=FakeDiscordConfig.rate_limit_window)
+    parser.add_argument("--forced-429-ratio", type=float, default=FakeDiscordConfig.forced_429_ratio)
+    parser.add_argument("--guilds-per-user", type=int, default=FakeDiscordConfig.guilds_per_user)
+    parser.add_argument("--guild-count", type=int, default=FakeDiscordConfig.guild_count)
+    parser.add_argument("--seed", type=int, default=FakeDiscordConfig.seed)
+    parser.add_argument("--ssl-certfile", help="Serve HTTPS with this certificate (PEM)")
+    parser.add_argument("--ssl-keyfile", help="Private key for --ssl-certfile (PEM)")
+    args = parser.parse_args(argv)
+    config = FakeDiscordConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rate_limit=args.rate_limit,
+        rate_limit_window=args.rate_limit_window, forced_429_ratio=args.forced_429_ratio,
+        guilds_per_user=args.guilds_per_user, guild_count=args.guild_count, seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning",
+                ssl_certfile=args.ssl_certfile, ssl_keyfile=args.ssl_keyfile)
+
+if __name__ == "__main__":
+    main()
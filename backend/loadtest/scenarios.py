@@ -0,0 +1,318 @@
+"""
+Traffic the load test replays, driven only through the backend's public HTTP API.
+
+Users log in through /auth/discord/callback (the fake Discord turns code
+"user-<id>" into that user), get a plugin API key, and then pick scenarios:
+
+- plugin_burst: a run of single plugin ratings, the odd plugin retry of a
+  rating already sent, and sometimes a batch upload
+- page_load:    what the web app fetches on open: /users/me, then tracked
+  servers, rated users and the content of recently rated messages in parallel
+- login_storm:  a handful of concurrent logins, half of them brand-new users
+- burst_single / burst_batch: a burst of ingest_burst ratings, sent as
+  concurrent single POSTs or as batches the way the plugin buffers them. Run
+  each on its own; scenario rps times ingest_burst is ratings per second
+- plugin_auth:  a fresh user replays one rating right after getting a new plugin
+  key (an auth cache miss), then auth_hits more times (hits). Replays skip the
+  rating work, so the two endpoint rows differ by the key check alone
+
+Every request is recorded under its route template so results line up across runs.
+"""
+import asyncio
+import itertools
+import random
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+USER_ID_BASE = 100_000_000_000_000_000 # Snowflake-sized IDs, as Discord would send
+NEW_USER_ID_BASE = 200_000_000_000_000_000
+MESSAGE_ID_BASE = 300_000_000_000_000_000
+CHANNELS_PER_SERVER = 20
+
+@dataclass
+class VirtualUser:
+    user_id: str
+    token: Optional[str] = None
+    api_key: Optional[str] = None
+    server_ids: List[str] = field(default_factory=list)
+    rated_messages: List[Tuple[str, str]] = field(default_factory=list) # (channel_id, message_id), newest last
+    last_rating: Optional[Dict[str, Any]] = None
+
+    def auth_headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def plugin_headers(self) -> Dict[str, str]:
+        return {"X-Plugin-API-Key": self.api_key, "X-Acting-User-ID": self.user_id}
+
+class Recorder:
+    """Latency samples and status counts per endpoint (and per scenario)."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.enabled = True
+        self.started_at = time.perf_counter()
+        self.stopped_at: Optional[float] = None
+
+    def reset(self) -> None:
+        self.samples.clear()
+        self.statuses.clear()
+        self.started_at = time.perf_counter()
+        self.stopped_at = None
+
+    def record(self, name: str, status: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        self.samples.setdefault(name, []).append(seconds)
+        counts = self.statuses.setdefault(name, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    def stop(self) -> None:
+        self.stopped_at = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return (self.stopped_at or time.perf_counter()) - self.started_at
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize(recorder: Recorder) -> Dict[str, Dict[str, Any]]:
+    elapsed = recorder.elapsed()
+    summary = {}
+    for name in sorted(recorder.samples):
+        values = sorted(recorder.samples[name])
+        statuses = recorder.statuses[name]
+        # HTTP statuses for endpoints, "ok" or the exception name for scenarios
+        errors = sum(count for status, count in statuses.items() if status != "ok" and status[:1] not in ("2", "3"))
+        summary[name] = {
+            "count": len(values),
+            "errors": errors,
+            "status": dict(sorted(statuses.items())),
+            "rps": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+            "mean_ms": round(sum(values) / len(values) * 1000, 2),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        }
+    return summary
+
+class LoadContext:
+    """Shared state for one run: the HTTP client, recorders and the user population."""
+
+    def __init__(self, client: httpx.AsyncClient, options: Dict[str, Any]):
+        self.client = client
+        self.options = options
+        self.endpoints = Recorder()
+        self.scenarios = Recorder()
+        self.users: List[VirtualUser] = []
+        self._new_user_ids = itertools.count(NEW_USER_ID_BASE)
+        self._message_ids = itertools.count(MESSAGE_ID_BASE)
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.endpoints.record(name, type(e).__name__, time.perf_counter() - started)
+            return None
+        self.endpoints.record(name, str(response.status_code), time.perf_counter() - started)
+        return response
+
+    def new_user_id(self) -> str:
+        return str(next(self._new_user_ids))
+
+    def new_message_id(self) -> str:
+        return str(next(self._message_ids))
+
+# --- Steps ---
+
+async def login(ctx: LoadContext, user: VirtualUser) -> bool:
+    response = await ctx.request(
+        "GET /auth/discord/callback", "GET", "/auth/discord/callback",
+        params={"code": f"user-{user.user_id}", "state": "loadtest"}, follow_redirects=False
+    )
+    if response is None or response.status_code not in (302, 307):
+        return False
+    query = urllib.parse.urlparse(response.headers["location"]).query
+    user.token = urllib.parse.parse_qs(query)["token"][0]
+    return True
+
+async def create_plugin_key(ctx: LoadContext, user: VirtualUser) -> bool:
+    response = await ctx.request("POST /users/me/plugin-api-key", "POST", "/users/me/plugin-api-key", headers=user.auth_headers())
+    if response is None or response.status_code != 200:
+        return False
+    user.api_key = response.json()["api_key"]
+    return True
+
+async def load_profile(ctx: LoadContext, user: VirtualUser) -> bool:
+    response = await ctx.request("GET /users/me", "GET", "/users/me", headers=user.auth_headers())
+    if response is None or response.status_code != 200:
+        return False
+    user.server_ids = [server["id"] for server in response.json().get("servers", [])]
+    return True
+
+def _pick_target(ctx: LoadContext, user: VirtualUser, rng: random.Random) -> str:
+    if rng.random() < ctx.options["new_target_ratio"]:
+        return ctx.new_user_id()
+    target = rng.choice(ctx.users)
+    return target.user_id if target is not user else ctx.new_user_id()
+
+def _new_rating(ctx: LoadContext, user: VirtualUser, rng: random.Random) -> Dict[str, Any]:
+    server_id = rng.choice(user.server_ids) if user.server_ids else "1"
+    channel_id = str(int(server_id) * 1000 + rng.randrange(CHANNELS_PER_SERVER))
+    message_id = ctx.new_message_id()
+    user.rated_messages.append((channel_id, message_id))
+    del user.rated_messages[:-ctx.options["page_messages"]]
+    return {
+        "acting_user_id": user.user_id,
+        "target_user_id": _pick_target(ctx, user, rng),
+        "server_id": server_id,
+        "channel_id": channel_id,
+        "message_id": message_id,
+        "score_delta": rng.choice([1.0, 1.0, 2.0, -1.0, -2.0]),
+        "message_content_snippet": "load test",
+    }
+
+async def post_rating(ctx: LoadContext, user: VirtualUser, rating: Dict[str, Any]) -> None:
+    user.last_rating = rating
+    await ctx.request("POST /plugin/ratings", "POST", "/plugin/ratings", json=rating, headers=user.plugin_headers())
+
+# --- Scenarios ---
+
+async def plugin_burst(ctx: LoadContext, user: VirtualUser, rng: random.Random) -> None:
+    options = ctx.options
+    for _ in range(rng.randint(*options["burst_size"])):
+        if user.last_rating is not None and rng.random() < options["retry_ratio"]:
+            # The plugin didn't see the response and sends the same rating again
+            await post_rating(ctx, user, user.last_rating)
+        else:
+            await post_rating(ctx, user, _new_rating(ctx, user, rng))
+    if rng.random() < options["batch_ratio"]:
+        ratings = [_new_rating(ctx, user, rng) for _ in range(rng.randint(*options["batch_size"]))]
+        await ctx.request("POST /plugin/ratings/batch", "POST", "/plugin/ratings/batch",
+                          json={"ratings": ratings}, headers=user.plugin_headers())
+
+async def burst_single(ctx: LoadContext, user: VirtualUser, rng: random.Random) -> None:
+    ratings = [_new_rating(ctx, user, rng) for _ in range(ctx.options["ingest_burst"])]
+    await asyncio.gather(*(post_rating(ctx, user, rating) for rating in ratings))
+
+async def burst_batch(ctx: LoadContext, user: VirtualUser, rng: random.Random) -> None:
+    ratings = [_new_rating(ctx, user, rng) for _ in range(ctx.options["ingest_burst"])]
+    size = ctx.options["ingest_batch_max"]
+    await asyncio.gather(*(
+        ctx.request("POST /plugin/ratings/batch", "POST", "/plugin/ratings/batch",
+                    json={"ratings": ratings[start:start + size]}, headers=user.plugin_headers())
+        for start in range(0, len(ratings), size)
+    ))
+
+async def plugin_auth(ctx: LoadContext, user: VirtualUser, rng: random.Random) -> None:
+    # A user of its own: a new key would lock the shared user out of other scenarios
+    user = VirtualUser(ctx.new_user_id())
+    if not (await login(ctx, user) and await create_plugin_key(ctx, user) and await load_profile(ctx, user)):
+        raise RuntimeError(f"Could not set up user {user.user_id}")
+    rating = _new_rating(ctx, user, rng)
+    await post_rating(ctx, user, rating)
+    # A new key drops the cached one, so the next request verifies against the database
+    if not await create_plugin_key(ctx, user):
+        raise RuntimeError(f"Could not replace the plugin key of {user.user_id}")
+    await ctx.request("POST /plugin/ratings (auth miss)", "POST", "/plugin/ratings", json=rating, headers=user.plugin_headers())
+    for _ in range(ctx.options["auth_hits"]):
+        await ctx.request("POST /plugin/ratings (auth hit)", "POST", "/plugin/ratings", json=rating, headers=user.plugin_headers())
+
+async def page_load(ctx: LoadContext, user: VirtualUser, rng: random.Random) -> None:
+    if not await load_profile(ctx, user):
+        return
+    headers = user.auth_headers()
+    requests: List[Awaitable[Any]] = [
+        ctx.request("GET /users/me/tracked-servers", "GET", "/users/me/tracked-servers", headers=headers),
+        ctx.request("GET /users/{id}/rated-users", "GET", f"/users/{user.user_id}/rated-users", headers=headers),
+    ]
+    if user.rated_messages:
+        messages = [{"channel_id": channel_id, "message_id": message_id} for channel_id, message_id in user.rated_messages]
+        requests.append(ctx.request("POST /discord/messages/batch", "POST", "/discord/messages/batch",
+                                    json={"messages": messages}, headers=headers))
+    await asyncio.gather(*requests)
+
+async def login_storm(ctx: LoadContext, user: VirtualUser, rng: random.Random) -> None:
+    size = rng.randint(*ctx.options["storm_size"])
+    # Half returning users, half first logins; logging in on a copy leaves the population's tokens alone
+    user_ids = [ctx.new_user_id() if rng.random() < 0.5 else rng.choice(ctx.users).user_id for _ in range(size)]
+    await asyncio.gather(*(login(ctx, VirtualUser(user_id)) for user_id in user_ids))
+
+SCENARIOS: Dict[str, Callable[[LoadContext, VirtualUser, random.Random], Awaitable[None]]] = {
+    "plugin_burst": plugin_burst,
+    "page_load": page_load,
+    "login_storm": login_storm,
+    "burst_single": burst_single,
+    "burst_batch": burst_batch,
+    "plugin_auth": plugin_auth,
+}
+
+# --- Seeding and the main loop ---
+
+async def seed_users(ctx: LoadContext, count: int, concurrency: int, ratings_per_user: int, seed: int) -> None:
+    """Log every user in (one big login storm), give them plugin keys and a few ratings each."""
+    users = [VirtualUser(str(USER_ID_BASE + index)) for index in range(count)]
+    ctx.users = users
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def prepare(index: int, user: VirtualUser) -> None:
+        async with semaphore:
+            if not (await login(ctx, user) and await create_plugin_key(ctx, user) and await load_profile(ctx, user)):
+                raise RuntimeError(f"Could not set up user {user.user_id}; is the backend pointed at the fake Discord?")
+
+    async def rate(index: int, user: VirtualUser) -> None:
+        rng = random.Random(f"{seed}:seed:{index}")
+        async with semaphore:
+            for _ in range(ratings_per_user):
+                await post_rating(ctx, user, _new_rating(ctx, user, rng))
+
+    await asyncio.gather(*(prepare(index, user) for index, user in enumerate(users)))
+    await asyncio.gather(*(rate(index, user) for index, user in enumerate(users)))
+
+async def run_mix(ctx: LoadContext, mix: Dict[str, float], concurrency: int, duration: float,
+                  warmup: float, think_time: float, seed: int) -> None:
+    """Closed loop: each virtual client picks a user and a scenario, runs it, and repeats."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    deadline = time.perf_counter() + warmup + duration
+
+    async def client_loop(index: int) -> None:
+        rng = random.Random(f"{seed}:client:{index}")
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            user = rng.choice(ctx.users)
+            started = time.perf_counter()
+            try:
+                await SCENARIOS[name](ctx, user, rng)
+                outcome = "ok"
+            except Exception as e:
+                outcome = type(e).__name__
+            ctx.scenarios.record(name, outcome, time.perf_counter() - started)
+            if think_time:
+                await asyncio.sleep(rng.expovariate(1 / think_time))
+
+    async def end_warmup() -> None:
+        await asyncio.sleep(warmup)
+        ctx.endpoints.enabled = ctx.scenarios.enabled = True
+        ctx.endpoints.reset()
+        ctx.scenarios.reset()
+
+    ctx.endpoints.enabled = ctx.scenarios.enabled = warmup <= 0
+    ctx.endpoints.reset()
+    ctx.scenarios.reset()
+    warmup_task = asyncio.create_task(end_warmup()) if warmup > 0 else None
+    await asyncio.gather(*(client_loop(index) for index in range(concurrency)))
+    if warmup_task is not None:
+        await warmup_task
+    ctx.endpoints.stop()
+    ctx.scenarios.stop()
@@ -0,0 +1,24 @@
+"""
+Run backend.main:app for a load test.
+
+    python -m backend.loadtest.serve --port 8800
+
+Settings come from the environment as usual: the harness sets DISCORD_API_BASE_URL
+and friends to point at the fake Discord, and STORAGE_ENGINE to pick the database.
+"""
+import argparse
+from typing import List, Optional
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the backend for a load test.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    args = parser.parse_args(argv)
+
+    from backend.main import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Startup benchmark: how long a fresh worker takes to import the app and to answer
+its first request, in the default startup and with FAST_STARTUP.
+
+    python -m backend.loadtest.startup_bench --runs 5
+    python -m backend.loadtest.startup_bench --modes eager,fast --storage sqlite --out startup.json
+
+Every run is a new interpreter. Reported per mode, as median/min/max seconds:
+
+    import_s          `import backend.main`, timed inside the child
+    first_response_s  process spawn to the first answered GET /health/live
+    ready_s           process spawn to the first 200 from GET /health/ready
+
+plus the slowest top-level imports from one `python -X importtime` run, to see
+what a regression in import_s came from.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from backend.core.storage import ENGINES
+from backend.loadtest.__main__ import REPO_ROOT, _child_env, _free_port, _git
+
+MODES = {"eager": "false", "fast": "true"} # Mode -> FAST_STARTUP
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import backend.main; print(time.perf_counter() - started)"
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "median": round(statistics.median(samples), 4),
+        "min": round(min(samples), 4),
+        "max": round(max(samples), 4),
+    }
+
+def time_import(env: Dict[str, str]) -> float:
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def top_imports(env: Dict[str, str], count: int) -> List[Dict[str, Any]]:
+    """Slowest modules imported directly by backend.main (or by the interpreter's site setup), cumulative."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend.main"], cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue # The header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            modules.append({"module": name.strip(), "cumulative_s": int(cumulative) / 1e6})
+    modules.sort(key=lambda module: -module["cumulative_s"])
+    return modules[:count]
+
+async def time_first_request(env: Dict[str, str], timeout: float) -> Dict[str, float]:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    log = tempfile.TemporaryFile()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "backend.loadtest.serve", "--port", str(port)], cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    timings: Dict[str, float] = {}
+    try:
+        async with httpx.AsyncClient(base_url=base, timeout=1.0) as client:
+            deadline = time.monotonic() + timeout
+            for key, path in (("first_response_s", "/health/live"), ("ready_s", "/health/ready")):
+                while key not in timings:
+                    if process.poll() is not None or time.monotonic() > deadline:
+                        log.seek(0)
+                        output = log.read().decode(errors="replace")[-4000:]
+                        raise RuntimeError(f"Backend did not answer {path} (exit code {process.poll()}). Output:\n{output}")
+                    try:
+                        response = await client.get(path)
+                        if response.status_code == 200:
+                            timings[key] = time.perf_counter() - started
+                            continue
+                    except httpx.HTTPError:
+                        pass
+                    await asyncio.sleep(0.005)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+    return timings
+
+async def bench_mode(mode: str, options: argparse.Namespace, storage_env: Dict[str, str]) -> Dict[str, Any]:
+    env = _child_env({**storage_env, "FAST_STARTUP": MODES[mode], "LOG_LEVEL": "WARNING"})
+    samples: Dict[str, List[float]] = {"import_s": [], "first_response_s": [], "ready_s": []}
+    for _ in range(options.runs):
+        samples["import_s"].append(time_import(env))
+        for key, value in (await time_first_request(env, options.timeout)).items():
+            samples[key].append(value)
+    return {key: _summary(values) for key, values in samples.items()}
+
+async def main_async(options: argparse.Namespace) -> None:
+    storage_env = {"STORAGE_ENGINE": options.storage}
+    sqlite_dir = None
+    if options.storage == "sqlite":
+        sqlite_dir = tempfile.mkdtemp(prefix="startup-bench-")
+        storage_env["SQLITE_PATH"] = os.path.join(sqlite_dir, "bench.db")
+    elif options.storage == "mongo":
+        storage_env.update(MONGODB_URI=options.mongodb_uri, MONGODB_DB_NAME=f"startup_bench_{int(time.time())}")
+
+    results: Dict[str, Any] = {}
+    try:
+        for mode in options.modes:
+            print(f"Starting the backend {options.runs} times ({mode})...", file=sys.stderr)
+            results[mode] = await bench_mode(mode, options, storage_env)
+    finally:
+        if options.storage == "mongo":
+            from backend.loadtest.__main__ import _drop_database
+            _drop_database(options.mongodb_uri, storage_env["MONGODB_DB_NAME"])
+        if sqlite_dir is not None:
+            shutil.rmtree(sqlite_dir, ignore_errors=True)
+
+    report = {
+        "git_commit": _git("rev-parse", "HEAD"),
+        "options": {key: value for key, value in vars(options).items() if key != "out"},
+        "modes": results,
+        "top_imports": top_imports(_child_env(storage_env), options.top_imports) if options.top_imports else [],
+    }
+    if options.out:
+        with open(options.out, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    print(f"{'mode':<8}" + "".join(f"{key + ' p50':>22}{'min':>9}{'max':>9}" for key in ("import_s", "first_response_s", "ready_s")))
+    for mode, result in results.items():
+        print(f"{mode:<8}" + "".join(f"{result[key]['median']:>22}{result[key]['min']:>9}{result[key]['max']:>9}" for key in ("import_s", "first_response_s", "ready_s")))
+    for module in report["top_imports"]:
+        print(f"  {module['cumulative_s']:>8.4f}s  {module['module']}")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m backend.loadtest.startup_bench", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="eager,fast", help=f"Comma-separated, from {', '.join(MODES)}")
+    parser.add_argument("--storage", choices=ENGINES, default="memory")
+    parser.add_argument("--mongodb-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds a single start may take to become ready")
+    parser.add_argument("--top-imports", type=int, default=10, help="Slowest imports to list; 0 to skip")
+    parser.add_argument("--out", help="Also write the report as JSON here")
+    options = parser.parse_args(argv)
+    options.modes = [mode.strip() for mode in options.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in options.modes if mode not in MODES]
+    if unknown:
+        parser.error(f"Unknown mode(s): {', '.join(unknown)}")
+    asyncio.run(main_async(options))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Storage engine benchmark: the same seeded workload against each engine, timed per
+operation, followed by a fixed set of reads whose answers must match across engines.
+
+    python -m backend.loadtest.storage_bench --engines memory,sqlite
+    python -m backend.loadtest.storage_bench --engines memory,sqlite,mongo --mongodb-uri mongodb://localhost:27017
+
+SQLite runs on a temporary file and Mongo on a fresh database, both removed
+afterwards. The workload talks to the engines directly (no HTTP, no caches), so
+the numbers are the storage cost of each operation the app makes. A non-zero exit
+status means the engines disagreed; the differing reads are printed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from backend.core.database import USER_VIEWS
+from backend.core.storage import ENGINES, StorageEngine, create_engine
+from backend.core.storage.base import as_utc
+from backend.loadtest.scenarios import percentile
+
+class Timings:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    async def time(self, name: str, operation: Awaitable[Any]) -> Any:
+        started = time.perf_counter()
+        result = await operation
+        self.samples.setdefault(name, []).append(time.perf_counter() - started)
+        return result
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for name in sorted(self.samples):
+            values = sorted(self.samples[name])
+            total = sum(values)
+            summary[name] = {
+                "count": len(values),
+                "ops_per_s": round(len(values) / total, 1) if total else 0.0,
+                "p50_us": round(percentile(values, 0.50) * 1e6, 1),
+                "p95_us": round(percentile(values, 0.95) * 1e6, 1),
+                "p99_us": round(percentile(values, 0.99) * 1e6, 1),
+            }
+        return summary
+
+def _canonical(value: Any) -> Any:
+    """Comparable form of a read: UTC datetimes, rounded floats, no Mongo _id."""
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items() if key != "_id"}
+    if isinstance(value, list):
+        return [_canonical(item) for item in value]
+    if isinstance(value, datetime):
+        return as_utc(value).replace(microsecond=value.microsecond // 1000 * 1000).isoformat()
+    if isinstance(value, float):
+        return round(value, 6)
+    return value
+
+def _sorted(rows: List[Dict[str, Any]], *keys: str) -> List[Dict[str, Any]]:
+    # For reads whose order the contract leaves open
+    return sorted(rows, key=lambda row: tuple(str(row.get(key)) for key in keys))
+
+async def _drain(cursor) -> List[Dict[str, Any]]:
+    return [doc async for doc in cursor]
+
+async def run_workload(engine: StorageEngine, options: argparse.Namespace, timings: Timings, now: datetime) -> Dict[str, Any]:
+    """
+    Seed, write and read through engine; returns the answers to the cross-check reads.
+
+    now pins every timestamp and read window, so engines run one after another
+    (seconds apart) get identical workloads and must give identical answers.
+    """
+    rng = random.Random(options.seed)
+    user_ids = [str(100_000 + index) for index in range(options.users)]
+    server_ids = [str(500 + index) for index in range(options.servers)]
+    memberships = {user_id: rng.sample(server_ids, min(3, len(server_ids))) for user_id in user_ids}
+    base_ts = now - timedelta(hours=2)
+
+    # Users and servers
+    for user_id in user_ids:
+        await timings.time("upsert_user", engine.upsert_user(
+            {"user_id": user_id, "username": f"Member{user_id}", "profile_picture_url": f"https://cdn.example/{user_id}.png",
+             "servers": [{"id": server_id, "name": f"Guild {server_id}", "icon": None} for server_id in memberships[user_id]]},
+            defaults={"social_credits_given": [], "servers": [], "plugin_api_key": None, "plugin_api_key_generated_at": None}
+        ))
+    for server_id in server_ids:
+        members = [user_id for user_id in user_ids if server_id in memberships[user_id]]
+        await timings.time("upsert_server", engine.upsert_server({"server_id": server_id, "server_name": f"Guild {server_id}", "user_ids": members}))
+    for user_id in user_ids[: len(user_ids) // 4]:
+        await timings.time("update_user_fields", engine.update_user_fields(user_id, {
+            "plugin_api_key": f"hash-{user_id}", "plugin_api_key_generated_at": base_ts
+        }))
+    for user_id in user_ids[: len(user_ids) // 10]:
+        await timings.time("add_user_server", engine.add_user_server(user_id, {"id": server_ids[0], "name": "Guild", "icon": None}))
+    await timings.time("update_server_info", engine.update_server_info({"id": server_ids[0], "name": "Renamed", "icon": "icon0"}))
+    for index in range(options.users // 10):
+        await timings.time("insert_user_if_missing", engine.insert_user_if_missing(
+            {"user_id": str(900_000 + index), "username": f"Placeholder{index}", "social_credits_given": [], "servers": []}
+        ))
+
+    # Single ratings, the web/plugin single path: ledger insert, then the score
+    keys: List[str] = []
+    for index in range(options.ratings):
+        acting = rng.choice(user_ids)
+        target = rng.choice(user_ids)
+        server_id = rng.choice(memberships[acting])
+        delta = rng.choice([1.0, 2.0, -1.0, 0.5])
+        retry = keys and rng.random() < 0.05
+        key = rng.choice(keys) if retry else f"{acting}:{index}"
+        event = {
+            "acting_user_id": acting, "target_user_id": target, "score_delta": delta,
+            "ts": base_ts + timedelta(seconds=index), "source": "plugin", "server_id": server_id,
+            "channel_id": None, "message_id": str(index), "message_content_snippet": None, "reason": None,
+            "idempotency_key": key,
+        }
+        inserted = await timings.time("insert_rating_event", engine.insert_rating_event(event))
+        if inserted:
+            keys.append(key)
+            await timings.time("apply_score_delta", engine.apply_score_delta(acting, target, delta, server_id))
+
+    # Batches, the plugin batch / write-behind path
+    for batch in range(options.ratings // options.batch_size):
+        events = []
+        deltas: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for item in range(options.batch_size):
+            acting = rng.choice(user_ids)
+            target = rng.choice(user_ids)
+            server_id = rng.choice(memberships[acting])
+            delta = rng.choice([1.0, -1.0])
+            events.append({
+                "acting_user_id": acting, "target_user_id": target, "score_delta": delta,
+                "ts": base_ts + timedelta(minutes=batch, seconds=item), "source": "plugin", "server_id": server_id,
+                "channel_id": None, "message_id": None, "message_content_snippet": None, "reason": None,
+                "idempotency_key": rng.choice(keys) if rng.random() < 0.05 else f"batch:{batch}:{item}",
+            })
+        duplicates = await timings.time("insert_rating_events", engine.insert_rating_events(events))
+        duplicate_ids = {id(event) for event in duplicates}
+        for event in events:
+            if id(event) in duplicate_ids:
+                continue
+            pair = deltas.setdefault((event["acting_user_id"], event["target_user_id"]), {"score_delta": 0.0, "server_ids": []})
+            pair["score_delta"] += event["score_delta"]
+            if event["server_id"] not in pair["server_ids"]:
+                pair["server_ids"].append(event["server_id"])
+        await timings.time("apply_score_deltas", engine.apply_score_deltas(deltas))
+
+    # Some unratings
+    for user_id in user_ids[:20]:
+        entries = await engine.get_score_entries(user_id, user_ids)
+        if entries:
+            await timings.time("remove_score_entry", engine.remove_score_entry(user_id, next(iter(entries))))
+
+    # Reads: timed over many samples, with a fixed subset kept for the cross-check
+    answers: Dict[str, Any] = {}
+    check_users = user_ids[:: max(1, len(user_ids) // 20)]
+    for index in range(options.reads):
+        user_id = rng.choice(user_ids)
+        for view, projection in USER_VIEWS.items():
+            await timings.time(f"get_user[{view}]", engine.get_user(user_id, projection))
+        await timings.time("get_user[elemMatch]", engine.get_user(
+            user_id, {"_id": 0, "user_id": 1, "social_credits_given": {"$elemMatch": {"target_user_id": rng.choice(user_ids)}}}
+        ))
+        await timings.time("get_users_by_ids", engine.get_users_by_ids(rng.sample(user_ids, 20), {"_id": 0, "user_id": 1, "username": 1}))
+        await timings.time("get_score_entries", engine.get_score_entries(user_id, rng.sample(user_ids, 10)))
+        await timings.time("get_rated_users_with_profiles", engine.get_rated_users_with_profiles(user_id))
+        await timings.time("get_rating_history", engine.get_rating_history(user_id, rng.choice(user_ids), None, None, 500))
+        await timings.time("find_rating_idempotency_keys", engine.find_rating_idempotency_keys(rng.sample(keys, 20) + ["missing"]))
+        await timings.time("get_rollup_series[hour]", engine.get_rollup_series("pair", user_id, rng.choice(user_ids), "hour", base_ts, now))
+        if index % 10 == 0:
+            server_id = rng.choice(server_ids)
+            await timings.time("get_server_score_entries", engine.get_server_score_entries(server_id))
+            await timings.time("get_server_rating_history", engine.get_server_rating_history(server_id, base_ts, now, 500))
+            await timings.time("search_server_members", engine.search_server_members(server_id, "member1", 25))
+            page = await timings.time("get_server_member_ids_page", engine.get_server_member_ids_page(server_id, None, 100))
+            await timings.time("find_members_by_ids", _drain(engine.find_members_by_ids(page or [])))
+            await timings.time("find_servers_after", _drain(engine.find_servers_after(None, 0, 100)))
+
+    for user_id in check_users:
+        answers[f"user:{user_id}"] = await engine.get_user(user_id)
+        for view, projection in USER_VIEWS.items():
+            answers[f"user[{view}]:{user_id}"] = await engine.get_user(user_id, projection)
+        answers[f"elemMatch:{user_id}"] = await engine.get_user(
+            user_id, {"_id": 0, "user_id": 1, "social_credits_given": {"$elemMatch": {"target_user_id": user_ids[0]}}}
+        )
+        answers[f"entries:{user_id}"] = await engine.get_score_entries(user_id, user_ids)
+        answers[f"rated:{user_id}"] = _sorted(await engine.get_rated_users_with_profiles(user_id) or [], "target_user_id")
+        for target in check_users[:5]:
+            answers[f"history:{user_id}:{target}"] = await engine.get_rating_history(user_id, target, None, None, 50)
+            for resolution in ("day", "hour", "minute"):
+                answers[f"rollup[{resolution}]:{user_id}:{target}"] = await engine.get_rollup_series(
+                    "pair", user_id, target, resolution, base_ts, now + timedelta(minutes=1)
+                )
+    for server_id in server_ids:
+        answers[f"server:{server_id}"] = await engine.get_server(server_id)
+        answers[f"server_entries:{server_id}"] = _sorted(await engine.get_server_score_entries(server_id), "acting_user_id", "target_user_id")
+        answers[f"server_history:{server_id}"] = await engine.get_server_rating_history(server_id, base_ts + timedelta(minutes=5), None, 100)
+        answers[f"search:{server_id}"] = await engine.search_server_members(server_id, "MEMBER10", 10)
+        page = await engine.get_server_member_ids_page(server_id, user_ids[len(user_ids) // 2], 25)
+        answers[f"member_page:{server_id}"] = page
+        answers[f"members:{server_id}"] = await engine.find_members_by_ids(page or []).to_list(length=None)
+        answers[f"server_rollup[day]:{server_id}"] = await engine.get_rollup_series(
+            "server", server_id, user_ids[0], "day", base_ts - timedelta(days=1), now + timedelta(days=1)
+        )
+    answers["servers_after"] = await engine.find_servers_after(server_ids[1], 5, 2).to_list(length=None)
+    answers["search:unknown"] = await engine.search_server_members("no-such-server", "", 10)
+    answers["member_page:unknown"] = await engine.get_server_member_ids_page("no-such-server", None, 10)
+    answers["users_by_ids"] = _sorted(await engine.get_users_by_ids(check_users + ["missing"], {"_id": 0, "user_id": 1, "servers.id": 1}), "user_id")
+    answers["keys"] = sorted(await engine.find_rating_idempotency_keys(keys[:50] + ["missing"]))
+    answers["missing_user_delta"] = await engine.apply_score_delta("missing", user_ids[0], 1.0, None)
+    answers["missing_user_remove"] = await engine.remove_score_entry("missing", user_ids[0])
+    return _canonical(answers)
+
+async def bench_engine(name: str, options: argparse.Namespace, now: datetime) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    cleanup: Callable[[], Awaitable[None]]
+    if name == "sqlite":
+        directory = tempfile.mkdtemp(prefix="storage-bench-")
+        from backend.core.storage.sqlite import SQLiteStorage
+        engine: StorageEngine = SQLiteStorage(os.path.join(directory, "bench.db"))
+
+        async def cleanup() -> None:
+            shutil.rmtree(directory, ignore_errors=True)
+    elif name == "mongo":
+        from backend.core.storage.mongo import MongoStorage
+        database_name = f"storage_bench_{int(time.time())}"
+        engine = MongoStorage(options.mongodb_uri, database_name)
+
+        async def cleanup() -> None:
+            from backend.loadtest.__main__ import _drop_database
+            _drop_database(options.mongodb_uri, database_name)
+    else:
+        engine = create_engine(name)
+
+        async def cleanup() -> None:
+            pass
+
+    timings = Timings()
+    try:
+        await timings.time("open", engine.open())
+        await timings.time("ensure_indexes", engine.ensure_indexes())
+        started = time.perf_counter()
+        answers = await run_workload(engine, options, timings, now)
+        elapsed = time.perf_counter() - started
+        await engine.close()
+    finally:
+        await cleanup()
+    return {"elapsed_s": round(elapsed, 3), "operations": timings.summary()}, answers
+
+def _diff(reference: Dict[str, Any], other: Dict[str, Any]) -> List[str]:
+    return [key for key in sorted(set(reference) | set(other)) if reference.get(key) != other.get(key)]
+
+async def main_async(options: argparse.Namespace) -> int:
+    results: Dict[str, Any] = {}
+    answers: Dict[str, Dict[str, Any]] = {}
+    # One clock for every engine; each computing its own would shift their timestamps apart
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    for name in options.engines:
+        print(f"Benchmarking {name}...", file=sys.stderr)
+        results[name], answers[name] = await bench_engine(name, options, now)
+
+    reference = options.engines[0]
+    mismatches = {name: _diff(answers[reference], answers[name]) for name in options.engines[1:]}
+    report = {
+        "options": {key: value for key, value in vars(options).items() if key != "out"},
+        "engines": results,
+        "mismatches": mismatches,
+    }
+    if options.out:
+        with open(options.out, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    operations = sorted({operation for result in results.values() for operation in result["operations"]})
+    print(f"{'operation':<32}" + "".join(f"{name + ' p50us':>16}{name + ' p95us':>16}" for name in options.engines))
+    for operation in operations:
+        row = f"{operation:<32}"
+        for name in options.engines:
+            stats = results[name]["operations"].get(operation)
+            row += f"{stats['p50_us']:>16}{stats['p95_us']:>16}" if stats else f"{'':>32}"
+        print(row)
+    print("elapsed_s " + "  ".join(f"{name}={results[name]['elapsed_s']}" for name in options.engines))
+
+    failed = False
+    for name, keys in mismatches.items():
+        if keys:
+            failed = True
+            print(f"{name} disagrees with {reference} on {len(keys)} reads:", file=sys.stderr)
+            for key in keys[:10]:
+                print(f"  {key}\n    {reference}: {json.dumps(answers[reference].get(key))[:300]}\n"
+                      f"    {name}: {json.dumps(answers[name].get(key))[:300]}", file=sys.stderr)
+        else:
+            print(f"{name} matches {reference} on all {len(answers[reference])} reads", file=sys.stderr)
+    return 1 if failed else 0
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m backend.loadtest.storage_bench", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", default="memory,sqlite", help=f"Comma-separated, from {', '.join(ENGINES)}; the first is the reference")
+    parser.add_argument("--mongodb-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--servers", type=int, default=20)
+    parser.add_argument("--ratings", type=int, default=5000, help="Single ratings, and again as many in batches")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--reads", type=int, default=500, help="Rounds of timed reads")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="Also write the report as JSON here")
+    options = parser.parse_args(argv)
+    options.engines = [name.strip() for name in options.engines.split(",") if name.strip()]
+    unknown = [name for name in options.engines if name not in ENGINES]
+    if unknown:
+        parser.error(f"Unknown engine(s): {', '.join(unknown)}")
+    sys.exit(asyncio.run(main_async(options)))
+
+if __name__ == "__main__":
+    main()
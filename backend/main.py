@@ -1,48 +1,164 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Security, Header
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, HTTPException, Depends, status, Security, Header, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.security.api_key import APIKeyHeader
 from fastapi.middleware.cors import CORSMiddleware # Import CORS middleware
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any, Literal
+from typing import List, Optional, Dict, Any, Literal, Tuple
 from datetime import datetime, timezone
-from fastapi import Path
+from fastapi import Path, Query
 import secrets # For generating secure tokens
+import hashlib
+import asyncio
+import json
 
 from backend.core.config import settings
-import httpx
+from backend.core.lazy import lazy_import
 import urllib.parse
-from jose import JWTError, jwt
+from jose import JWTError # jose's package root only holds its exceptions; jwt itself is loaded on first use
 from datetime import timedelta # For token expiry
 
-import sys
-print(f"--- sys.path BEFORE imports ---")
-print(sys.path)
-print(f"-------------------------------")
+# Loaded on first use rather than at import (see backend/loadtest/startup_bench.py)
+httpx = lazy_import("httpx")
+jwt = lazy_import("jose.jwt")
 
 # Import database functions and models
 from backend.core.database import (
     init_db,
-    close_mongodb_connection,
+    close_db,
+    storage_health as db_storage_health,
     get_user as db_get_user,
+    USER_VIEWS,
+    get_users_by_ids as db_get_users_by_ids,
     upsert_user as db_upsert_user,
+    insert_user_if_missing as db_insert_user_if_missing,
+    update_user_fields as db_update_user_fields,
     update_user_api_key as db_update_user_api_key,
-    verify_user_api_key as db_verify_user_api_key,
-    get_server as db_get_server,
-    upsert_server as db_upsert_server,
-    db # Import the db object itself
+    hash_api_key,
+    hashed_digests_match,
+    apply_score_delta as db_apply_score_delta,
+    add_user_server as db_add_user_server,
+    update_server_info as db_update_server_info,
+    get_rated_users_with_profiles as db_get_rated_users_with_profiles,
+    remove_score_entry as db_remove_score_entry,
+    insert_rating_event as db_insert_rating_event,
+    insert_rating_events as db_insert_rating_events,
+    delete_rating_events as db_delete_rating_events,
+    find_rating_idempotency_keys as db_find_rating_idempotency_keys,
+    apply_score_deltas_bulk as db_apply_score_deltas_bulk,
+    apply_score_deltas_many as db_apply_score_deltas_many,
+    get_score_entries as db_get_score_entries,
+    get_rating_history as db_get_rating_history,
+    get_server_score_entries as db_get_server_score_entries,
+    get_rollup_series as db_get_rollup_series,
+    pick_rollup_resolution,
+    get_server_rating_history as db_get_server_rating_history,
+    find_servers_after as db_find_servers_after,
+    get_server_member_ids_page as db_get_server_member_ids_page,
+    find_members_by_ids as db_find_members_by_ids,
+    search_server_members as db_search_server_members
 )
+from backend.core.storage import apply_projection
+from backend.core.log import get_logger, setup_logging, shutdown_logging, RequestIdMiddleware
+from backend.core.cache import TTLCache, ByteBudgetCache, get_cache_stats
+from backend.core.singleflight import SingleFlight
+from backend.core.tierlist import TierListEngine, TierAssigner
+from backend.core.push import PushHub, user_topic, server_topic
+from backend.core.jobs import JobPool
+from backend.core.writebehind import ScoreDeltaBuffer
+from backend.core.metrics import InstrumentedRoute, render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from backend.core.profiler import SamplingProfiler, ProfilerMiddleware
+from backend.core.discord_client import (
+    open_discord_client,
+    close_discord_client,
+    get_discord_client,
+    bot_auth_headers,
+    discord_request,
+    rate_limiter as discord_rate_limiter,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BACKGROUND
+)
+
+logger = get_logger(__name__)
 
 app = FastAPI()
+# Every route declared below is timed and counted for /metrics
+app.router.route_class = InstrumentedRoute
+
+# --- Logging Startup Event ---
+# Registered first so everything after it logs through the queue
+@app.on_event("startup")
+async def startup_logging():
+    setup_logging()
+
+# --- Background Enrichment Workers ---
+# Registered before the DB/Discord hooks so workers are stopped before those close
+enrichment_pool = JobPool(
+    "enrichment",
+    workers=settings.ENRICHMENT_WORKERS,
+    max_queue=settings.ENRICHMENT_MAX_QUEUE,
+    max_attempts=settings.ENRICHMENT_MAX_ATTEMPTS,
+    retry_base_seconds=settings.ENRICHMENT_RETRY_BASE_SECONDS
+)
+
+@app.on_event("startup")
+async def startup_enrichment_pool():
+    enrichment_pool.start()
+
+@app.on_event("shutdown")
+async def shutdown_enrichment_pool():
+    await enrichment_pool.stop()
+
+# --- Write-Behind Score Buffer ---
+# With SCORE_WRITE_BEHIND on, plugin ratings are summed in memory and written in bulk
+score_buffer = ScoreDeltaBuffer(
+    db_apply_score_deltas_many,
+    db_insert_rating_events,
+    flush_interval=settings.SCORE_WRITE_BEHIND_FLUSH_SECONDS,
+    max_pending=settings.SCORE_WRITE_BEHIND_MAX_PENDING
+)
 
 # --- Database Startup/Shutdown Events ---
 @app.on_event("startup")
 async def startup_db_client():
-    await init_db()
+    await init_db(background=settings.FAST_STARTUP)
+    if settings.SCORE_WRITE_BEHIND:
+        score_buffer.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    await close_mongodb_connection()
+    # Buffered ratings go out before the connection closes
+    await score_buffer.close()
+    await close_db()
+
+# --- Discord HTTP Client Startup/Shutdown Events ---
+@app.on_event("startup")
+async def startup_discord_client():
+    await open_discord_client(on_demand=settings.FAST_STARTUP)
+
+@app.on_event("shutdown")
+async def shutdown_discord_client():
+    await close_discord_client()
+
+# --- Sampling Profiler ---
+# Idle until started through POST /admin/profiler/start
+profiler = SamplingProfiler(
+    interval=settings.PROFILER_SAMPLE_INTERVAL_MS / 1000,
+    max_stacks=settings.PROFILER_MAX_STACKS,
+    max_depth=settings.PROFILER_MAX_DEPTH,
+    blocking_threshold=settings.PROFILER_BLOCKING_THRESHOLD_MS / 1000,
+    max_blocking_events=settings.PROFILER_MAX_BLOCKING_EVENTS
+)
+
+@app.on_event("shutdown")
+async def shutdown_profiler():
+    await profiler.stop()
+
+# --- Logging Shutdown Event ---
+# Registered after the other shutdown hooks so their log lines are flushed too
+@app.on_event("shutdown")
+async def shutdown_logging_queue():
+    shutdown_logging()
 
 # --- CORS Middleware --- 
 # This should be among the first middleware added if you have multiple.
@@ -59,6 +175,12 @@ app.add_middleware(
     allow_headers=["*"],    # Allows all headers
 )
 
+# Tags every request with an id that shows up on all of its log lines
+app.add_middleware(RequestIdMiddleware)
+
+# Outermost, so a profiled request's stacks include the other middleware
+app.add_middleware(ProfilerMiddleware, profiler=profiler)
+
 # --- Pydantic Models ---
 
 class UserSocialCreditTarget(BaseModel):
@@ -129,28 +251,69 @@ class PluginRatingCreate(BaseModel):
     message_content_snippet: str # Added: Snippet from plugin
     # No reason field as per request
 
+class PluginRatingBatchCreate(BaseModel):
+    ratings: List[PluginRatingCreate] = Field(..., min_length=1)
+
+# One immutable entry in the ratings ledger
+class RatingEvent(BaseModel):
+    acting_user_id: str
+    target_user_id: str
+    score_delta: float
+    ts: datetime
+    source: Literal["plugin", "web"]
+    server_id: Optional[str] = None
+    channel_id: Optional[str] = None
+    message_id: Optional[str] = None
+    message_content_snippet: Optional[str] = None
+    reason: Optional[str] = None
+    idempotency_key: Optional[str] = None # Plugin ratings only; unique in the ledger
+
+class ScoreSeriesPoint(BaseModel):
+    ts: datetime # Start of the bucket
+    delta: float # Sum of score_delta in the bucket
+    count: int # Ratings in the bucket
+    cumulative: float # Running total of delta from the start of the range
+
+class ScoreSeries(BaseModel):
+    resolution: Literal["minute", "hour", "day"]
+    from_ts: datetime
+    to_ts: datetime
+    points: List[ScoreSeriesPoint] # Only buckets that had ratings
+
 # --- Response Models ---
 class PluginApiKeyResponse(BaseModel):
     api_key: str
     generated_at: datetime
 
+class PluginRatingBatchItemResult(BaseModel):
+    index: int # Position of the rating in the submitted batch
+    ok: bool
+    entry: Optional[UserSocialCreditTarget] = None # Score for the target after the whole batch was applied
+    detail: Optional[str] = None # Why the rating was rejected
+    duplicate: bool = False # Already applied earlier; not counted again
+
+class PluginRatingBatchResponse(BaseModel):
+    results: List[PluginRatingBatchItemResult]
+
 # --- NEW Response Model --- ADD THIS
 class RatedUserProfileResponse(BaseModel):
     profile: DiscordUserProfile
     current_score: float
 
-# --- In-Memory Database ---
-# For now, we'll use dictionaries to simulate MongoDB collections.
-# In a real application, these would be replaced with MongoDB operations.
-
-# db_users: Dict[str, User] = {}  # Keyed by user_id
-# db_servers: Dict[str, Server] = {} # Keyed by server_id
-
-# --- Sample Data ---
-# def initialize_sample_data(): - REMOVED
-    # ... entire function removed ...
+class TierListEntry(BaseModel):
+    user_id: str
+    username: Optional[str] = None
+    profile_picture_url: Optional[str] = None
+    score: float
+    rank: int # 1-based
+    tier: str
 
-# initialize_sample_data() # Initialize with sample data when the app starts - REMOVED
+class TierListResponse(BaseModel):
+    server_id: str
+    rater_user_id: Optional[str] = None # None for the server-wide list
+    mode: str
+    total: int # Entries on the whole board, not just the ones returned
+    entries: List[TierListEntry]
 
 # --- API Key Authentication for Plugin (Modified for Per-User Keys) ---
 USER_PLUGIN_API_KEY_HEADER_NAME = "X-Plugin-API-Key"
@@ -159,6 +322,14 @@ ACTING_USER_ID_HEADER_NAME = "X-Acting-User-ID"
 user_plugin_api_key_header = APIKeyHeader(name=USER_PLUGIN_API_KEY_HEADER_NAME, auto_error=False)
 acting_user_id_header = APIKeyHeader(name=ACTING_USER_ID_HEADER_NAME, auto_error=False) # Not a security scheme, just a header
 
+# Recently verified plugin keys: user_id -> {"key_hash", "user"}.
+# Keyed by user so generating or revoking a key can drop the entry without knowing the old key.
+plugin_auth_cache = TTLCache(
+    "plugin_auth",
+    max_entries=settings.PLUGIN_AUTH_CACHE_MAX_ENTRIES,
+    ttl=settings.PLUGIN_AUTH_CACHE_TTL_SECONDS
+)
+
 async def get_authenticated_plugin_user(
     user_provided_key: Optional[str] = Security(user_plugin_api_key_header),
     acting_user_id: Optional[str] = Header(None, alias=ACTING_USER_ID_HEADER_NAME)
@@ -168,103 +339,113 @@ async def get_authenticated_plugin_user(
     if not acting_user_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{ACTING_USER_ID_HEADER_NAME} header is missing")
 
-    # Ensure the acting user exists in the DB
-    user_dict = await ensure_user_in_db(acting_user_id) # Modified call, removed client passing
+    provided_key_hash = hash_api_key(user_provided_key)
+
+    # Fast path: this user's key was verified recently; no DB reads at all
+    cached = plugin_auth_cache.get(acting_user_id)
+    if cached is not None and hashed_digests_match(provided_key_hash, cached["key_hash"]):
+        return User(**cached["user"])
+
+    # Ensure the acting user exists in the DB (auth view: key hash and guild list, no scores)
+    user_dict = await ensure_user_in_db(acting_user_id, view="auth") # Modified call, removed client passing
     if not user_dict:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Acting user ID {acting_user_id} could not be established in the system.")
 
-    # Now, verify the provided API key against the one stored (hashed) for this user
-    is_valid = await db_verify_user_api_key(acting_user_id, user_provided_key)
-
-    if not is_valid:
+    # Now, verify the provided API key against the one stored (hashed) for this user.
+    # The document we just loaded already has the stored hash, so no second fetch is needed.
+    stored_key_hash = user_dict.get("plugin_api_key")
+    if not stored_key_hash or not hashed_digests_match(provided_key_hash, stored_key_hash):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid User Plugin API Key.")
 
     # Key is valid, return the user data (as a Pydantic model)
     # Important: The stored key is the HASH, don't return it! Create user model from fetched dict.
     user_dict.pop('plugin_api_key', None) # Don't expose hash
     user_dict.pop('_id', None) # Remove MongoDB internal ID
+    plugin_auth_cache.set(acting_user_id, {"key_hash": stored_key_hash, "user": user_dict})
     return User(**user_dict)
 
-# Helper function to ensure user exists in db_users, fetching from Discord if not
+# --- Single-Flight Groups ---
+# Concurrent lookups for the same key share one in-flight call
+user_lookup_flight = SingleFlight("user_lookup")
+guild_lookup_flight = SingleFlight("guild_lookup")
+message_fetch_flight = SingleFlight("message_fetch")
+
+# Helper function to ensure user exists in the database, fetching from Discord if not
 # Now returns the user dict from DB or None if fetch failed critically
-async def ensure_user_in_db(user_id_to_check: str) -> Optional[Dict[str, Any]]:
-    user = await db_get_user(user_id_to_check)
+# `view` names the USER_VIEWS projection the caller needs; most only need "profile".
+# Views must fit inside "auth": the score arrays are never loaded here.
+async def ensure_user_in_db(user_id_to_check: str, view: str = "profile") -> Optional[Dict[str, Any]]:
+    # Keyed on the user alone: concurrent first-time requests for one user make one
+    # DB read, one Discord call and one upsert, whatever views they asked for
+    user = await user_lookup_flight.do(
+        user_id_to_check,
+        lambda: _ensure_user_in_db(user_id_to_check, USER_VIEWS["auth"])
+    )
+    # Callers share the result; projecting gives each its own copy, since some pop fields off it
+    return apply_projection(dict(user), USER_VIEWS[view]) if user else user
+
+def minimal_user_data(user_id: str) -> Dict[str, Any]:
+    """Placeholder user document for someone we couldn't (or haven't yet) looked up on Discord."""
+    return {
+        "user_id": user_id,
+        "username": f"User_{user_id[:6]}",
+        "profile_picture_url": None,
+        "social_credits_given": [],
+        "servers": [],
+        "plugin_api_key": None,
+        "plugin_api_key_generated_at": None
+    }
+
+async def _ensure_user_in_db(user_id_to_check: str, projection: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    user = await db_get_user(user_id_to_check, projection)
     if user:
         return user # User already exists
 
-    print(f"User {user_id_to_check} not in DB. Attempting to fetch/create.")
+    logger.debug("User %s not in DB. Attempting to fetch/create.", user_id_to_check)
 
     # Attempt to fetch from Discord API
     if not settings.DISCORD_BOT_TOKEN:
-        print(f"WARNING: Cannot fetch profile for new user {user_id_to_check} - Bot token not configured.")
+        logger.warning("Cannot fetch profile for new user %s - Bot token not configured.", user_id_to_check)
         # Add a minimal user entry
-        minimal_user_data = {
-            "user_id": user_id_to_check,
-            "username": f"User_{user_id_to_check[:6]}",
-            "profile_picture_url": None,
-            "social_credits_given": [],
-            "servers": [], # Should be empty for a new minimal user
-            "plugin_api_key": None,
-            "plugin_api_key_generated_at": None
-        }
-        await db_upsert_user(minimal_user_data)
-        print(f"Added minimal entry for user {user_id_to_check} due to missing bot token.")
-        return await db_get_user(user_id_to_check)
+        await db_upsert_user(minimal_user_data(user_id_to_check))
+        logger.info("Added minimal entry for user %s due to missing bot token.", user_id_to_check)
+        return await db_get_user(user_id_to_check, projection)
 
-    discord_api_url = f"https://discord.com/api/v10/users/{user_id_to_check}"
-    headers_bot_auth = {"Authorization": f"Bot {settings.DISCORD_BOT_TOKEN}"} # Renamed to avoid confusion with OAuth headers
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(discord_api_url, headers=headers_bot_auth)
-            if response.status_code == 200:
-                user_data = response.json()
-                username = user_data.get("username", f"User_{user_id_to_check[:6]}")
-                avatar_hash = user_data.get("avatar")
-                avatar_full_url = None
-                if avatar_hash:
-                    extension = "gif" if avatar_hash.startswith("a_") else "png"
-                    avatar_full_url = f"https://cdn.discordapp.com/avatars/{user_id_to_check}/{avatar_hash}.{extension}?size=128"
+    discord_api_url = f"/users/{user_id_to_check}"
+    headers_bot_auth = bot_auth_headers() # Renamed to avoid confusion with OAuth headers
+    try:
+        response = await discord_request("GET", discord_api_url, headers=headers_bot_auth)
+        if response.status_code == 200:
+            user_data = response.json()
+            username = user_data.get("username", f"User_{user_id_to_check[:6]}")
+            avatar_hash = user_data.get("avatar")
+            avatar_full_url = None
+            if avatar_hash:
+                extension = "gif" if avatar_hash.startswith("a_") else "png"
+                avatar_full_url = f"https://cdn.discordapp.com/avatars/{user_id_to_check}/{avatar_hash}.{extension}?size=128"
                 
-                new_user_data = {
-                    "user_id": user_id_to_check,
-                    "username": username,
-                    "profile_picture_url": avatar_full_url,
-                    "social_credits_given": [],
-                    "servers": [], # Default to empty, servers are populated by OAuth callback or plugin activity
-                    "plugin_api_key": None,
-                    "plugin_api_key_generated_at": None
-                }
-                await db_upsert_user(new_user_data)
-                print(f"Fetched and added new user {username} (ID: {user_id_to_check}) to DB.")
-                return await db_get_user(user_id_to_check)
-            else:
-                print(f"Failed to fetch profile for new user {user_id_to_check} from Discord (Status: {response.status_code}). Adding minimal entry.")
-                # Add minimal user
-                minimal_user_data = {
-                    "user_id": user_id_to_check,
-                    "username": f"User_{user_id_to_check[:6]}",
-                     "profile_picture_url": None,
-                    "social_credits_given": [],
-                    "servers": [],
-                    "plugin_api_key": None,
-                    "plugin_api_key_generated_at": None
-                }
-                await db_upsert_user(minimal_user_data)
-                return await db_get_user(user_id_to_check)
-        except Exception as e:
-            print(f"Error fetching profile for new user {user_id_to_check}: {e}. Adding minimal entry.")
+            new_user_data = {
+                "user_id": user_id_to_check,
+                "username": username,
+                "profile_picture_url": avatar_full_url,
+                "social_credits_given": [],
+                "servers": [], # Default to empty, servers are populated by OAuth callback or plugin activity
+                "plugin_api_key": None,
+                "plugin_api_key_generated_at": None
+            }
+            await db_upsert_user(new_user_data)
+            logger.info("Fetched and added new user %s (ID: %s) to DB.", username, user_id_to_check)
+            return await db_get_user(user_id_to_check, projection)
+        else:
+            logger.warning("Failed to fetch profile for new user %s from Discord (Status: %s). Adding minimal entry.", user_id_to_check, response.status_code)
             # Add minimal user
-            minimal_user_data = {
-                    "user_id": user_id_to_check,
-                    "username": f"User_{user_id_to_check[:6]}",
-                     "profile_picture_url": None,
-                    "social_credits_given": [],
-                    "servers": [],
-                    "plugin_api_key": None,
-                    "plugin_api_key_generated_at": None
-                }
-            await db_upsert_user(minimal_user_data)
-            return await db_get_user(user_id_to_check)
+            await db_upsert_user(minimal_user_data(user_id_to_check))
+            return await db_get_user(user_id_to_check, projection)
+    except Exception as e:
+        logger.warning("Error fetching profile for new user %s: %s. Adding minimal entry.", user_id_to_check, e)
+        # Add minimal user
+        await db_upsert_user(minimal_user_data(user_id_to_check))
+        return await db_get_user(user_id_to_check, projection)
 
 # --- OAuth Helper --- 
 # Need a way to get the DB for creating tokens/handling callbacks
@@ -288,7 +469,7 @@ async def auth_discord_callback(code: str, state: Optional[str] = None):
     Handles the callback from Discord after user authorization.
     Exchanges the authorization code for an access token and fetches user info.
     """
-    token_url = 'https://discord.com/api/v10/oauth2/token'
+    token_url = '/oauth2/token'
     payload = {
         "client_id": settings.DISCORD_CLIENT_ID,
         "client_secret": settings.DISCORD_CLIENT_SECRET,
@@ -301,113 +482,145 @@ async def auth_discord_callback(code: str, state: Optional[str] = None):
         'Content-Type': 'application/x-www-form-urlencoded'
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            # 1. Exchange code for token
-            response = await client.post(token_url, data=payload, headers=headers)
-            if response.status_code != 200:
-                print(f"Error exchanging code: {response.status_code} {response.text}")
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to exchange Discord code for token")
-            token_data = response.json()
-            access_token = token_data['access_token']
-
-            # 2. Get user info from Discord using the access token
-            user_info_url = 'https://discord.com/api/v10/users/@me'
-            headers = {'Authorization': f'Bearer {access_token}'}
-            response = await client.get(user_info_url, headers=headers)
-            if response.status_code != 200:
-                print(f"Error fetching user info: {response.status_code} {response.text}")
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to fetch user info from Discord")
-            user_info = response.json()
-            user_id = user_info['id']
-
-            # 2.5. Get user's guilds (servers) from Discord
-            user_guilds_list: List[Dict[str, Any]] = []
-            guilds_url = settings.DISCORD_USER_GUILDS_URL
-            # OAuth headers are already defined as 'headers' variable with the Bearer token
-            guilds_response = await client.get(guilds_url, headers=headers) 
-            if guilds_response.status_code == 200:
-                raw_guilds_data = guilds_response.json()
-                for guild_data in raw_guilds_data:
-                    user_guilds_list.append({
-                        "id": guild_data["id"],
-                        "name": guild_data["name"],
-                        "icon": guild_data.get("icon")
-                    })
-                print(f"Fetched {len(user_guilds_list)} guilds for user {user_id}.") # Corrected: use user_id
-            else:
-                print(f"Warning: Failed to fetch guilds for user {user_id}. Status: {guilds_response.status_code} - {guilds_response.text}") # Corrected: use user_id
-
-            # 3. Upsert user in our database
-            # Construct avatar URL
-            avatar_hash = user_info.get("avatar")
-            avatar_full_url = None
-            if avatar_hash:
-                extension = "gif" if avatar_hash.startswith("a_") else "png"
-                avatar_full_url = f"https://cdn.discordapp.com/avatars/{user_id}/{avatar_hash}.{extension}?size=128"
-            
-            # Check if user already exists to preserve fields like servers/credits
-            existing_user_dict = await db_get_user(user_id)
+    client = get_discord_client()
+    try:
+        # 1. Exchange code for token
+        response = await client.post(token_url, data=payload, headers=headers)
+        if response.status_code != 200:
+            logger.error("Error exchanging code: %s %s", response.status_code, response.text)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to exchange Discord code for token")
+        token_data = response.json()
+        access_token = token_data['access_token']
+
+        # 2. Get user info from Discord using the access token
+        user_info_url = '/users/@me'
+        headers = {'Authorization': f'Bearer {access_token}'}
+        response = await client.get(user_info_url, headers=headers)
+        if response.status_code != 200:
+            logger.error("Error fetching user info: %s %s", response.status_code, response.text)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to fetch user info from Discord")
+        user_info = response.json()
+        user_id = user_info['id']
+
+        # 2.5. Get user's guilds (servers) from Discord
+        user_guilds_list: List[Dict[str, Any]] = []
+        guilds_url = settings.DISCORD_USER_GUILDS_URL
+        # OAuth headers are already defined as 'headers' variable with the Bearer token
+        guilds_response = await client.get(guilds_url, headers=headers) 
+        if guilds_response.status_code == 200:
+            raw_guilds_data = guilds_response.json()
+            for guild_data in raw_guilds_data:
+                user_guilds_list.append({
+                    "id": guild_data["id"],
+                    "name": guild_data["name"],
+                    "icon": guild_data.get("icon")
+                })
+            logger.debug("Fetched %s guilds for user %s.", len(user_guilds_list), user_id)
+        else:
+            logger.warning("Failed to fetch guilds for user %s. Status: %s - %s", user_id, guilds_response.status_code, guilds_response.text)
+
+        # 3. Upsert user in our database
+        # Construct avatar URL
+        avatar_hash = user_info.get("avatar")
+        avatar_full_url = None
+        if avatar_hash:
+            extension = "gif" if avatar_hash.startswith("a_") else "png"
+            avatar_full_url = f"https://cdn.discordapp.com/avatars/{user_id}/{avatar_hash}.{extension}?size=128"
             
-            user_data_for_db = {
-                "user_id": user_id,
-                "username": user_info.get("username", f"User_{user_id[:6]}"),
-                "profile_picture_url": avatar_full_url,
-                # Preserve existing fields if user exists, otherwise initialize/update
-                "social_credits_given": existing_user_dict.get("social_credits_given", []) if existing_user_dict else [],
-                "servers": user_guilds_list if user_guilds_list else (existing_user_dict.get("servers", []) if existing_user_dict else []),
-                # Preserve API key info if user exists
-                "plugin_api_key": existing_user_dict.get("plugin_api_key") if existing_user_dict else None,
-                "plugin_api_key_generated_at": existing_user_dict.get("plugin_api_key_generated_at") if existing_user_dict else None
-            }
+        user_data_for_db = {
+            "user_id": user_id,
+            "username": user_info.get("username", f"User_{user_id[:6]}"),
+            "profile_picture_url": avatar_full_url,
+        }
+        if user_guilds_list:
+            user_data_for_db["servers"] = user_guilds_list
 
-            await db_upsert_user(user_data_for_db)
-
-            # 4. Create JWT token for our frontend
-            jwt_data = {"sub": user_id} # Using Discord user ID as subject
-            jwt_token = create_access_token(data=jwt_data)
-
-            # 5. Redirect user back to frontend with the JWT token
-            # Important: Do NOT put the token directly in the URL fragment like this in production.
-            # Use a more secure method like posting to a redirect handler page
-            # or using HttpOnly cookies if frontend and backend are same-site.
-            # For this example, we'll use a URL fragment.
-            redirect_url = f"{settings.FRONTEND_REDIRECT_URI}?token={jwt_token}" # Send token as query param
-            return RedirectResponse(url=redirect_url)
-
-        except httpx.HTTPStatusError as e:
-            # Log the error details from Discord if possible
-            error_detail = e.response.json() if e.response else str(e)
-            print(f"Discord API Error: {error_detail}") # Log to server console
-            raise HTTPException(status_code=e.response.status_code, detail=f"Error communicating with Discord: {str(error_detail)}")
-        except Exception as e:
-            print(f"Generic error in Discord callback: {e}") # Log to server console
-            raise HTTPException(status_code=500, detail=f"An unexpected error occurred during Discord authentication: {str(e)}")
+        # Credits, API key info and (if the guild fetch failed) servers are only initialized for
+        # new users; existing values are preserved server-side, so the document isn't read first
+        await db_upsert_user(user_data_for_db, defaults={
+            "social_credits_given": [],
+            "servers": [],
+            "plugin_api_key": None,
+            "plugin_api_key_generated_at": None
+        })
+
+        # 4. Create JWT token for our frontend
+        jwt_data = {"sub": user_id} # Using Discord user ID as subject
+        jwt_token = create_access_token(data=jwt_data)
+
+        # 5. Redirect user back to frontend with the JWT token
+        # Important: Do NOT put the token directly in the URL fragment like this in production.
+        # Use a more secure method like posting to a redirect handler page
+        # or using HttpOnly cookies if frontend and backend are same-site.
+        # For this example, we'll use a URL fragment.
+        redirect_url = f"{settings.FRONTEND_REDIRECT_URI}?token={jwt_token}" # Send token as query param
+        return RedirectResponse(url=redirect_url)
+
+    except httpx.HTTPStatusError as e:
+        # Log the error details from Discord if possible
+        error_detail = e.response.json() if e.response else str(e)
+        logger.error("Discord API Error: %s", error_detail)
+        raise HTTPException(status_code=e.response.status_code, detail=f"Error communicating with Discord: {str(error_detail)}")
+    except Exception as e:
+        logger.error("Generic error in Discord callback: %s", e)
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred during Discord authentication: {str(e)}")
+
+# --- Request-Scoped Identity ---
+# Verified tokens: token -> user_id, each entry expiring with the token's own exp
+verified_token_cache = TTLCache(
+    "verified_tokens",
+    max_entries=settings.JWT_VERIFIED_TOKEN_CACHE_MAX_ENTRIES,
+    ttl=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
 
-# Helper function to get current user from token
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+# Helper function to get the authenticated user ID from token, without touching the DB.
+# Each token is decoded and verified once, then served from verified_token_cache until it expires.
+async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
+    return verify_access_token(token)
+
+def verify_access_token(token: str) -> str:
+    user_id = verified_token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-        user_id: str = payload.get("sub")
+        user_id = payload.get("sub")
         if user_id is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
-    
+        raise _credentials_exception()
+
+    expires_in = payload.get("exp", 0) - datetime.now(timezone.utc).timestamp()
+    if expires_in > 0:
+        verified_token_cache.set(token, user_id, ttl=expires_in)
+    return user_id
+
+# Helper function to load the authenticated user's raw document (auth view: no score arrays).
+# FastAPI caches dependency results per request, so every dependency and handler
+# asking for it shares a single DB read.
+async def get_current_user_doc(user_id: str = Depends(get_current_user_id)) -> Dict[str, Any]:
     # Fetch user from DB instead of in-memory dict
-    user_dict = await db_get_user(user_id)
+    user_dict = await db_get_user(user_id, USER_VIEWS["auth"])
     if user_dict is None:
-        print(f"User ID {user_id} from valid JWT not found in DB!") # Should not happen if OAuth callback works
+        logger.warning("User ID %s from valid JWT not found in DB!", user_id) # Should not happen if OAuth callback works
         # Optionally, try ensure_user_in_db here?
         # Or just raise error, as user should exist post-login.
-        raise credentials_exception # Treat as invalid credentials if user vanished from DB
-    
-    # Remove sensitive/internal fields before returning
+        raise _credentials_exception() # Treat as invalid credentials if user vanished from DB
+    return user_dict
+
+# Helper function to get current user from token.
+# social_credits_given is not loaded here; endpoints that return it read the scores view themselves.
+async def get_current_user(user_dict: Dict[str, Any] = Depends(get_current_user_doc)) -> User:
+    # Remove sensitive/internal fields before returning (on a copy; the raw doc is shared within the request)
+    user_dict = dict(user_dict)
     user_dict.pop('_id', None)
     user_dict.pop('plugin_api_key', None) # Don't expose hash
     
@@ -419,6 +632,35 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
 async def read_root():
     return {"message": "Hello from the Social Credit Backend"}
 
+# --- Health Probes ---
+@app.get("/health/live")
+async def read_liveness():
+    """200 whenever the process is serving requests."""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def read_readiness(response: Response):
+    """200 once storage is prepared and answers a ping; 503 before that or while it is unreachable."""
+    storage = await db_storage_health()
+    if not storage["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": "ready" if storage["ready"] else "not_ready", "storage": storage}
+
+@app.get("/cache/stats")
+async def read_cache_stats():
+    """Hit/miss/refresh counters for the in-process caches."""
+    return get_cache_stats()
+
+@app.get("/discord/rate-limits/stats")
+async def read_discord_rate_limit_stats():
+    """Queue depth and throttling counters for the Discord request scheduler."""
+    return discord_rate_limiter.stats()
+
+@app.get("/metrics")
+async def read_metrics():
+    """Route, storage and Discord latency histograms plus cache counters, in Prometheus text format."""
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 # --- OAuth Endpoints ---
 
 @app.get("/auth/discord/login")
@@ -439,11 +681,19 @@ async def auth_discord_login():
 
 # --- User Endpoints ---
 @app.get("/users/me", response_model=User)
-async def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user_id: str = Depends(get_current_user_id)):
     """
     Get the details of the currently authenticated user.
     """
-    return current_user
+    # The one endpoint that needs the whole document (minus the key hash)
+    user_dict, pending = await score_buffer.read_with_pending(
+        current_user_id, lambda: db_get_user(current_user_id, {"_id": 0, "plugin_api_key": 0})
+    )
+    if user_dict is None:
+        logger.warning("User ID %s from valid JWT not found in DB!", current_user_id)
+        raise _credentials_exception()
+    user_dict["social_credits_given"] = merge_pending_scores(user_dict.get("social_credits_given", []), pending)
+    return User(**user_dict)
 
 @app.get("/users/me/tracked-servers", response_model=List[UserServerInfo])
 async def read_user_tracked_servers(current_user: User = Depends(get_current_user)):
@@ -451,20 +701,53 @@ async def read_user_tracked_servers(current_user: User = Depends(get_current_use
     Get the list of servers the authenticated user has (initially fetched from Discord).
     In the future, this could be a list of servers the user explicitly tracks in this app.
     """
-    # The current_user object fetched by dependency contains server info
-    # Need to make sure the User model loaded by get_current_user includes `servers`
-    # Assuming `get_user` retrieves the full user document including the `servers` array
+    # `servers` is part of the auth view that get_current_user loads
     return current_user.servers
 
+def _with_pending_delta(entry: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    server_ids = list(entry.get("associated_server_ids") or [])
+    server_ids += [server_id for server_id in sorted(delta["server_ids"]) if server_id not in server_ids]
+    return dict(entry, current_score=entry.get("current_score", 0.0) + delta["score_delta"], associated_server_ids=server_ids)
+
+def merge_pending_scores(entries: List[Dict[str, Any]], pending: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Apply deltas still waiting in the write-behind buffer to score entries read from the DB.
+    Targets that so far only exist in the buffer are appended as new entries. Take
+    entries and pending from one score_buffer.read_with_pending() call.
+    """
+    if not pending:
+        return entries
+    merged = []
+    for entry in entries:
+        delta = pending.pop(entry.get("target_user_id"), None)
+        merged.append(_with_pending_delta(entry, delta) if delta else entry)
+    for target_user_id, delta in pending.items():
+        merged.append(_with_pending_delta(_new_score_entry(target_user_id), delta))
+    return merged
+
+def _new_score_entry(target_user_id: str) -> Dict[str, Any]:
+    return {"target_user_id": target_user_id, "current_score": 0.0, "associated_server_ids": []}
+
+async def get_score_entries_with_pending(acting_user_id: str, target_ids: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Stored entries for target_ids plus whatever is still buffered for them; None if the acting user doesn't exist."""
+    entries, pending = await score_buffer.read_with_pending(acting_user_id, lambda: db_get_score_entries(acting_user_id, target_ids))
+    if entries is None:
+        return None
+    for target_user_id in target_ids:
+        delta = pending.get(target_user_id)
+        if delta:
+            entries[target_user_id] = _with_pending_delta(entries.get(target_user_id) or _new_score_entry(target_user_id), delta)
+    return entries
+
 @app.post("/users/{acting_user_id}/credit/{target_user_id}", response_model=UserSocialCreditTarget)
 async def give_social_credit(
     acting_user_id: str,  # Path parameter, taken from URL
     target_user_id: str,  # Path parameter, taken from URL
     update_request: SocialCreditUpdateRequest, # Request body
-    current_user: User = Depends(get_current_user) # Authenticated user
+    current_user_id: str = Depends(get_current_user_id) # Authenticated user; the atomic update below needs no user doc
 ):
     # Validate that the path acting_user_id matches the authenticated user
-    if acting_user_id != current_user.user_id:
+    if acting_user_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Acting user ID does not match authenticated user"
@@ -475,41 +758,23 @@ async def give_social_credit(
     if not target_user_dict:
          raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Target user {target_user_id} could not be established.")
 
-    # Fetch the acting user's current data from DB (current_user is from JWT, might be slightly stale)
-    acting_user_dict = await db_get_user(acting_user_id)
-    if not acting_user_dict:
-        # Should not happen if get_current_user worked
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Authenticated user not found in DB.")
-
-    # Find or create the social credit target entry within the acting user's document
-    social_credits_given = acting_user_dict.get("social_credits_given", [])
-    target_entry = None
-    for entry in social_credits_given:
-        if entry.get("target_user_id") == target_user_id:
-            target_entry = entry
-            break
-
-    # If no existing entry for this target, create a new one
+    # Atomically increment (or create) the acting user's entry for this target.
+    target_entry = await db_apply_score_delta(acting_user_id, target_user_id, update_request.score_delta)
     if target_entry is None:
-        target_entry = {
-            "target_user_id": target_user_id,
-            "current_score": 0.0 # Initialize current_score
-        }
-        social_credits_given.append(target_entry)
-        # No need to update target_entry_index here, direct modification of target_entry is fine
-
-    # Calculate the new absolute score
-    # If target_entry was just created, current_score is 0.0. 
-    # For existing entries, default to 0.0 if current_score is missing.
-    existing_score = target_entry.get("current_score", 0.0)
-    new_score = existing_score + update_request.score_delta
-
-    # Update the current_score directly in the target_entry
-    target_entry["current_score"] = new_score
-    # The reason from update_request is not stored in this model anymore
-
-    # Update the acting user's document in the database
-    await db_upsert_user(acting_user_dict) # Upsert the whole user doc with updated credits
+        # Token was valid but its user document no longer exists
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Authenticated user not found in DB.")
+    tier_engine.record(acting_user_id, target_user_id, target_entry)
+    publish_score_change(acting_user_id, target_user_id, target_entry, update_request.score_delta)
+
+    # Record the rating in the ledger (the reason lives here, not on the running score)
+    await db_insert_rating_event(RatingEvent(
+        acting_user_id=acting_user_id,
+        target_user_id=target_user_id,
+        score_delta=update_request.score_delta,
+        ts=datetime.now(timezone.utc),
+        source="web",
+        reason=update_request.reason
+    ).model_dump())
 
     # Return the updated target entry (convert back to Pydantic model)
     return UserSocialCreditTarget(**target_entry)
@@ -518,162 +783,465 @@ async def give_social_credit(
 async def untrack_user_and_delete_history(
     acting_user_id: str,
     target_user_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user_id: str = Depends(get_current_user_id)
 ):
     """
     Removes the entire social credit history given by the acting_user to the target_user,
     effectively "untracking" them from the acting_user's perspective in terms of scores.
     """
-    if acting_user_id != current_user.user_id:
+    if acting_user_id != current_user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Acting user ID does not match authenticated user"
         )
 
-    # Fetch the acting user's data
-    acting_user_dict = await db_get_user(acting_user_id)
-    if not acting_user_dict:
+    # Buffered deltas for the pair would otherwise re-create the entry on the next flush
+    await score_buffer.discard(acting_user_id, target_user_id)
+    # $pull the entry server-side instead of rewriting the whole user document
+    removed = await db_remove_score_entry(acting_user_id, target_user_id)
+    if removed is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Acting user not found")
+    if removed:
+        tier_engine.remove(acting_user_id, target_user_id)
+        push_hub.publish(
+            [user_topic(acting_user_id)],
+            ("score", acting_user_id, target_user_id),
+            {"type": "score_removed", "acting_user_id": acting_user_id, "target_user_id": target_user_id}
+        )
 
-    social_credits_given = acting_user_dict.get("social_credits_given", [])
-    initial_length = len(social_credits_given)
-
-    # Filter out the entry for the target user
-    updated_social_credits = [entry for entry in social_credits_given if entry.get("target_user_id") != target_user_id]
-
-    if len(updated_social_credits) == initial_length:
+    if not removed:
         # No entry was found for the target user, still return success (idempotent)
-        print(f"No tracking entry found for target {target_user_id} under user {acting_user_id}, no action needed.")
+        logger.debug("No tracking entry found for target %s under user %s, no action needed.", target_user_id, acting_user_id)
         # Return 204 No Content implicitly
         return
 
-    # Update the user's social credits list
-    acting_user_dict["social_credits_given"] = updated_social_credits
-
-    # Update the user document in the database
-    await db_upsert_user(acting_user_dict)
-
-    print(f"Removed tracking and history for target {target_user_id} by user {acting_user_id}")
+    logger.info("Removed tracking and history for target %s by user %s", target_user_id, acting_user_id)
     # Return 204 No Content implicitly by FastAPI if no body is returned
     return None
 
+# --- Server Listings ---
+# Both listings use keyset pagination: pass the last ID you got as ?after= to get the next page.
+# A full page sets X-Next-After to that ID; no header means there is nothing more.
+# ?format=ndjson streams every remaining document instead, one JSON object per line.
+NEXT_PAGE_HEADER = "X-Next-After"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+ListingFormat = Literal["json", "ndjson"]
+
+def _page_limit(limit: Optional[int]) -> int:
+    return limit if limit is not None else settings.LISTING_DEFAULT_PAGE_SIZE
+
 @app.get("/servers", response_model=List[Server])
-async def get_servers():
-    # This needs rethinking. How do we get *all* servers?
-    # Querying the entire collection might be inefficient for very large numbers of servers.
-    # For now, let's fetch all servers. Add pagination or filtering if performance becomes an issue.
-    if db is None: # Corrected check: Use 'is None'
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database not available")
-    
-    servers_cursor = db[settings.MONGODB_SERVER_COLLECTION].find()
-    servers_list = await servers_cursor.to_list(length=None) # Fetch all servers; use a sensible limit in production
-    # Remove MongoDB internal ID before returning
-    for server in servers_list:
-        server.pop('_id', None)
+async def get_servers(
+    response: Response,
+    after: Optional[str] = Query(None, description="Return servers whose ID sorts after this one"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.LISTING_MAX_PAGE_SIZE),
+    format: ListingFormat = Query("json")
+):
+    """List servers in server_id order, a page at a time or as an NDJSON stream."""
+    if format == "ndjson":
+        cursor = db_find_servers_after(after, limit or 0, batch_size=settings.LISTING_STREAM_BATCH_SIZE)
+
+        async def stream_servers():
+            # One document in memory at a time, whatever the size of the collection
+            async for server in cursor:
+                yield Server(**server).model_dump_json() + "\n"
+
+        return StreamingResponse(stream_servers(), media_type=NDJSON_MEDIA_TYPE)
+
+    page_size = _page_limit(limit)
+    servers_list = await db_find_servers_after(after, page_size, batch_size=page_size).to_list(length=page_size)
+    if len(servers_list) == page_size:
+        response.headers[NEXT_PAGE_HEADER] = servers_list[-1]["server_id"]
     return [Server(**server) for server in servers_list]
 
+async def _stream_server_members(server_id: str, member_ids: List[str], limit: Optional[int]):
+    # Walks the member list one ID page at a time, so memory is bounded by the batch size
+    sent = 0
+    while member_ids:
+        async for user in db_find_members_by_ids(member_ids):
+            yield User(**user).model_dump_json() + "\n"
+            sent += 1
+        if len(member_ids) < settings.LISTING_STREAM_BATCH_SIZE:
+            return
+        batch_size = settings.LISTING_STREAM_BATCH_SIZE if limit is None else min(settings.LISTING_STREAM_BATCH_SIZE, limit - sent)
+        if batch_size <= 0:
+            return
+        member_ids = await db_get_server_member_ids_page(server_id, member_ids[-1], batch_size) or []
+
 @app.get("/servers/{server_id}/users", response_model=List[User])
-async def get_server_users(server_id: str):
-    # Fetch the server document
-    server_dict = await db_get_server(server_id)
-    if not server_dict:
+async def get_server_users(
+    server_id: str,
+    response: Response,
+    after: Optional[str] = Query(None, description="Return members whose user ID sorts after this one"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.LISTING_MAX_PAGE_SIZE),
+    format: ListingFormat = Query("json")
+):
+    """
+    List a server's members in user_id order, a page at a time or as an NDJSON stream.
+
+    Members are listed without their social_credits_given history; use the
+    /users/{user_id}/credit/given endpoints for that.
+    """
+    if format == "ndjson":
+        page_size = settings.LISTING_STREAM_BATCH_SIZE if limit is None else min(settings.LISTING_STREAM_BATCH_SIZE, limit)
+    else:
+        page_size = _page_limit(limit)
+
+    # Fetched before any response is started so a missing server is still a 404
+    member_ids = await db_get_server_member_ids_page(server_id, after, page_size)
+    if member_ids is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Server {server_id} not found")
 
-    user_ids = server_dict.get("user_ids", [])
-    if not user_ids:
-        return []
+    if format == "ndjson":
+        return StreamingResponse(_stream_server_members(server_id, member_ids, limit), media_type=NDJSON_MEDIA_TYPE)
 
-    # Fetch user details for each user ID
-    # This can be inefficient (N+1 problem). Consider optimizing if needed.
-    # Need to import db here as well, or use a db connection from a dependency?
-    # Let's import db for now.
-    if db is None:
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database not available")
-    users_cursor = db[settings.MONGODB_USER_COLLECTION].find({"user_id": {"$in": user_ids}})
-    users_list = await users_cursor.to_list(length=len(user_ids))
-    # Remove sensitive fields
-    for user in users_list:
-        user.pop('_id', None)
-        user.pop('plugin_api_key', None)
+    if not member_ids:
+        return []
+    users_list = await db_find_members_by_ids(member_ids).to_list(length=len(member_ids))
+    if len(member_ids) == page_size:
+        # Cursor is the last member ID of the page, even if that user has no document
+        response.headers[NEXT_PAGE_HEADER] = member_ids[-1]
     return [User(**user) for user in users_list]
 
+# --- Tier Lists ---
+# Per-server boards kept sorted in memory; each rating moves one entry instead of re-sorting
+async def _load_server_score_entries(server_id: str) -> List[Dict[str, Any]]:
+    # Write out buffered deltas first so the loaded board includes them
+    await score_buffer.flush()
+    return await db_get_server_score_entries(server_id)
+
+tier_engine = TierListEngine(
+    _load_server_score_entries,
+    TierAssigner(
+        settings.TIERLIST_MODE,
+        settings.TIERLIST_QUANTILES if settings.TIERLIST_MODE == "quantile" else settings.TIERLIST_THRESHOLDS
+    )
+)
+
+@app.get("/servers/{server_id}/tierlist", response_model=TierListResponse)
+async def get_server_tierlist(
+    server_id: str,
+    rater: Optional[str] = Query(None, description="Only this user's ratings; default is everyone's, summed"),
+    limit: int = Query(100, ge=1, le=settings.TIERLIST_MAX_LIMIT)
+):
+    """
+    Top `limit` users of a server's tier list with their score, rank and tier.
+
+    The first request for a server loads its ratings; after that the list is
+    kept up to date by every rating and this is O(limit).
+    """
+    total, entries = await tier_engine.top(server_id, limit, acting_user_id=rater)
+    # Names and avatars for just the users returned
+    profiles = {
+        user["user_id"]: user
+        for user in await db_get_users_by_ids(
+            [entry["user_id"] for entry in entries],
+            {"_id": 0, "user_id": 1, "username": 1, "profile_picture_url": 1}
+        )
+    }
+    return TierListResponse(
+        server_id=server_id,
+        rater_user_id=rater,
+        mode=tier_engine.assigner.mode,
+        total=total,
+        entries=[
+            TierListEntry(
+                **entry,
+                username=profiles.get(entry["user_id"], {}).get("username"),
+                profile_picture_url=profiles.get(entry["user_id"], {}).get("profile_picture_url")
+            )
+            for entry in entries
+        ]
+    )
+
+@app.get("/tierlist/stats")
+async def read_tierlist_stats():
+    """Loaded servers and update counters for the tier list engine."""
+    return tier_engine.stats()
+
+# --- Push Events ---
+# Score changes are pushed to subscribers of the rater, the target and the target's servers
+push_hub = PushHub(max_pending=settings.PUSH_MAX_PENDING_EVENTS)
+
+def publish_score_change(
+    acting_user_id: str,
+    target_user_id: str,
+    entry: Dict[str, Any],
+    score_delta: float,
+    server_id: Optional[str] = None
+) -> None:
+    topics = [user_topic(acting_user_id), user_topic(target_user_id)]
+    topics.extend(server_topic(associated) for associated in entry.get("associated_server_ids") or [])
+    push_hub.publish(
+        topics,
+        # Pending changes to the same (rater, target) in the same server coalesce into the latest score
+        ("score", acting_user_id, target_user_id, server_id),
+        {
+            "type": "score",
+            "acting_user_id": acting_user_id,
+            "target_user_id": target_user_id,
+            "current_score": entry.get("current_score"),
+            "score_delta": score_delta,
+            "server_id": server_id,
+            "ts": datetime.now(timezone.utc).isoformat()
+        }
+    )
+
+@app.get("/events/stream")
+async def stream_events(
+    token: str = Query(..., description="App access token (EventSource can't send headers)"),
+    server_id: List[str] = Query([], description="Also receive score changes in these servers")
+):
+    """
+    Server-Sent Events stream of score changes for the authenticated user and
+    the requested servers (only servers the user is a member of).
+
+    Events: "score" (a score the user gave or received changed), "score_removed",
+    and "resync" (events were dropped because the client fell behind; refetch).
+    A comment line is sent every PUSH_HEARTBEAT_SECONDS to keep proxies from
+    closing idle connections.
+    """
+    user_id = verify_access_token(token)
+    topics = [user_topic(user_id)]
+    if server_id:
+        user_dict = await db_get_user(user_id, {"_id": 0, "servers.id": 1}) or {}
+        member_of = {server["id"] for server in user_dict.get("servers", [])}
+        topics.extend(server_topic(requested) for requested in server_id if requested in member_of)
+
+    # Subscribed before the response starts so nothing published in between is missed
+    subscription = push_hub.subscribe(topics)
+
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                event = await subscription.get(timeout=settings.PUSH_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            # Runs when the client disconnects and the response task is cancelled
+            push_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/events/stats")
+async def read_push_stats():
+    """Subscriber and queue counters for the push hub."""
+    return push_hub.stats()
+
 @app.get("/users/{user_id}/credit/given", response_model=List[UserSocialCreditTarget])
 async def get_social_credit_given_by_user(user_id: str):
     """Get all social credit targets and histories initiated by a specific user."""
-    user_dict = await db_get_user(user_id)
+    user_dict, pending = await score_buffer.read_with_pending(user_id, lambda: db_get_user(user_id, USER_VIEWS["scores"]))
     if not user_dict:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User {user_id} not found")
     
-    social_credits_given = user_dict.get("social_credits_given", [])
+    social_credits_given = merge_pending_scores(user_dict.get("social_credits_given", []), pending)
     # Convert list of dicts to list of Pydantic models
     return [UserSocialCreditTarget(**entry) for entry in social_credits_given]
 
 @app.get("/users/{user_id}/credit/given/{target_user_id}", response_model=UserSocialCreditTarget)
 async def get_social_credit_given_to_target(user_id: str, target_user_id: str):
     """Get the specific social credit history for a target user, as rated by user_id."""
-    user_dict = await db_get_user(user_id)
+    # Only the matching entry comes back, not the user's whole score array
+    user_dict, pending = await score_buffer.read_with_pending(user_id, lambda: db_get_user(
+        user_id,
+        {"_id": 0, "user_id": 1, "social_credits_given": {"$elemMatch": {"target_user_id": target_user_id}}}
+    ))
     if not user_dict:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User {user_id} not found")
 
-    social_credits_given = user_dict.get("social_credits_given", [])
+    social_credits_given = merge_pending_scores(user_dict.get("social_credits_given", []), pending)
     for entry in social_credits_given:
         if entry.get("target_user_id") == target_user_id:
             return UserSocialCreditTarget(**entry)
     
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No credit history found from user {user_id} for target {target_user_id}")
 
-# --- Discord Integration Endpoints (Simulated) ---
+@app.get("/users/{user_id}/credit/given/{target_user_id}/history", response_model=List[RatingEvent])
+async def get_social_credit_history(
+    user_id: str,
+    target_user_id: str,
+    from_ts: Optional[datetime] = Query(None, alias="from"),
+    to_ts: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(500, ge=1, le=5000)
+):
+    """
+    Get the rating events given by user_id to target_user_id in [from, to), oldest first.
+    Served from the ratings ledger only; user documents are never loaded.
+    """
+    events = await db_get_rating_history(user_id, target_user_id, from_ts, to_ts, limit)
+    return [RatingEvent(**event) for event in events]
+
+@app.get("/servers/{server_id}/ratings/history", response_model=List[RatingEvent])
+async def get_server_rating_history(
+    server_id: str,
+    from_ts: Optional[datetime] = Query(None, alias="from"),
+    to_ts: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(500, ge=1, le=5000)
+):
+    """
+    Get the rating events made in server_id in [from, to), oldest first.
+    """
+    events = await db_get_server_rating_history(server_id, from_ts, to_ts, limit)
+    return [RatingEvent(**event) for event in events]
+
+# --- Score Series (graphs) ---
+SERIES_DEFAULT_RANGE = timedelta(days=30)
+
+def _as_utc(ts: datetime) -> datetime:
+    # Query params without an offset are taken as UTC
+    return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+
+async def _score_series(
+    scope: str,
+    subject: str,
+    target_user_id: str,
+    from_ts: Optional[datetime],
+    to_ts: Optional[datetime],
+    points: int
+) -> ScoreSeries:
+    to_ts = _as_utc(to_ts) if to_ts else datetime.now(timezone.utc)
+    from_ts = _as_utc(from_ts) if from_ts else to_ts - SERIES_DEFAULT_RANGE
+    if from_ts >= to_ts:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'from' must be before 'to'")
+
+    resolution = pick_rollup_resolution(from_ts, to_ts, points)
+    buckets = await db_get_rollup_series(scope, subject, target_user_id, resolution, from_ts, to_ts)
+    series = []
+    cumulative = 0.0
+    for bucket in buckets:
+        cumulative += bucket["delta"]
+        series.append(ScoreSeriesPoint(ts=bucket["bucket"], delta=bucket["delta"], count=bucket["count"], cumulative=cumulative))
+    return ScoreSeries(resolution=resolution, from_ts=from_ts, to_ts=to_ts, points=series)
+
+@app.get("/users/{user_id}/credit/given/{target_user_id}/series", response_model=ScoreSeries)
+async def get_social_credit_series(
+    user_id: str,
+    target_user_id: str,
+    from_ts: Optional[datetime] = Query(None, alias="from"),
+    to_ts: Optional[datetime] = Query(None, alias="to"),
+    points: int = Query(200, ge=1, le=settings.SCORE_SERIES_MAX_POINTS)
+):
+    """
+    Score movement from user_id to target_user_id over [from, to) (default: the last 30 days).
+
+    Read from the minute/hour/day rollups, using the coarsest resolution that
+    still gives at least `points` buckets over the range.
+    """
+    return await _score_series("pair", user_id, target_user_id, from_ts, to_ts, points)
+
+@app.get("/servers/{server_id}/users/{target_user_id}/series", response_model=ScoreSeries)
+async def get_server_score_series(
+    server_id: str,
+    target_user_id: str,
+    from_ts: Optional[datetime] = Query(None, alias="from"),
+    to_ts: Optional[datetime] = Query(None, alias="to"),
+    points: int = Query(200, ge=1, le=settings.SCORE_SERIES_MAX_POINTS)
+):
+    """Score movement for target_user_id from everyone rating in server_id; see get_social_credit_series."""
+    return await _score_series("server", server_id, target_user_id, from_ts, to_ts, points)
+
+# --- Discord Integration Endpoints ---
 
 @app.get("/discord/servers/{server_id}/members/search", response_model=List[DiscordMemberSearchResult])
 async def search_discord_server_members(
     server_id: str,
     query: str,
+    limit: int = Query(25, ge=1, le=100),
     current_user: User = Depends(get_current_user) # Ensure user is authenticated
 ):
     """
-    Simulates searching for members in a Discord server.
-    In a real application, this would call the Discord API.
+    Search the known members of a server (users who have it in their servers list)
+    by username, case-insensitively.
     """
-    print(f"User {current_user.user_id} searching in server {server_id} for query: '{query}'")
+    logger.debug("User %s searching in server %s for query: '%s'", current_user.user_id, server_id, query)
+
+    members = await db_search_server_members(server_id, query, limit)
+    if members is None:
+        raise HTTPException(status_code=404, detail=f"Server {server_id} not found.")
+    return [
+        DiscordMemberSearchResult(
+            id=member["user_id"],
+            username=member.get("username") or member["user_id"],
+            discriminator="0", # Not stored; Discord has dropped discriminators for most users
+            avatar_url=member.get("profile_picture_url")
+        )
+        for member in members
+    ]
 
-    # Check if the server exists in our mock DB (optional, but good practice)
-    if server_id not in db_servers:
-        raise HTTPException(status_code=404, detail=f"Server {server_id} not found in mock database.")
+# --- Discord Profile Cache ---
+discord_profile_cache = TTLCache(
+    "discord_profiles",
+    max_entries=settings.DISCORD_PROFILE_CACHE_MAX_ENTRIES,
+    ttl=settings.DISCORD_PROFILE_CACHE_TTL_SECONDS,
+    max_stale=settings.DISCORD_PROFILE_CACHE_MAX_STALE_SECONDS
+)
 
-    # Mock data - simulate finding users in that server
-    # In a real scenario, you'd fetch all members of db_servers[server_id]
-    # and then filter them by the query.
-    
-    # For simplicity, let's assume we have a few global mock users we can filter
-    # These users might or might not be in the db_users or the specific server's user_ids list for this simulation.
-    # This is a very simplified mock.
-    mock_discord_users = [
-        DiscordMemberSearchResult(id="discord_user_1", username="SearchUserAlice", discriminator="1111", avatar_url="https://cdn.discordapp.com/embed/avatars/0.png"),
-        DiscordMemberSearchResult(id="discord_user_2", username="SearchUserBob", discriminator="2222", avatar_url="https://cdn.discordapp.com/embed/avatars/1.png"),
-        DiscordMemberSearchResult(id="discord_user_3", username="TestUserCharlie", discriminator="3333", avatar_url="https://cdn.discordapp.com/embed/avatars/2.png"),
-        DiscordMemberSearchResult(id="discord_user_4", username="AnotherBob", discriminator="4444", avatar_url=None),
-    ]
+def discord_avatar_url(user_id: Optional[str], avatar_hash: Optional[str]) -> Optional[str]:
+    if not avatar_hash or not user_id:
+        return None
+    extension = "gif" if avatar_hash.startswith("a_") else "png"
+    return f"https://cdn.discordapp.com/avatars/{user_id}/{avatar_hash}.{extension}?size=128"
 
-    results = [
-        member for member in mock_discord_users 
-        if query.lower() in member.username.lower()
-    ]
-    
-    # Further refinement: Check if these users are part of the server_id based on db_servers and db_users
-    # For now, we just return any match from the global mock list.
-    # A more realistic mock would involve:
-    # 1. Getting user_ids from db_servers[server_id].user_ids
-    # 2. For each user_id, getting the User object from db_users.
-    # 3. Checking if the query matches their username.
-    # 4. Formatting them into DiscordMemberSearchResult.
-    # This is complex for a quick mock, so the current approach is a placeholder.
+# Fetches a user's raw profile from Discord and syncs changed username/avatar into our DB.
+# Returns None on any failure so the result isn't cached.
+async def fetch_discord_user_data(
+    user_id_to_lookup: str,
+    user_dict: Dict[str, Any],
+    priority: int = PRIORITY_INTERACTIVE
+) -> Optional[Dict[str, Any]]:
+    discord_api_url = f"/users/{user_id_to_lookup}"
+    headers = bot_auth_headers()
 
-    return results
+    try:
+        logger.debug("Attempting Discord API lookup for %s...", user_id_to_lookup)
+        response = await discord_request("GET", discord_api_url, priority=priority, headers=headers)
+
+        if response.status_code == 200:
+            logger.debug("Discord API success for %s.", user_id_to_lookup)
+            user_data = response.json()
+            user_id = user_data.get("id")
+            username = user_data.get("username")
+            avatar_full_url = discord_avatar_url(user_id, user_data.get("avatar"))
+
+            # Also, update our database record with the fresh info (if different)
+            db_update_data = {}
+            if username and username != user_dict.get('username'):
+                db_update_data['username'] = username
+            if avatar_full_url != user_dict.get('profile_picture_url'): # Check if URL changed
+                db_update_data['profile_picture_url'] = avatar_full_url
+
+            if db_update_data:
+                logger.debug("Updating DB for %s with: %s", user_id, db_update_data)
+                await db_update_user_fields(user_id, db_update_data)
+            return user_data
+
+        elif response.status_code == 404:
+            logger.info("Discord API returned 404 for %s. User not found on Discord.", user_id_to_lookup)
+        else:
+            # Handle other non-200, non-404 errors from Discord
+            logger.warning("Discord API Error (%s) fetching user %s: %s", response.status_code, user_id_to_lookup, response.text)
+
+    except httpx.RequestError as e:
+        # Network errors, timeouts etc.
+        logger.warning("HTTPX RequestError fetching user %s: %s", user_id_to_lookup, e)
+    except Exception as e:
+        # Other unexpected errors
+        logger.warning("Generic error during Discord fetch for %s: %s", user_id_to_lookup, e)
+    return None
 
 @app.get("/discord/users/{user_id_to_lookup}", response_model=DiscordUserProfile)
 async def get_discord_user_profile(
     user_id_to_lookup: str,
-    current_user: User = Depends(get_current_user) # To ensure the endpoint is used by authenticated app users
+    current_user_id: str = Depends(get_current_user_id) # To ensure the endpoint is used by authenticated app users
 ):
     """
     Fetches a detailed user profile from Discord API, potentially augmenting with local server info.
@@ -689,7 +1257,7 @@ async def get_discord_user_profile(
     # Try to fetch fresh full profile from Discord API for latest details
     if not settings.DISCORD_BOT_TOKEN:
         # If no bot token, return the potentially minimal data from our DB
-        print(f"No bot token. Returning stored data for {user_id_to_lookup}.")
+        logger.debug("No bot token. Returning stored data for %s.", user_id_to_lookup)
         return DiscordUserProfile(
             id=user_dict['user_id'],
             username=user_dict['username'],
@@ -698,83 +1266,38 @@ async def get_discord_user_profile(
             associatedServerIds=[s['id'] for s in user_dict.get('servers', [])] # Extract server IDs
         )
         
-    discord_api_url = f"https://discord.com/api/v10/users/{user_id_to_lookup}"
-    headers = {"Authorization": f"Bot {settings.DISCORD_BOT_TOKEN}"}
-    updated_user_profile = None
+    # Served from the profile cache when possible; in stale-while-revalidate mode a stale
+    # entry is returned right away and Discord is called from a background task.
+    user_data = await discord_profile_cache.get_or_load(
+        user_id_to_lookup,
+        lambda: fetch_discord_user_data(user_id_to_lookup, user_dict),
+        stale_while_revalidate=settings.DISCORD_PROFILE_CACHE_STALE_WHILE_REVALIDATE,
+        # Background refreshes yield to interactive lookups when rate limited
+        refresh_loader=lambda: fetch_discord_user_data(user_id_to_lookup, user_dict, PRIORITY_BACKGROUND)
+    )
 
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"Attempting Discord API lookup for {user_id_to_lookup}...")
-            response = await client.get(discord_api_url, headers=headers)
-            
-            if response.status_code == 200:
-                print(f"Discord API success for {user_id_to_lookup}.")
-                user_data = response.json()
-                avatar_hash = user_data.get("avatar")
-                user_id = user_data.get("id")
-                username = user_data.get("username")
-                discriminator = user_data.get("discriminator")
-                
-                avatar_full_url = None
-                if avatar_hash and user_id:
-                    extension = "gif" if avatar_hash.startswith("a_") else "png"
-                    avatar_full_url = f"https://cdn.discordapp.com/avatars/{user_id}/{avatar_hash}.{extension}?size=128"
-
-                # Prepare the profile object to return
-                updated_user_profile = DiscordUserProfile(
-                    id=user_id if user_id else user_id_to_lookup, # Fallback ID
-                    username=username if username else user_dict.get('username'), # Fallback username
-                    discriminator=discriminator if discriminator else "0000", # Fallback discriminator
-                    avatar=avatar_hash,
-                    avatar_url=avatar_full_url,
-                    banner=user_data.get("banner"),
-                    accent_color=user_data.get("accent_color"),
-                    public_flags=user_data.get("public_flags"),
-                    # Get associated servers from the current DB record
-                    associatedServerIds=[s['id'] for s in user_dict.get('servers', [])]
-                )
-
-                # Also, update our database record with the fresh info (if different)
-                db_update_data = {}
-                if username and username != user_dict.get('username'):
-                    db_update_data['username'] = username
-                if avatar_full_url != user_dict.get('profile_picture_url'): # Check if URL changed
-                    db_update_data['profile_picture_url'] = avatar_full_url
-                
-                if db_update_data:
-                    print(f"Updating DB for {user_id} with: {db_update_data}")
-                    await db_update_user_fields(user_id, db_update_data)
-            
-            elif response.status_code == 404:
-                print(f"Discord API returned 404 for {user_id_to_lookup}. User not found on Discord.")
-                # DO NOT raise HTTPException. We will return the existing minimal data.
-                pass # Fall through to return user_dict data
-            
-            else:
-                # Handle other non-200, non-404 errors from Discord
-                error_detail_text = response.text
-                print(f"Discord API Error ({response.status_code}) fetching user {user_id_to_lookup}: {error_detail_text}")
-                # Don't raise, but maybe log this more formally? Fall through to return user_dict data.
-                pass # Fall through
-
-        except httpx.RequestError as e:
-            # Network errors, timeouts etc.
-            print(f"HTTPX RequestError fetching user {user_id_to_lookup}: {e}")
-            # Fall through to return existing data
-            pass
-        except Exception as e:
-            # Other unexpected errors
-            print(f"Generic error during Discord fetch for {user_id_to_lookup}: {e}")
-            # Fall through to return existing data
-            pass
-
-    # If Discord fetch was successful and created an updated profile, return that
-    if updated_user_profile:
-        return updated_user_profile
+    # If Discord fetch was successful (now or earlier), return the full profile
+    if user_data:
+        avatar_hash = user_data.get("avatar")
+        user_id = user_data.get("id")
+        username = user_data.get("username")
+        discriminator = user_data.get("discriminator")
+        return DiscordUserProfile(
+            id=user_id if user_id else user_id_to_lookup, # Fallback ID
+            username=username if username else user_dict.get('username'), # Fallback username
+            discriminator=discriminator if discriminator else "0000", # Fallback discriminator
+            avatar=avatar_hash,
+            avatar_url=discord_avatar_url(user_id, avatar_hash),
+            banner=user_data.get("banner"),
+            accent_color=user_data.get("accent_color"),
+            public_flags=user_data.get("public_flags"),
+            # Get associated servers from the current DB record
+            associatedServerIds=[s['id'] for s in user_dict.get('servers', [])]
+        )
     else:
-        # If Discord fetch failed (404, other error, network issue) or was skipped (no token),
+        # If Discord fetch failed (404, other error, network issue),
         # return the profile constructed from the data we definitely have (from ensure_user_in_db)
-        print(f"Discord fetch failed or skipped for {user_id_to_lookup}. Returning data from DB.")
+        logger.debug("Discord fetch failed for %s. Returning data from DB.", user_id_to_lookup)
         return DiscordUserProfile(
             id=user_dict['user_id'],
             username=user_dict['username'],
@@ -787,7 +1310,7 @@ async def get_discord_user_profile(
 async def check_guild_membership(
     server_id: str,
     user_id_to_check: str,
-    current_user: User = Depends(get_current_user) # Authenticated app user
+    current_user_id: str = Depends(get_current_user_id) # Authenticated app user
 ):
     """
     Checks if a user is a member of a specific Discord server using the Bot.
@@ -797,21 +1320,17 @@ async def check_guild_membership(
     await ensure_user_in_db(user_id_to_check)
 
     if not settings.DISCORD_BOT_TOKEN:
-        print(f"Error checking membership for {user_id_to_check} in {server_id}: {e}")
+        logger.error("Cannot check membership for %s in %s: Bot Token is not configured.", user_id_to_check, server_id)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error contacting Discord API")
 
 # --- User Plugin API Key Endpoints (Refactored for DB & Hashing) ---
 
 @app.get("/users/me/plugin-api-key-status", response_model_exclude_none=True)
-async def get_user_plugin_api_key_status(current_user: User = Depends(get_current_user)):
+async def get_user_plugin_api_key_status(user_dict: Dict[str, Any] = Depends(get_current_user_doc)):
     """
     Returns whether the user has an API key and when it was generated.
     """
-    # Fetch the latest user data directly from DB to ensure freshness
-    user_dict = await db_get_user(current_user.user_id)
-    if not user_dict:
-        raise HTTPException(status_code=404, detail="User not found") # Should not happen
-
+    # user_dict is the raw document loaded for this request, so the key hash is present
     if user_dict.get("plugin_api_key"):
         return {
             "has_api_key": True,
@@ -830,6 +1349,7 @@ async def generate_user_plugin_api_key(current_user: User = Depends(get_current_
 
     # Update the key in the database (hashing is handled by the db function)
     await db_update_user_api_key(current_user.user_id, new_api_key, generated_at)
+    plugin_auth_cache.invalidate(current_user.user_id) # The old key must stop working right away
     
     # IMPORTANT: Return the *plaintext* key to the user ONLY this one time.
     # Do not store the plaintext key anywhere.
@@ -843,189 +1363,440 @@ async def revoke_user_plugin_api_key(current_user: User = Depends(get_current_us
     """
     Revokes the user's API key by removing it from the database.
     """
-    # Fetch user data
-    user_dict = await db_get_user(current_user.user_id)
-    if not user_dict:
-        raise HTTPException(status_code=404, detail="User not found") # Should not happen
-       
-    # Set API key fields to None
-    user_dict['plugin_api_key'] = None
-    user_dict['plugin_api_key_generated_at'] = None
-    
-    # Update the user in the database
-    await db_upsert_user(user_dict)
+    # Set API key fields to None; only these two fields are written
+    await db_update_user_fields(current_user.user_id, {
+        "plugin_api_key": None,
+        "plugin_api_key_generated_at": None
+    })
+    plugin_auth_cache.invalidate(current_user.user_id)
     
     # Return 204 No Content
     return None
 
+# Helper to add a server to the acting user's servers list the first time they rate in it.
+# acting_user comes from get_authenticated_plugin_user, which just loaded it,
+# so its servers list is fresh enough to decide whether this server is new.
+class EnrichmentRetry(Exception):
+    """Raised by an enrichment job to have the pool retry it later."""
+
+async def add_server_to_user_if_new(acting_user: User, server_id: str) -> None:
+    """
+    Add a placeholder entry for a server the user hasn't been seen in yet.
+    The guild's real name and icon are filled in by a background job.
+    """
+    if any(server.id == server_id for server in acting_user.servers):
+        return
+    placeholder = UserServerInfo(id=server_id, name=f"Server {server_id[:6]}").model_dump()
+    # acting_user may come from the plugin auth cache; only the write that adds the entry enqueues a lookup
+    if not await db_add_user_server(acting_user.user_id, placeholder):
+        return
+    if settings.DISCORD_BOT_TOKEN:
+        enrichment_pool.submit(("guild", server_id), lambda: enrich_server_info(server_id))
+    else:
+        logger.warning("Cannot fetch info for server %s as Bot Token is not configured.", server_id)
+
+async def enrich_server_info(server_id: str) -> None:
+    logger.debug("Fetching info for server %s...", server_id)
+    # Shared with any concurrent lookup of the same guild
+    response = await guild_lookup_flight.do(
+        server_id,
+        lambda: discord_request("GET", f"/guilds/{server_id}", priority=PRIORITY_BACKGROUND, headers=bot_auth_headers())
+    )
+    if response.status_code == 200:
+        guild_data = response.json()
+        await db_update_server_info(UserServerInfo(
+            id=guild_data['id'],
+            name=guild_data['name'],
+            icon=guild_data.get('icon')
+        ).model_dump())
+        logger.info("Filled in info for server %s (%s).", server_id, guild_data['name'])
+    elif response.status_code in (403, 404):
+        # The bot can't see this guild; the placeholder is all we'll get
+        logger.warning("Failed to fetch info for server %s. Status: %s", server_id, response.status_code)
+    else:
+        raise EnrichmentRetry(f"Discord returned {response.status_code} for guild {server_id}")
+
+async def ensure_user_placeholder(user_id: str) -> None:
+    """
+    Make sure a user document exists without waiting on Discord.
+    A newly created one gets its Discord username/avatar from a background job.
+    """
+    created = await db_insert_user_if_missing(minimal_user_data(user_id))
+    if created and settings.DISCORD_BOT_TOKEN:
+        enrichment_pool.submit(("user", user_id), lambda: enrich_user_profile(user_id))
+
+async def enrich_user_profile(user_id: str) -> None:
+    response = await discord_request("GET", f"/users/{user_id}", priority=PRIORITY_BACKGROUND, headers=bot_auth_headers())
+    if response.status_code == 200:
+        user_data = response.json()
+        await db_update_user_fields(user_id, {
+            "username": user_data.get("username") or f"User_{user_id[:6]}",
+            "profile_picture_url": discord_avatar_url(user_id, user_data.get("avatar"))
+        })
+        logger.debug("Filled in Discord profile for user %s.", user_id)
+    elif response.status_code == 404:
+        logger.info("Discord API returned 404 for %s. Keeping placeholder profile.", user_id)
+    else:
+        raise EnrichmentRetry(f"Discord returned {response.status_code} for user {user_id}")
+
+@app.get("/scores/write-behind/stats")
+async def score_buffer_stats():
+    """Pending and flushed counts for the write-behind score buffer."""
+    return dict(score_buffer.stats(), enabled=settings.SCORE_WRITE_BEHIND)
+
+@app.get("/enrichment/stats")
+async def enrichment_stats():
+    """Background enrichment queue depth and outcome counters."""
+    return enrichment_pool.stats()
+
+# --- Idempotent Plugin Ingest ---
+# A rating is identified by who rated whose message by how much: a plugin retry or a
+# double-click produces the same key and is answered without touching the score.
+# Recently seen keys are checked in memory; the unique ledger index catches the rest.
+IDEMPOTENT_REPLAY_HEADER = "Idempotent-Replayed"
+
+recent_rating_keys = TTLCache(
+    "recent_rating_keys",
+    max_entries=settings.RATING_IDEMPOTENCY_CACHE_MAX_ENTRIES,
+    ttl=settings.RATING_IDEMPOTENCY_CACHE_TTL_SECONDS
+) # key -> entry returned for it
+
+# Concurrent copies of the same rating share one ingest and its result
+rating_ingest_flight = SingleFlight("rating_ingest")
+
+def rating_idempotency_key(acting_user_id: str, target_user_id: str, message_id: str, score_delta: float) -> str:
+    payload = f"{acting_user_id}:{target_user_id}:{message_id}:{score_delta!r}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+async def get_score_entry_for_replay(acting_user_id: str, target_user_id: str) -> Dict[str, Any]:
+    entries = await get_score_entries_with_pending(acting_user_id, [target_user_id])
+    # The entry can be gone if the target was untracked since the original rating
+    return (entries or {}).get(target_user_id) or _new_score_entry(target_user_id)
+
 @app.post("/plugin/ratings", response_model=UserSocialCreditTarget, status_code=status.HTTP_201_CREATED)
 async def create_rating_from_plugin(
     rating_data: PluginRatingCreate,
+    response: Response,
     authenticated_acting_user: User = Depends(get_authenticated_plugin_user) # Already verified API key
 ):
     """
     Receives a rating submission from the Discord plugin.
+    Safe to retry: a repeat of an already applied rating returns the entry again
+    (with Idempotent-Replayed: true) without changing the score.
     """
-    acting_user_id = authenticated_acting_user.user_id
+    # Validate acting_user_id from token matches payload (redundant due to Depends? Good sanity check)
+    if authenticated_acting_user.user_id != rating_data.acting_user_id:
+         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Authenticated user ID does not match acting_user_id in payload")
+
+    key = rating_idempotency_key(
+        rating_data.acting_user_id, rating_data.target_user_id, rating_data.message_id, rating_data.score_delta
+    )
+    cached_entry = recent_rating_keys.get(key)
+    if cached_entry is not None:
+        response.headers[IDEMPOTENT_REPLAY_HEADER] = "true"
+        return UserSocialCreditTarget(**cached_entry)
+
+    target_entry, replayed = await rating_ingest_flight.do(
+        key,
+        lambda: ingest_plugin_rating(rating_data, authenticated_acting_user, key)
+    )
+    if replayed:
+        response.headers[IDEMPOTENT_REPLAY_HEADER] = "true"
+    return UserSocialCreditTarget(**target_entry)
+
+async def discard_rating_events(events: List[Dict[str, Any]]) -> None:
+    """Remove stored events whose scores were not applied; a failure here is logged, not raised over the original error."""
+    try:
+        await db_delete_rating_events(events)
+    except Exception as e:
+        logger.error("Could not remove %d unapplied rating events; retries of them will be taken for replays: %s", len(events), e)
+
+async def ingest_plugin_rating(rating_data: PluginRatingCreate, acting_user: User, key: str) -> Tuple[Dict[str, Any], bool]:
+    """Apply one plugin rating unless its key is already in the ledger. Returns (entry, was_duplicate)."""
+    acting_user_id = acting_user.user_id
     target_user_id = rating_data.target_user_id
     server_id = rating_data.server_id
-    channel_id = rating_data.channel_id
-    message_id = rating_data.message_id
     score_delta = rating_data.score_delta
 
-    # Validate acting_user_id from token matches payload (redundant due to Depends? Good sanity check)
-    if acting_user_id != rating_data.acting_user_id:
-         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Authenticated user ID does not match acting_user_id in payload")
+    # Keep the message context the running score throws away
+    event = RatingEvent(
+        acting_user_id=acting_user_id,
+        target_user_id=target_user_id,
+        score_delta=score_delta,
+        ts=datetime.now(timezone.utc),
+        source="plugin",
+        server_id=server_id,
+        channel_id=rating_data.channel_id,
+        message_id=rating_data.message_id,
+        message_content_snippet=rating_data.message_content_snippet,
+        idempotency_key=key
+    ).model_dump()
+
+    # --- Record Rating Event --- 
+    # Alongside it: make sure the target user exists and the server is on the rater's list.
+    # Both write placeholders; Discord lookups for anything new run in the background.
+    inserted = False
+    helper_errors: List[BaseException] = []
+    if settings.SCORE_WRITE_BEHIND:
+        # The event is written with the next flush; until then the ledger can only be checked
+        existing_keys, _, _ = await asyncio.gather(
+            db_find_rating_idempotency_keys([key]),
+            ensure_user_placeholder(target_user_id),
+            add_server_to_user_if_new(acting_user, server_id)
+        )
+        duplicate = bool(existing_keys)
+    else:
+        # The unique index on the ledger decides: a rejected insert is a duplicate.
+        # Every outcome is collected so a stored event is known about even if a helper failed.
+        outcomes = await asyncio.gather(
+            db_insert_rating_event(event),
+            ensure_user_placeholder(target_user_id),
+            add_server_to_user_if_new(acting_user, server_id),
+            return_exceptions=True
+        )
+        if isinstance(outcomes[0], BaseException):
+            raise outcomes[0]
+        inserted = outcomes[0]
+        helper_errors = [outcome for outcome in outcomes[1:] if isinstance(outcome, BaseException)]
+        duplicate = not inserted
 
-    # Ensure target user exists in DB (create if not, using helper)
-    target_user_dict = await ensure_user_in_db(target_user_id)
-    if not target_user_dict:
-         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Target user {target_user_id} could not be established.")
+    try:
+        if helper_errors:
+            raise helper_errors[0]
+
+        if duplicate:
+            logger.debug("Duplicate plugin rating %s from %s; not applied again.", key, acting_user_id)
+            target_entry = await get_score_entry_for_replay(acting_user_id, target_user_id)
+            recent_rating_keys.set(key, target_entry)
+            return target_entry, True
+
+        # --- Update Social Credit Score --- 
+        if settings.SCORE_WRITE_BEHIND:
+            # Score and event go out with the next flush; respond with the stored entry plus everything pending
+            score_buffer.add(acting_user_id, target_user_id, score_delta, server_id, event)
+            entries = await get_score_entries_with_pending(acting_user_id, [target_user_id])
+            target_entry = entries.get(target_user_id) if entries is not None else None
+        else:
+            # Single atomic $inc on the (acting, target) entry plus $addToSet of server_id;
+            # the entry is created if this is the first rating for the target.
+            target_entry = await db_apply_score_delta(acting_user_id, target_user_id, score_delta, server_id)
+        if target_entry is None:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Authenticated user not found in DB.")
+    except BaseException:
+        # The score wasn't applied: take the event back out, or the plugin's retry would be answered as a replay
+        if inserted:
+            await discard_rating_events([event])
+        raise
+    tier_engine.record(acting_user_id, target_user_id, target_entry)
+    publish_score_change(acting_user_id, target_user_id, target_entry, score_delta, server_id)
+
+    recent_rating_keys.set(key, target_entry)
+    return target_entry, False
+
+@app.post("/plugin/ratings/batch", response_model=PluginRatingBatchResponse)
+async def create_ratings_batch_from_plugin(
+    batch: PluginRatingBatchCreate,
+    authenticated_acting_user: User = Depends(get_authenticated_plugin_user) # Authenticated once for the whole batch
+):
+    """
+    Receives a buffered batch of rating submissions from the Discord plugin.
+    All targets are resolved with one query and all deltas applied with one bulk write.
+    Each rating gets its own result; a bad item doesn't fail the rest of the batch.
+    Ratings already applied (by an earlier request or earlier in this batch) come back
+    with duplicate=true and are not applied again.
+    """
+    if len(batch.ratings) > settings.PLUGIN_RATING_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {settings.PLUGIN_RATING_BATCH_MAX_ITEMS} ratings"
+        )
 
-    # Fetch the acting user's current data from DB
-    # authenticated_acting_user is from get_authenticated_plugin_user, which uses db_get_user internally now
-    # but let's refetch to be sure we have the absolute latest for the update.
-    acting_user_dict = await db_get_user(acting_user_id)
-    if not acting_user_dict:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Authenticated user not found in DB.")
+    acting_user_id = authenticated_acting_user.user_id
+    results: List[Optional[PluginRatingBatchItemResult]] = [None] * len(batch.ratings)
+
+    # --- Drop Duplicates --- 
+    # Repeats within the batch and recently seen keys never reach the database
+    accepted = []
+    duplicate_indexes = set()
+    batch_keys: Dict[int, str] = {}
+    seen_keys = set()
+    for index, rating in enumerate(batch.ratings):
+        if rating.acting_user_id != acting_user_id:
+            results[index] = PluginRatingBatchItemResult(index=index, ok=False, detail="Authenticated user ID does not match acting_user_id in payload")
+            continue
+        key = rating_idempotency_key(acting_user_id, rating.target_user_id, rating.message_id, rating.score_delta)
+        batch_keys[index] = key
+        if key in seen_keys or recent_rating_keys.get(key) is not None:
+            duplicate_indexes.add(index)
+        else:
+            seen_keys.add(key)
+            accepted.append((index, rating))
+
+    # --- Resolve Target Users --- 
+    # One $in query for the whole batch; unknown targets get placeholders enriched in the background
+    target_ids = list({rating.target_user_id for _, rating in accepted})
+    known_targets = await db_get_users_by_ids(target_ids, {"_id": 0, "user_id": 1})
+    known_target_ids = {user["user_id"] for user in known_targets}
+    missing_target_ids = [target_id for target_id in target_ids if target_id not in known_target_ids]
+    if missing_target_ids:
+        await asyncio.gather(*(ensure_user_placeholder(target_id) for target_id in missing_target_ids))
+        known_target_ids.update(missing_target_ids)
 
     # --- Add Server Info --- 
-    # Check if this server is already associated with the acting user
-    server_known = False
-    if "servers" in acting_user_dict:
-        for server in acting_user_dict["servers"]:
-            if server.get("id") == server_id:
-                server_known = True
-                break
+    server_ids = {rating.server_id for _, rating in accepted}
+    await asyncio.gather(*(add_server_to_user_if_new(authenticated_acting_user, server_id) for server_id in server_ids))
+
+    # --- Record Rating Events --- 
+    events: Dict[int, Dict[str, Any]] = {}
+    now = datetime.now(timezone.utc)
+    for index, rating in accepted:
+        if rating.target_user_id not in known_target_ids:
+            results[index] = PluginRatingBatchItemResult(index=index, ok=False, detail=f"Target user {rating.target_user_id} could not be established.")
+            continue
+        events[index] = RatingEvent(
+            acting_user_id=acting_user_id,
+            target_user_id=rating.target_user_id,
+            score_delta=rating.score_delta,
+            ts=now,
+            source="plugin",
+            server_id=rating.server_id,
+            channel_id=rating.channel_id,
+            message_id=rating.message_id,
+            message_content_snippet=rating.message_content_snippet,
+            idempotency_key=batch_keys[index]
+        ).model_dump()
+
+    if settings.SCORE_WRITE_BEHIND:
+        # Events are written with the next flush; check the ledger for keys it already has
+        existing_keys = set(await db_find_rating_idempotency_keys([event["idempotency_key"] for event in events.values()]))
     else:
-         acting_user_dict["servers"] = [] # Initialize if missing
-
-    # If server is not known, fetch its details from Discord and add it
-    # (We need bot token for this)
-    if not server_known and settings.DISCORD_BOT_TOKEN:
-        print(f"Server {server_id} not tracked by user {acting_user_id}. Fetching info...")
-        guild_info_url = f"https://discord.com/api/v10/guilds/{server_id}"
-        headers = {"Authorization": f"Bot {settings.DISCORD_BOT_TOKEN}"}
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(guild_info_url, headers=headers)
-                if response.status_code == 200:
-                    guild_data = response.json()
-                    new_server_info = UserServerInfo(
-                        id=guild_data['id'],
-                        name=guild_data['name'],
-                        icon=guild_data.get('icon')
-                    ).model_dump()
-                    acting_user_dict["servers"].append(new_server_info)
-                    # No need to call upsert_server separately, user doc update handles it
-                    print(f"Added server {guild_data['name']} to user {acting_user_id}'s list.")
-                else:
-                    print(f"WARN: Failed to fetch info for server {server_id}. Status: {response.status_code}")
-                    # Optionally add a placeholder server entry?
-                    # acting_user_dict["servers"].append(UserServerInfo(id=server_id, name=f"Server {server_id[:6]}").model_dump())
-            except Exception as e:
-                print(f"WARN: Error fetching info for server {server_id}: {e}")
-    elif not server_known:
-         print(f"WARN: Cannot fetch info for server {server_id} as Bot Token is not configured.")
-         # Optionally add a placeholder server entry
-         # acting_user_dict["servers"].append(UserServerInfo(id=server_id, name=f"Server {server_id[:6]}").model_dump())
-
-    # --- Update Social Credit Score --- 
-    social_credits_given = acting_user_dict.get("social_credits_given", [])
-    target_entry = None
-    for entry in social_credits_given:
-        if entry.get("target_user_id") == target_user_id:
-            target_entry = entry
-            break
-
-    if target_entry is None:
-        target_entry = {
-            "target_user_id": target_user_id, 
-            "current_score": 0.0, # Initialize current_score
-            "associated_server_ids": [] # Initialize new field
-        }
-        social_credits_given.append(target_entry)
-
-    # For existing entries, default to 0.0 if current_score is missing.
-    existing_score = target_entry.get("current_score", 0.0)
-    new_score = existing_score + score_delta
+        # One unordered insert; the unique index rejects keys the ledger already has
+        rejected = await db_insert_rating_events(list(events.values()))
+        existing_keys = {event["idempotency_key"] for event in rejected}
+    for index, event in list(events.items()):
+        if event["idempotency_key"] in existing_keys:
+            duplicate_indexes.add(index)
+            del events[index]
+
+    # --- Update Social Credit Scores --- 
+    # Sum deltas per target so the bulk write touches each entry once
+    deltas: Dict[str, Dict[str, Any]] = {}
+    server_deltas: Dict[str, Dict[str, float]] = {} # target -> server -> summed delta, for the change events
+    for event in events.values():
+        delta = deltas.setdefault(event["target_user_id"], {"score_delta": 0.0, "server_ids": []})
+        delta["score_delta"] += event["score_delta"]
+        if event["server_id"] not in delta["server_ids"]:
+            delta["server_ids"].append(event["server_id"])
+        by_server = server_deltas.setdefault(event["target_user_id"], {})
+        by_server[event["server_id"]] = by_server.get(event["server_id"], 0.0) + event["score_delta"]
+
+    unapplied_events: List[Dict[str, Any]] = []
+    if settings.SCORE_WRITE_BEHIND:
+        for event in events.values():
+            score_buffer.add(acting_user_id, event["target_user_id"], event["score_delta"], event["server_id"], event)
+        updated_entries = await get_score_entries_with_pending(acting_user_id, list(deltas.keys())) or {}
+    else:
+        try:
+            updated_entries, _ = await db_apply_score_deltas_bulk(acting_user_id, deltas)
+        except BaseException:
+            # Taken to have applied nothing, like a failed write-behind flush
+            await discard_rating_events(list(events.values()))
+            raise
+        # Events of targets the write didn't apply come back out, so a resent batch applies them
+        unapplied_events = [event for event in events.values() if event["target_user_id"] not in updated_entries]
+        if unapplied_events:
+            await discard_rating_events(unapplied_events)
+    for target_id, entry in updated_entries.items():
+        tier_engine.record(acting_user_id, target_id, entry)
+        # One change per server the target was rated in, as the single-rating endpoint sends
+        for server_id, score_delta in server_deltas[target_id].items():
+            publish_score_change(acting_user_id, target_id, entry, score_delta, server_id)
+    if unapplied_events:
+        # The plugin resends the whole batch; the ratings that did go through come back as duplicates
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Score update was not applied for {len(unapplied_events)} of {len(batch.ratings)} ratings."
+        )
 
-    target_entry["current_score"] = new_score
-    
-    # Add server_id to associated_server_ids if it's not already there
-    # This happens specifically for plugin ratings which have server_id context
-    current_associated_servers = target_entry.get("associated_server_ids", [])
-    if server_id not in current_associated_servers:
-        current_associated_servers.append(server_id)
-    target_entry["associated_server_ids"] = current_associated_servers
+    # Duplicates report the target's current entry; read the ones the write didn't return
+    replay_target_ids = list({batch.ratings[index].target_user_id for index in duplicate_indexes} - updated_entries.keys())
+    replay_entries: Dict[str, Dict[str, Any]] = {}
+    if replay_target_ids:
+        replay_entries = await get_score_entries_with_pending(acting_user_id, replay_target_ids) or {}
 
-    # Update the acting user's document in the database with new score AND potentially new server
-    await db_upsert_user(acting_user_dict)
+    for index, rating in enumerate(batch.ratings):
+        if results[index] is not None:
+            continue
+        entry = updated_entries.get(rating.target_user_id)
+        if index in duplicate_indexes:
+            entry = entry or replay_entries.get(rating.target_user_id) or _new_score_entry(rating.target_user_id)
+            results[index] = PluginRatingBatchItemResult(index=index, ok=True, duplicate=True, entry=UserSocialCreditTarget(**entry))
+            continue
+        if entry:
+            recent_rating_keys.set(batch_keys[index], entry)
+        results[index] = PluginRatingBatchItemResult(
+            index=index,
+            ok=entry is not None,
+            entry=UserSocialCreditTarget(**entry) if entry else None,
+            detail=None if entry else "Score update was not applied."
+        )
 
-    # Return the updated target entry
-    return UserSocialCreditTarget(**target_entry)
+    return PluginRatingBatchResponse(results=results)
 
 @app.get("/users/{acting_user_id}/rated-users", response_model=List[RatedUserProfileResponse])
 async def get_rated_users(
     acting_user_id: str,
-    current_user: User = Depends(get_current_user) # Authenticated user
+    current_user_id: str = Depends(get_current_user_id) # Authenticated user; the aggregation below reads the user doc
 ):
     """
     Gets profiles and current scores of all users that the acting_user_id has rated.
     """
-    if acting_user_id != current_user.user_id:
+    if acting_user_id != current_user_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Cannot fetch rated users for another user")
 
-    # Fetch the acting user's data from DB
-    acting_user_dict = await db_get_user(acting_user_id)
-    if not acting_user_dict:
+    # One aggregation returns every credit entry already joined with its target's profile
+    credit_entries, pending = await score_buffer.read_with_pending(acting_user_id, lambda: db_get_rated_users_with_profiles(acting_user_id))
+    if credit_entries is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Acting user not found")
+    credit_entries = [entry for entry in merge_pending_scores(credit_entries, pending) if entry.get("target_user_id")]
 
-    social_credits_given = acting_user_dict.get("social_credits_given", [])
-    
-    rated_user_data_list = []
-    # Iterate through each user the acting_user has rated
-    for credit_entry in social_credits_given:
-        target_id = credit_entry.get("target_user_id")
-        current_score = credit_entry.get("current_score", 0.0) # Get the score
-        # Get the associated server IDs for this specific target rating
-        associated_server_ids_for_target = credit_entry.get("associated_server_ids", [])
-        if not target_id:
-            continue
+    # Targets with no user document yet are created concurrently, a few at a time
+    missing_target_ids = list({entry["target_user_id"] for entry in credit_entries if not entry.get("target")})
+    resolved_targets: Dict[str, Optional[Dict[str, Any]]] = {}
+    if missing_target_ids:
+        semaphore = asyncio.Semaphore(settings.RATED_USERS_RESOLVE_CONCURRENCY)
 
-        target_user_dict = await db_get_user(target_id)
-        profile_data = None
-        if target_user_dict:
+        async def resolve(target_id: str) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                return await ensure_user_in_db(target_id)
+
+        fetched = await asyncio.gather(*(resolve(target_id) for target_id in missing_target_ids))
+        resolved_targets = dict(zip(missing_target_ids, fetched))
+
+    rated_user_data_list = []
+    for credit_entry in credit_entries:
+        target_id = credit_entry["target_user_id"]
+        target = credit_entry.get("target") or resolved_targets.get(target_id)
+        if target:
             profile_data = DiscordUserProfile(
-                id=target_user_dict['user_id'],
-                username=target_user_dict['username'],
+                id=target_id,
+                username=target['username'],
                 discriminator="0000", # Placeholder
-                avatar_url=target_user_dict.get('profile_picture_url'),
-                associatedServerIds=associated_server_ids_for_target # Populate with IDs from credit_entry
+                avatar_url=target.get('profile_picture_url'),
+                associatedServerIds=credit_entry.get("associated_server_ids", []) # Populate with IDs from credit_entry
             )
-        else:
-            fetched_dict = await ensure_user_in_db(target_id)
-            if fetched_dict:
-                 profile_data = DiscordUserProfile(
-                    id=fetched_dict['user_id'],
-                    username=fetched_dict['username'],
-                    discriminator="0000", # Placeholder
-                    avatar_url=fetched_dict.get('profile_picture_url'),
-                    associatedServerIds=associated_server_ids_for_target # Populate with IDs from credit_entry
-                )
-            else: # Fallback
-                 profile_data = DiscordUserProfile(
-                    id=target_id,
-                    username=f"User_{target_id[:6]}",
-                    discriminator="0000",
-                    associatedServerIds=associated_server_ids_for_target # Populate with IDs from credit_entry
-                 )
-        
-        if profile_data:
-            rated_user_data_list.append(RatedUserProfileResponse(
-                profile=profile_data,
-                current_score=current_score
-            ))
+        else: # Fallback
+            profile_data = DiscordUserProfile(
+                id=target_id,
+                username=f"User_{target_id[:6]}",
+                discriminator="0000",
+                associatedServerIds=credit_entry.get("associated_server_ids", [])
+            )
+
+        rated_user_data_list.append(RatedUserProfileResponse(
+            profile=profile_data,
+            current_score=credit_entry.get("current_score", 0.0)
+        ))
 
     return rated_user_data_list
 
@@ -1037,11 +1808,102 @@ class DiscordMessage(BaseModel):
     timestamp: datetime
     # Add other fields if needed (e.g., author_id, embeds)
 
+class DiscordMessageRef(BaseModel):
+    channel_id: str
+    message_id: str
+
+class DiscordMessageBatchRequest(BaseModel):
+    messages: List[DiscordMessageRef]
+
+class DiscordMessageBatchItem(BaseModel):
+    channel_id: str
+    message_id: str
+    status: int # 200, or the error status the single-message endpoint would have returned
+    message: Optional[DiscordMessage] = None
+    detail: Optional[str] = None
+
+class DiscordMessageBatchResponse(BaseModel):
+    results: List[DiscordMessageBatchItem] # Same order as the request
+
+# Message content keyed by "channel_id:message_id". Values are {"status", "message"|"detail"},
+# so 404/403 answers are remembered too (for MESSAGE_CACHE_MISSING_TTL_SECONDS).
+message_cache = ByteBudgetCache(
+    "discord_messages",
+    max_bytes=settings.MESSAGE_CACHE_MAX_BYTES,
+    ttl=settings.MESSAGE_CACHE_TTL_SECONDS,
+    disk_dir=settings.MESSAGE_CACHE_DISK_DIR,
+    max_disk_bytes=settings.MESSAGE_CACHE_MAX_DISK_BYTES
+)
+
+def _parse_discord_message(message_data: Dict[str, Any], message_id: str) -> Dict[str, Any]:
+    author = message_data.get('author', {})
+    author_name = author.get('username', 'Unknown User')
+    discriminator = author.get('discriminator', '0000')
+    full_author_name = f"{author_name}#{discriminator}" if discriminator and discriminator != "0" else author_name
+
+    # Parse timestamp safely
+    timestamp_str = message_data.get('timestamp')
+    message_timestamp = datetime.now(timezone.utc) # Default fallback
+    if timestamp_str:
+        try:
+            message_timestamp = datetime.fromisoformat(timestamp_str)
+        except ValueError:
+            logger.warning("Could not parse timestamp '%s' for message %s", timestamp_str, message_id)
+            # Keep default timestamp
+
+    return DiscordMessage(
+        id=message_data.get('id', message_id),
+        content=message_data.get('content', '(No content or fetch error)'),
+        author_username=full_author_name,
+        timestamp=message_timestamp
+    ).model_dump(mode="json")
+
+async def _fetch_discord_message(channel_id: str, message_id: str) -> Dict[str, Any]:
+    discord_api_url = f"/channels/{channel_id}/messages/{message_id}"
+    try:
+        logger.debug("Fetching message %s from channel %s...", message_id, channel_id)
+        response = await discord_request("GET", discord_api_url, headers=bot_auth_headers())
+    except httpx.RequestError as e:
+        logger.error("HTTPX RequestError fetching message %s: %s", message_id, e)
+        return {"status": status.HTTP_503_SERVICE_UNAVAILABLE, "detail": f"Network error contacting Discord: {e}"}
+
+    if response.status_code == 200:
+        result = {"status": 200, "message": _parse_discord_message(response.json(), message_id)}
+        await message_cache.set(f"{channel_id}:{message_id}", result)
+        return result
+    if response.status_code == 404:
+        result = {"status": 404, "detail": "Message not found on Discord (or bot lacks access)."}
+    elif response.status_code == 403:
+        result = {"status": 403, "detail": "Bot lacks permissions to access this channel/message."}
+    else:
+        # Handle other errors; not cached, they are usually transient
+        logger.warning("Discord API Error (%s) fetching message %s: %s", response.status_code, message_id, response.text)
+        return {"status": response.status_code, "detail": f"Failed to fetch message from Discord: {response.text}"}
+    await message_cache.set(f"{channel_id}:{message_id}", result, ttl=settings.MESSAGE_CACHE_MISSING_TTL_SECONDS)
+    return result
+
+async def get_discord_message(channel_id: str, message_id: str) -> Dict[str, Any]:
+    """
+    Message content as {"status": 200, "message": {...}} or {"status": <error>, "detail": ...}.
+    Served from message_cache when possible.
+    """
+    cached = await message_cache.get(f"{channel_id}:{message_id}")
+    if cached is not None:
+        return cached
+    return await _load_discord_message(channel_id, message_id)
+
+async def _load_discord_message(channel_id: str, message_id: str) -> Dict[str, Any]:
+    # Concurrent misses for one message share a single Discord call
+    return await message_fetch_flight.do(
+        (channel_id, message_id),
+        lambda: _fetch_discord_message(channel_id, message_id)
+    )
+
 @app.get("/discord/channels/{channel_id}/messages/{message_id}", response_model=DiscordMessage)
 async def get_discord_message_content(
     channel_id: str = Path(..., title="The ID of the Discord channel"),
     message_id: str = Path(..., title="The ID of the Discord message"),
-    current_user: User = Depends(get_current_user) # Ensure only logged-in users can fetch
+    current_user_id: str = Depends(get_current_user_id) # Ensure only logged-in users can fetch
 ):
     """
     Fetches a specific message's content from Discord API using the Bot Token.
@@ -1050,53 +1912,115 @@ async def get_discord_message_content(
     if not settings.DISCORD_BOT_TOKEN:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Discord Bot Token not configured, cannot fetch message.")
 
-    discord_api_url = f"https://discord.com/api/v10/channels/{channel_id}/messages/{message_id}"
-    headers = {"Authorization": f"Bot {settings.DISCORD_BOT_TOKEN}"}
+    try:
+        result = await get_discord_message(channel_id, message_id)
+    except Exception as e:
+        logger.error("Generic error fetching message %s: %s", message_id, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred while fetching the message.")
+
+    if result["status"] != 200:
+        raise HTTPException(status_code=result["status"], detail=result["detail"])
+    return DiscordMessage(**result["message"])
+
+@app.post("/discord/messages/batch", response_model=DiscordMessageBatchResponse)
+async def get_discord_messages_batch(
+    batch: DiscordMessageBatchRequest,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """
+    Content for many messages at once. Cache hits are served directly; misses are
+    fetched concurrently (at most MESSAGE_BATCH_FETCH_CONCURRENCY at a time) through
+    the rate limiter. Each item carries its own status, like the single-message endpoint.
+    """
+    if not settings.DISCORD_BOT_TOKEN:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Discord Bot Token not configured, cannot fetch message.")
+    if len(batch.messages) > settings.MESSAGE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.MESSAGE_BATCH_MAX_ITEMS} messages per batch."
+        )
+
+    semaphore = asyncio.Semaphore(settings.MESSAGE_BATCH_FETCH_CONCURRENCY)
 
-    async with httpx.AsyncClient() as client:
+    async def resolve(ref: DiscordMessageRef) -> DiscordMessageBatchItem:
         try:
-            print(f"Fetching message {message_id} from channel {channel_id}...")
-            response = await client.get(discord_api_url, headers=headers)
-
-            if response.status_code == 200:
-                message_data = response.json()
-                author = message_data.get('author', {})
-                author_name = author.get('username', 'Unknown User')
-                discriminator = author.get('discriminator', '0000')
-                full_author_name = f"{author_name}#{discriminator}" if discriminator and discriminator != "0" else author_name
-
-                # Parse timestamp safely
-                timestamp_str = message_data.get('timestamp')
-                message_timestamp = datetime.now(timezone.utc) # Default fallback
-                if timestamp_str:
-                    try:
-                        message_timestamp = datetime.fromisoformat(timestamp_str)
-                    except ValueError:
-                        print(f"Warning: Could not parse timestamp '{timestamp_str}' for message {message_id}")
-                        # Keep default timestamp
-
-                return DiscordMessage(
-                    id=message_data.get('id', message_id),
-                    content=message_data.get('content', '(No content or fetch error)'),
-                    author_username=full_author_name,
-                    timestamp=message_timestamp
-                )
-            elif response.status_code == 404:
-                raise HTTPException(status_code=404, detail="Message not found on Discord (or bot lacks access).")
-            elif response.status_code == 403:
-                 raise HTTPException(status_code=403, detail="Bot lacks permissions to access this channel/message.")
-            else:
-                # Handle other errors
-                error_detail_text = response.text
-                print(f"Discord API Error ({response.status_code}) fetching message {message_id}: {error_detail_text}")
-                raise HTTPException(status_code=response.status_code, detail=f"Failed to fetch message from Discord: {error_detail_text}")
-
-        except httpx.RequestError as e:
-            print(f"HTTPX RequestError fetching message {message_id}: {e}")
-            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Network error contacting Discord: {e}")
+            # Hits never wait behind the semaphore
+            result = await message_cache.get(f"{ref.channel_id}:{ref.message_id}")
+            if result is None:
+                async with semaphore:
+                    result = await _load_discord_message(ref.channel_id, ref.message_id)
         except Exception as e:
-            print(f"Generic error fetching message {message_id}: {e}")
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred while fetching the message.")
+            logger.error("Generic error fetching message %s: %s", ref.message_id, e)
+            result = {"status": status.HTTP_500_INTERNAL_SERVER_ERROR, "detail": "An unexpected error occurred while fetching the message."}
+        return DiscordMessageBatchItem(
+            channel_id=ref.channel_id,
+            message_id=ref.message_id,
+            status=result["status"],
+            message=result.get("message"),
+            detail=result.get("detail")
+        )
+
+    return DiscordMessageBatchResponse(results=await asyncio.gather(*(resolve(ref) for ref in batch.messages)))
+
+# --- Admin: Sampling Profiler ---
+ADMIN_API_KEY_HEADER_NAME = "X-Admin-API-Key"
+
+admin_api_key_header = APIKeyHeader(name=ADMIN_API_KEY_HEADER_NAME, auto_error=False)
+
+async def require_admin(provided_key: Optional[str] = Security(admin_api_key_header)) -> None:
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not provided_key:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Admin API Key is missing")
+    if not secrets.compare_digest(provided_key.encode(), settings.ADMIN_API_KEY.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid Admin API Key.")
+
+class ProfilerStartRequest(BaseModel):
+    sample_rate: float = Field(settings.PROFILER_DEFAULT_SAMPLE_RATE, gt=0, le=1)
+    route: Optional[str] = None # Path template as declared, e.g. "/plugin/ratings"; None considers every route
+    method: Optional[str] = None
+    interval_ms: float = Field(settings.PROFILER_SAMPLE_INTERVAL_MS, ge=1, le=1000)
+    blocking_threshold_ms: float = Field(settings.PROFILER_BLOCKING_THRESHOLD_MS, ge=0) # 0 turns blocking detection off
+    reset: bool = True # Drop stacks from the previous run
+
+@app.post("/admin/profiler/start", dependencies=[Depends(require_admin)])
+async def start_profiler(config: ProfilerStartRequest):
+    """Start sampling requests (or reconfigure a running profiler)."""
+    profiler.start(
+        sample_rate=config.sample_rate,
+        route=config.route,
+        method=config.method,
+        interval=config.interval_ms / 1000,
+        blocking_threshold=config.blocking_threshold_ms / 1000,
+        reset=config.reset
+    )
+    return profiler.stats()
+
+@app.post("/admin/profiler/stop", dependencies=[Depends(require_admin)])
+async def stop_profiler():
+    """Stop sampling; what was collected stays downloadable."""
+    await profiler.stop()
+    return profiler.stats()
+
+@app.get("/admin/profiler/stats", dependencies=[Depends(require_admin)])
+async def read_profiler_stats():
+    """Profiler settings, sample counts and recent event loop stalls."""
+    return profiler.stats()
+
+@app.get("/admin/profiler/profile", dependencies=[Depends(require_admin)])
+async def download_profile(format: Literal["collapsed", "speedscope"] = Query("speedscope")):
+    """Aggregated stacks as collapsed lines (flamegraph.pl, inferno) or speedscope JSON."""
+    if format == "collapsed":
+        return Response(
+            content=profiler.collapsed(),
+            media_type="text/plain",
+            headers={"Content-Disposition": 'attachment; filename="profile.collapsed.txt"'}
+        )
+    return Response(
+        content=json.dumps(profiler.speedscope()),
+        media_type="application/json",
+        headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'}
+    )
 
 # MONGO_URI = "mongodb://localhost:27017/"
 # client = MongoClient(MONGO_URI)
@@ -0,0 +1,27 @@
+"""
+Storage startup through the database facade.
+"""
+import pytest
+
+from backend.core import database
+from backend.core.config import settings
+from backend.core.storage.memory import MemoryStorage
+
+pytestmark = pytest.mark.anyio
+
+async def test_eager_init_pings_once(monkeypatch):
+    pings = []
+    original_ping = MemoryStorage.ping
+
+    async def counting_ping(self):
+        pings.append(self)
+        await original_ping(self)
+
+    monkeypatch.setattr(settings, "STORAGE_ENGINE", "memory")
+    monkeypatch.setattr(MemoryStorage, "ping", counting_ping)
+    await database.init_db()
+    try:
+        assert len(pings) == 1
+        assert (await database.storage_health())["ready"]
+    finally:
+        await database.close_db()
@@ -0,0 +1,53 @@
+"""
+MongoStorage failure handling that the engine-agnostic contract tests can't reach.
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from .conftest import MongoMockStorage
+from .test_storage_contract import rating
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def storage():
+    storage = MongoMockStorage("mongodb://mongomock", "test")
+    await storage.open()
+    await storage.ensure_indexes()
+    try:
+        yield storage
+    finally:
+        await storage.close()
+
+async def test_rollups_cover_events_stored_before_an_insert_error(storage, monkeypatch):
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    events = [rating("1", "2", float(2 ** index), now - timedelta(minutes=1), key=str(index)) for index in range(3)]
+
+    class SecondInsertFails:
+        """The ratings collection, except insert_many stores all but the second doc and reports an error for it."""
+
+        def __init__(self, collection):
+            self.collection = collection
+
+        def __getattr__(self, name):
+            return getattr(self.collection, name)
+
+        async def insert_many(self, docs, ordered=True):
+            for index, doc in enumerate(docs):
+                if index != 1:
+                    await self.collection.insert_one(doc)
+            raise BulkWriteError({
+                "nInserted": len(docs) - 1,
+                "writeErrors": [{"index": 1, "code": 10107, "errmsg": "not primary"}],
+            })
+
+    ratings = SecondInsertFails(storage.ratings)
+    monkeypatch.setattr(MongoMockStorage, "ratings", property(lambda self: ratings))
+    with pytest.raises(BulkWriteError):
+        await storage.insert_rating_events(events)
+
+    assert sorted(await storage.find_rating_idempotency_keys(["0", "1", "2"])) == ["0", "2"]
+    minutes = await storage.get_rollup_series("pair", "1", "2", "minute", now - timedelta(hours=1), now)
+    assert [(row["delta"], row["count"]) for row in minutes] == [(1.0 + 4.0, 2)]
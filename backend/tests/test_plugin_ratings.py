@@ -0,0 +1,139 @@
+"""
+Plugin rating ingest: a rating whose score was not applied stays retryable.
+"""
+import uuid
+
+import httpx
+import pytest
+
+from backend import main
+from backend.core import database
+from backend.core.config import settings
+from backend.core.push import server_topic
+
+from .conftest import add_user, needs_mongo_server
+
+pytestmark = pytest.mark.anyio
+
+API_KEY = "plugin-key"
+HEADERS = {"X-Plugin-API-Key": API_KEY, "X-Acting-User-ID": "1"}
+
+def plugin_rating(target="2", delta=1.0, server_id="10"):
+    return {
+        "acting_user_id": "1", "target_user_id": target, "server_id": server_id, "channel_id": "20",
+        "message_id": uuid.uuid4().hex, "score_delta": delta, "message_content_snippet": "hi",
+    }
+
+@pytest.fixture
+async def storage(engine, monkeypatch):
+    await add_user(engine, "1", servers=["10"])
+    await add_user(engine, "2", servers=["10"])
+    await add_user(engine, "3", servers=["10"])
+    await engine.update_user_fields("1", {"plugin_api_key": database.hash_api_key(API_KEY)})
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(settings, "SCORE_WRITE_BEHIND", False)
+    monkeypatch.setattr(settings, "DISCORD_BOT_TOKEN", "")
+    main.plugin_auth_cache.clear()
+    main.recent_rating_keys.clear()
+    return engine
+
+@pytest.fixture
+async def client():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test", headers=HEADERS) as client:
+        yield client
+
+def fail_once(monkeypatch, target, name, failure):
+    """The first call to target.name goes to failure(original, *args) instead."""
+    original = getattr(target, name)
+    calls = []
+
+    async def wrapper(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            return await failure(original, *args)
+        return await original(*args, **kwargs)
+
+    monkeypatch.setattr(target, name, wrapper)
+
+async def connection_reset(original, *args):
+    raise ConnectionError("connection reset")
+
+async def score(storage, target):
+    entries = await storage.get_score_entries("1", [target])
+    return entries[target]["current_score"] if target in entries else None
+
+async def test_single_rating_is_retryable_after_a_failed_apply(storage, client, monkeypatch):
+    fail_once(monkeypatch, main, "db_apply_score_delta", connection_reset)
+    rating = plugin_rating(delta=2.0)
+    with pytest.raises(ConnectionError):
+        await client.post("/plugin/ratings", json=rating)
+    assert await score(storage, "2") is None
+
+    response = await client.post("/plugin/ratings", json=rating)
+    assert response.status_code == 201, response.text
+    assert "Idempotent-Replayed" not in response.headers
+    assert await score(storage, "2") == 2.0
+    assert len(await storage.get_rating_history("1", "2", None, None, 10)) == 1
+
+    # Now it is applied, the next copy is a replay
+    response = await client.post("/plugin/ratings", json=rating)
+    assert response.headers["Idempotent-Replayed"] == "true"
+    assert await score(storage, "2") == 2.0
+
+async def test_single_rating_is_retryable_after_a_failed_helper(storage, client, monkeypatch):
+    fail_once(monkeypatch, main, "ensure_user_placeholder", connection_reset)
+    rating = plugin_rating(delta=2.0)
+    with pytest.raises(ConnectionError):
+        await client.post("/plugin/ratings", json=rating)
+
+    assert (await client.post("/plugin/ratings", json=rating)).status_code == 201
+    assert await score(storage, "2") == 2.0
+
+async def test_batch_is_retryable_after_a_partly_applied_write(storage, client, monkeypatch):
+    needs_mongo_server(storage, "positional updates in bulk writes")
+
+    async def stop_before_second_pair(original, deltas):
+        pairs = list(deltas)
+        await original({pairs[0]: deltas[pairs[0]]})
+        return pairs[1:]
+
+    fail_once(monkeypatch, storage, "apply_score_deltas", stop_before_second_pair)
+    batch = {"ratings": [plugin_rating("2", 1.0), plugin_rating("3", 4.0)]}
+    response = await client.post("/plugin/ratings/batch", json=batch)
+    assert response.status_code == 500
+    assert await score(storage, "2") == 1.0 and await score(storage, "3") is None
+
+    # The resent batch applies the second rating only
+    response = await client.post("/plugin/ratings/batch", json=batch)
+    assert response.status_code == 200, response.text
+    assert [(result["ok"], result["duplicate"]) for result in response.json()["results"]] == [(True, True), (True, False)]
+    assert await score(storage, "2") == 1.0
+    assert await score(storage, "3") == 4.0
+
+async def test_batch_is_retryable_after_a_failed_write(storage, client, monkeypatch):
+    needs_mongo_server(storage, "positional updates in bulk writes")
+    fail_once(monkeypatch, storage, "apply_score_deltas", connection_reset)
+    batch = {"ratings": [plugin_rating("2", 1.0), plugin_rating("3", 4.0)]}
+    with pytest.raises(ConnectionError):
+        await client.post("/plugin/ratings/batch", json=batch)
+
+    response = await client.post("/plugin/ratings/batch", json=batch)
+    assert [result["duplicate"] for result in response.json()["results"]] == [False, False]
+    assert await score(storage, "2") == 1.0
+    assert await score(storage, "3") == 4.0
+
+async def test_batch_publishes_a_change_per_server(storage, client):
+    needs_mongo_server(storage, "positional updates in bulk writes")
+    subscription = main.push_hub.subscribe([server_topic("11")])
+    try:
+        batch = {"ratings": [plugin_rating("2", 1.0, "10"), plugin_rating("2", 2.0, "11"), plugin_rating("2", 4.0, "11")]}
+        assert (await client.post("/plugin/ratings/batch", json=batch)).status_code == 200
+        events = []
+        while (event := await subscription.get(timeout=0)) is not None:
+            events.append(event)
+    finally:
+        main.push_hub.unsubscribe(subscription)
+    # The entry is in both servers now, so server 11 hears about both changes, each with its own server and delta
+    assert sorted((event["server_id"], event["score_delta"], event["current_score"]) for event in events) == [
+        ("10", 1.0, 7.0), ("11", 6.0, 7.0)
+    ]
@@ -0,0 +1,33 @@
+"""
+apply_score_delta under contention: no delta lost, no entry duplicated, whatever the interleaving.
+"""
+import asyncio
+import random
+
+import pytest
+
+from .conftest import add_user
+
+pytestmark = pytest.mark.anyio
+
+DELTAS = 3000
+TARGETS = ["2", "3", "4"]
+SERVERS = [None, "10", "11"]
+
+async def test_concurrent_deltas_sum_exactly(engine):
+    await add_user(engine, "1")
+    rng = random.Random(1)
+    # Halves add up exactly in any order, so the totals can be compared with ==
+    deltas = [(rng.choice(TARGETS), rng.randint(-10, 10) / 2, rng.choice(SERVERS)) for _ in range(DELTAS)]
+
+    # Every pair starts out missing, so the first deltas race to create the entry too
+    results = await asyncio.gather(*(engine.apply_score_delta("1", target, delta, server_id) for target, delta, server_id in deltas))
+    assert all(result is not None for result in results)
+
+    entries = (await engine.get_user("1", {"_id": 0, "social_credits_given": 1}))["social_credits_given"]
+    assert sorted(entry["target_user_id"] for entry in entries) == TARGETS
+    for entry in entries:
+        target = entry["target_user_id"]
+        assert entry["current_score"] == sum(delta for t, delta, _ in deltas if t == target)
+        servers = {server_id for t, _, server_id in deltas if t == target and server_id}
+        assert sorted(entry["associated_server_ids"]) == sorted(servers)
@@ -0,0 +1,263 @@
+"""
+The StorageEngine contract: every engine gives the same answers to the same calls.
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.core.database import USER_VIEWS
+from backend.core.storage.base import as_utc
+from backend.core.storage.memory import MemoryStorage
+from backend.loadtest.storage_bench import Timings, _diff, run_workload
+
+from .conftest import add_user, needs_mongo_server
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2026, 1, 15, 12, 0, tzinfo=timezone.utc)
+def rating(acting, target, delta, ts, server_id=None, key=None):
+    return {
+        "acting_user_id": acting, "target_user_id": target, "score_delta": delta, "ts": ts,
+        "source": "plugin", "server_id": server_id, "channel_id": None, "message_id": None,
+        "message_content_snippet": None, "reason": None, "idempotency_key": key,
+    }
+
+# Users
+
+async def test_upsert_user_applies_defaults_only_on_create(engine):
+    await add_user(engine, "1")
+    await engine.update_user_fields("1", {"plugin_api_key": "hash"})
+    await add_user(engine, "1", username="Renamed")
+
+    user = await engine.get_user("1", {"_id": 0})
+    assert user["username"] == "Renamed"
+    assert user["plugin_api_key"] == "hash"
+    assert user["social_credits_given"] == []
+
+async def test_get_user_views(engine):
+    await add_user(engine, "1", servers=["10"])
+    await engine.update_user_fields("1", {"plugin_api_key": "hash"})
+
+    assert set(await engine.get_user("1", USER_VIEWS["auth"])) == {
+        "user_id", "username", "profile_picture_url", "servers", "plugin_api_key", "plugin_api_key_generated_at"
+    }
+    assert await engine.get_user("1", USER_VIEWS["profile"]) == {
+        "user_id": "1", "username": "User1", "profile_picture_url": "https://cdn.example/1.png", "servers": [{"id": "10"}]
+    }
+    assert await engine.get_user("1", USER_VIEWS["scores"]) == {"user_id": "1", "social_credits_given": []}
+    assert await engine.get_user("missing") is None
+
+async def test_get_users_by_ids_skips_missing(engine):
+    for user_id in ("1", "2", "3"):
+        await add_user(engine, user_id)
+    users = await engine.get_users_by_ids(["3", "missing", "1"], {"_id": 0, "user_id": 1})
+    assert sorted(user["user_id"] for user in users) == ["1", "3"]
+
+async def test_insert_user_if_missing(engine):
+    assert await engine.insert_user_if_missing({"user_id": "1", "username": "First", "social_credits_given": [], "servers": []})
+    assert not await engine.insert_user_if_missing({"user_id": "1", "username": "Second", "social_credits_given": [], "servers": []})
+    assert (await engine.get_user("1", {"_id": 0, "username": 1}))["username"] == "First"
+
+async def test_add_user_server_once(engine):
+    await add_user(engine, "1")
+    assert await engine.add_user_server("1", {"id": "10", "name": "Guild", "icon": None})
+    assert not await engine.add_user_server("1", {"id": "10", "name": "Guild", "icon": None})
+    assert not await engine.add_user_server("missing", {"id": "10", "name": "Guild", "icon": None})
+    assert (await engine.get_user("1", {"_id": 0, "servers.id": 1}))["servers"] == [{"id": "10"}]
+
+async def test_update_server_info_patches_every_lister(engine):
+    needs_mongo_server(engine, "array filters")
+    await add_user(engine, "1", servers=["10", "11"])
+    await add_user(engine, "2", servers=["10"])
+    await engine.update_server_info({"id": "10", "name": "Renamed", "icon": "icon"})
+
+    for user_id in ("1", "2"):
+        servers = (await engine.get_user(user_id, {"_id": 0, "servers": 1}))["servers"]
+        assert servers[0] == {"id": "10", "name": "Renamed", "icon": "icon"}
+    assert (await engine.get_user("1", {"_id": 0, "servers": 1}))["servers"][1]["name"] == "Guild 11"
+
+async def test_search_server_members(engine):
+    await add_user(engine, "3", servers=["10"], username="alice")
+    await add_user(engine, "1", servers=["10"], username="Alicia")
+    await add_user(engine, "2", servers=["10"], username="bob")
+    await add_user(engine, "4", servers=["11"], username="alina")
+
+    found = await engine.search_server_members("10", "ALI", 10)
+    assert [member["user_id"] for member in found] == ["1", "3"]
+    assert set(found[0]) == {"user_id", "username", "profile_picture_url"}
+    assert len(await engine.search_server_members("10", "", 2)) == 2
+    assert await engine.search_server_members("99", "", 10) is None
+
+# Scores
+
+async def test_apply_score_delta_creates_then_increments(engine):
+    await add_user(engine, "1")
+    first = await engine.apply_score_delta("1", "2", 1.5, "10")
+    assert first == {"target_user_id": "2", "current_score": 1.5, "associated_server_ids": ["10"]}
+    second = await engine.apply_score_delta("1", "2", -0.5, "11")
+    assert second == {"target_user_id": "2", "current_score": 1.0, "associated_server_ids": ["10", "11"]}
+    await engine.apply_score_delta("1", "2", 1.0, "10")
+
+    entries = await engine.get_score_entries("1", ["2", "3"])
+    assert entries == {"2": {"target_user_id": "2", "current_score": 2.0, "associated_server_ids": ["10", "11"]}}
+    assert await engine.apply_score_delta("missing", "2", 1.0) is None
+    assert await engine.get_score_entries("missing", ["2"]) is None
+
+async def test_apply_score_delta_to_an_entry_without_server_ids(engine):
+    # What the web path stored before entries carried associated_server_ids
+    await engine.upsert_user(
+        {"user_id": "1", "username": "User1", "servers": [], "social_credits_given": [{"target_user_id": "2", "current_score": 3.0}]},
+        defaults={"plugin_api_key": None, "plugin_api_key_generated_at": None}
+    )
+    assert await engine.apply_score_delta("1", "2", 1.0, "10") == {
+        "target_user_id": "2", "current_score": 4.0, "associated_server_ids": ["10"]
+    }
+    assert await engine.apply_score_delta("1", "2", 1.0) == {
+        "target_user_id": "2", "current_score": 5.0, "associated_server_ids": ["10"]
+    }
+    assert await engine.get_server_score_entries("10") == [{"acting_user_id": "1", "target_user_id": "2", "current_score": 5.0}]
+
+async def test_apply_score_deltas(engine):
+    needs_mongo_server(engine, "positional updates in bulk writes")
+    await add_user(engine, "1")
+    await add_user(engine, "2")
+    unapplied = await engine.apply_score_deltas({
+        ("1", "3"): {"score_delta": 2.0, "server_ids": ["10"]},
+        ("2", "3"): {"score_delta": -1.0, "server_ids": []},
+        ("missing", "3"): {"score_delta": 5.0, "server_ids": []},
+    })
+    assert unapplied == []
+    assert (await engine.get_score_entries("1", ["3"]))["3"]["current_score"] == 2.0
+    assert (await engine.get_score_entries("2", ["3"]))["3"]["current_score"] == -1.0
+    assert await engine.get_server_score_entries("10") == [{"acting_user_id": "1", "target_user_id": "3", "current_score": 2.0}]
+
+async def test_remove_score_entry(engine):
+    await add_user(engine, "1")
+    await engine.apply_score_delta("1", "2", 1.0, "10")
+    assert await engine.remove_score_entry("1", "2") is True
+    assert await engine.remove_score_entry("1", "2") is False
+    assert await engine.remove_score_entry("missing", "2") is None
+    assert await engine.get_score_entries("1", ["2"]) == {}
+    assert await engine.get_server_score_entries("10") == []
+
+async def test_rated_users_with_profiles(engine):
+    needs_mongo_server(engine, "$lookup with a pipeline")
+    await add_user(engine, "1")
+    await add_user(engine, "2", username="Target")
+    await engine.apply_score_deltas({("1", "2"): {"score_delta": 1.0, "server_ids": []}, ("1", "3"): {"score_delta": 2.0, "server_ids": []}})
+    rows = sorted(await engine.get_rated_users_with_profiles("1"), key=lambda row: row["target_user_id"])
+    assert [row["target_user_id"] for row in rows] == ["2", "3"]
+    assert rows[0]["target"] == {"username": "Target", "profile_picture_url": "https://cdn.example/2.png"}
+    assert rows[1]["target"] is None
+    assert await engine.get_rated_users_with_profiles("missing") is None
+
+# Rating ledger and rollups
+
+async def test_insert_rating_event_is_idempotent_by_key(engine):
+    assert await engine.insert_rating_event(rating("1", "2", 1.0, NOW, key="a"))
+    assert not await engine.insert_rating_event(rating("1", "2", 1.0, NOW, key="a"))
+    assert len(await engine.get_rating_history("1", "2", None, None, 10)) == 1
+    assert sorted(await engine.find_rating_idempotency_keys(["a", "b"])) == ["a"]
+
+async def test_events_without_a_key_are_never_duplicates(engine):
+    needs_mongo_server(engine, "partial indexes")
+    # Web ratings carry no idempotency key
+    assert await engine.insert_rating_event(rating("1", "2", 1.0, NOW))
+    assert await engine.insert_rating_event(rating("1", "2", 1.0, NOW))
+    assert await engine.insert_rating_events([rating("1", "2", 1.0, NOW), rating("1", "2", 1.0, NOW)]) == []
+    assert len(await engine.get_rating_history("1", "2", None, None, 10)) == 4
+
+async def test_insert_rating_events_returns_duplicates(engine):
+    await engine.insert_rating_event(rating("1", "2", 1.0, NOW, key="old"))
+    batch = [
+        rating("1", "2", 1.0, NOW, key="old"),
+        rating("1", "2", 2.0, NOW + timedelta(seconds=1), key="new"),
+        rating("1", "2", 3.0, NOW + timedelta(seconds=2), key="new"),
+    ]
+    duplicates = await engine.insert_rating_events(batch)
+    assert [event["score_delta"] for event in duplicates] == [1.0, 3.0]
+    history = await engine.get_rating_history("1", "2", None, None, 10)
+    assert [event["score_delta"] for event in history] == [1.0, 2.0]
+
+async def test_rating_history_range_and_limit(engine):
+    events = [rating("1", "2", float(index), NOW + timedelta(minutes=index), server_id="10", key=str(index)) for index in range(5)]
+    await engine.insert_rating_events(events)
+    history = await engine.get_rating_history("1", "2", NOW + timedelta(minutes=1), NOW + timedelta(minutes=4), 2)
+    assert [event["score_delta"] for event in history] == [1.0, 2.0]
+    assert as_utc(history[0]["ts"]) == NOW + timedelta(minutes=1)
+    server_history = await engine.get_server_rating_history("10", NOW + timedelta(minutes=3), None, 10)
+    assert [event["score_delta"] for event in server_history] == [3.0, 4.0]
+
+async def test_rollup_series(engine):
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    await engine.insert_rating_events([
+        rating("1", "2", 1.0, now - timedelta(minutes=2), server_id="10", key="a"),
+        rating("1", "2", 2.0, now - timedelta(minutes=2, seconds=-30), server_id="10", key="b"),
+        rating("1", "2", 4.0, now - timedelta(minutes=1), server_id="10", key="c"),
+    ])
+    minutes = await engine.get_rollup_series("pair", "1", "2", "minute", now - timedelta(hours=1), now)
+    assert [(as_utc(row["bucket"]), row["delta"], row["count"]) for row in minutes] == [
+        (now - timedelta(minutes=2), 3.0, 2),
+        (now - timedelta(minutes=1), 4.0, 1),
+    ]
+    days = await engine.get_rollup_series("server", "10", "2", "day", now - timedelta(days=2), now + timedelta(days=1))
+    assert sum(row["delta"] for row in days) == 7.0
+    assert sum(row["count"] for row in days) == 3
+
+async def test_delete_rating_events_takes_them_out_of_ledger_and_rollups(engine):
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    kept = rating("1", "2", 1.0, now - timedelta(minutes=1), server_id="10", key="kept")
+    dropped = rating("1", "2", 2.0, now - timedelta(minutes=1), server_id="10", key="dropped")
+    alone = rating("1", "2", 8.0, now - timedelta(minutes=2), server_id="10", key="alone")
+    await engine.insert_rating_events([kept, dropped, alone])
+
+    assert await engine.delete_rating_events([dropped, alone, rating("1", "2", 4.0, now, key="never-stored")]) == 2
+    assert await engine.find_rating_idempotency_keys(["kept", "dropped", "alone"]) == ["kept"]
+    assert [event["score_delta"] for event in await engine.get_rating_history("1", "2", None, None, 10)] == [1.0]
+    assert await engine.get_server_rating_history("10", None, None, 10) == await engine.get_rating_history("1", "2", None, None, 10)
+    for scope, subject in (("pair", "1"), ("server", "10")):
+        minutes = await engine.get_rollup_series(scope, subject, "2", "minute", now - timedelta(hours=1), now)
+        # The bucket left empty is gone, not a zero
+        assert [(row["delta"], row["count"]) for row in minutes] == [(1.0, 1)]
+    # The key is free again
+    assert await engine.insert_rating_event(dropped)
+
+# Servers
+
+async def test_servers_and_member_pages(engine):
+    for server_id in ("12", "10", "11"):
+        await engine.upsert_server({"server_id": server_id, "server_name": f"Guild {server_id}", "user_ids": ["3", "1", "2"]})
+    for user_id in ("1", "2", "3"):
+        await add_user(engine, user_id, servers=["10"])
+    await engine.update_user_fields("1", {"plugin_api_key": "hash"})
+
+    server = await engine.get_server("10")
+    assert server["server_name"] == "Guild 10" and sorted(server["user_ids"]) == ["1", "2", "3"]
+    assert await engine.get_server("99") is None
+
+    servers = await engine.find_servers_after("10", 0, 1).to_list(length=None)
+    assert [server["server_id"] for server in servers] == ["11", "12"]
+    assert [server["server_id"] async for server in engine.find_servers_after(None, 2, 1)] == ["10", "11"]
+
+    assert await engine.get_server_member_ids_page("10", None, 2) == ["1", "2"]
+    assert await engine.get_server_member_ids_page("10", "2", 2) == ["3"]
+    assert await engine.get_server_member_ids_page("99", None, 2) is None
+
+    members = await engine.find_members_by_ids(["3", "missing", "1"]).to_list(length=None)
+    assert [member["user_id"] for member in members] == ["1", "3"]
+    assert "plugin_api_key" not in members[0] and "social_credits_given" not in members[0]
+
+# The whole storage_bench workload, answers compared with the in-memory engine
+
+async def test_bench_workload_matches_memory(engine):
+    needs_mongo_server(engine, "array filters or $lookup with a pipeline")
+    if isinstance(engine, MemoryStorage):
+        pytest.skip("memory is the reference")
+    options = argparse.Namespace(users=60, servers=5, ratings=300, batch_size=20, reads=5, seed=7)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    reference = MemoryStorage()
+    await reference.open()
+    expected = await run_workload(reference, options, Timings(), now)
+    answers = await run_workload(engine, options, Timings(), now)
+    assert _diff(expected, answers) == []
@@ -0,0 +1,66 @@
+"""
+ensure_user_in_db: first-time lookups for one user share a single Discord fetch and upsert.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from backend import main
+from backend.core import database
+from backend.core.config import settings
+from backend.core.storage.memory import MemoryStorage
+
+pytestmark = pytest.mark.anyio
+
+LOOKUPS = 500
+
+class CountingStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.upserts = 0
+
+    async def upsert_user(self, user_data, defaults=None):
+        self.upserts += 1
+        await super().upsert_user(user_data, defaults)
+
+@pytest.fixture
+async def storage(monkeypatch):
+    storage = CountingStorage()
+    await storage.open()
+    monkeypatch.setattr(database, "engine", storage)
+    return storage
+
+@pytest.fixture
+def discord_fetches(monkeypatch):
+    fetches = []
+
+    async def fake_discord_request(method, path, priority=0, **kwargs):
+        fetches.append(path)
+        await asyncio.sleep(0.05) # Long enough for every lookup to pile up behind this one
+        return httpx.Response(200, json={"id": path.rsplit("/", 1)[-1], "username": "newcomer", "avatar": "abc"})
+
+    monkeypatch.setattr(settings, "DISCORD_BOT_TOKEN", "bot-token")
+    monkeypatch.setattr(main, "discord_request", fake_discord_request)
+    return fetches
+
+async def test_concurrent_first_lookups_fetch_and_upsert_once(storage, discord_fetches):
+    views = ["profile", "auth"]
+    users = await asyncio.gather(*(main.ensure_user_in_db("42", views[index % 2]) for index in range(LOOKUPS)))
+
+    assert discord_fetches == ["/users/42"]
+    assert storage.upserts == 1
+    assert users[0] == {
+        "user_id": "42", "username": "newcomer",
+        "profile_picture_url": "https://cdn.discordapp.com/avatars/42/abc.png?size=128", "servers": []
+    }
+    assert users[1]["plugin_api_key"] is None and "social_credits_given" not in users[1]
+    # Each caller gets its own copy
+    users[1].pop("plugin_api_key")
+    assert "plugin_api_key" in users[3]
+
+async def test_existing_user_is_not_fetched(storage, discord_fetches):
+    await main.ensure_user_in_db("42")
+    await main.ensure_user_in_db("42", "auth")
+    assert discord_fetches == ["/users/42"]
+    assert storage.upserts == 1
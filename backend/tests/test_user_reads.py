@@ -0,0 +1,71 @@
+"""
+Authenticated endpoints read the caller's user document at most once per request.
+"""
+import httpx
+import pytest
+
+from backend import main
+from backend.core import database
+from backend.core.storage.memory import MemoryStorage
+
+from .conftest import add_user
+
+pytestmark = pytest.mark.anyio
+
+USER_ID = "1"
+
+class ReadCountingStorage(MemoryStorage):
+    """Counts reads that load (part of) USER_ID's document."""
+
+    def __init__(self):
+        super().__init__()
+        self.user_reads = 0
+
+    async def get_user(self, user_id, projection=None):
+        self.user_reads += user_id == USER_ID
+        return await super().get_user(user_id, projection)
+
+    async def get_users_by_ids(self, user_ids, projection=None):
+        self.user_reads += USER_ID in user_ids
+        return await super().get_users_by_ids(user_ids, projection)
+
+    async def get_score_entries(self, acting_user_id, target_ids):
+        self.user_reads += acting_user_id == USER_ID
+        return await super().get_score_entries(acting_user_id, target_ids)
+
+    async def get_rated_users_with_profiles(self, acting_user_id):
+        self.user_reads += acting_user_id == USER_ID
+        return await super().get_rated_users_with_profiles(acting_user_id)
+
+@pytest.fixture
+async def storage(monkeypatch):
+    storage = ReadCountingStorage()
+    await storage.open()
+    await add_user(storage, USER_ID, servers=["10"])
+    await add_user(storage, "2", servers=["10"])
+    await storage.apply_score_delta(USER_ID, "2", 1.0, "10")
+    monkeypatch.setattr(database, "engine", storage)
+    return storage
+
+@pytest.fixture
+async def client():
+    transport = httpx.ASGITransport(app=main.app)
+    token = main.create_access_token({"sub": USER_ID})
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", headers={"Authorization": f"Bearer {token}"}) as client:
+        yield client
+
+@pytest.mark.parametrize("method, path, body", [
+    ("GET", "/users/me", None),
+    ("GET", "/users/me/tracked-servers", None),
+    ("GET", "/users/me/plugin-api-key-status", None),
+    ("POST", "/users/me/plugin-api-key", None),
+    ("DELETE", "/users/me/plugin-api-key", None),
+    ("GET", f"/users/{USER_ID}/rated-users", None),
+    ("POST", f"/users/{USER_ID}/credit/2", {"score_delta": 1.0}),
+    ("DELETE", f"/users/{USER_ID}/tracking/2", None),
+    ("GET", "/discord/servers/10/members/search?query=user", None),
+])
+async def test_at_most_one_user_read_per_request(storage, client, method, path, body):
+    response = await client.request(method, path, json=body)
+    assert response.status_code < 300, response.text
+    assert storage.user_reads <= 1
@@ -0,0 +1,129 @@
+"""
+ScoreDeltaBuffer against in-process sinks that can fail partway through a flush.
+"""
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+
+from backend.core.writebehind import ScoreDeltaBuffer
+
+pytestmark = pytest.mark.anyio
+
+class Sinks:
+    """A ledger with a unique idempotency key and a score table; insert_events can be told to fail after storing some."""
+
+    def __init__(self):
+        self.ledger: Dict[str, Dict[str, Any]] = {}
+        self.scores: Dict[tuple, float] = {}
+        self.fail_insert_after = None
+        self.hold_apply = None # An asyncio.Event the next apply waits on after writing
+
+    async def insert_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        duplicates = []
+        for index, event in enumerate(events):
+            if self.fail_insert_after is not None and index == self.fail_insert_after:
+                self.fail_insert_after = None
+                raise ConnectionError("connection reset mid-insert")
+            if event["idempotency_key"] in self.ledger:
+                duplicates.append(event)
+            else:
+                self.ledger[event["idempotency_key"]] = event
+        return duplicates
+
+    async def apply_deltas(self, deltas):
+        for pair, delta in deltas.items():
+            self.scores[pair] = self.scores.get(pair, 0.0) + delta["score_delta"]
+        if self.hold_apply is not None:
+            await self.hold_apply.wait() # Written, but the write hasn't returned yet
+        return []
+
+def rate(buffer: ScoreDeltaBuffer, key: str, delta: float, target: str = "2") -> None:
+    event = {"acting_user_id": "1", "target_user_id": target, "score_delta": delta, "server_id": "10", "idempotency_key": key}
+    buffer.add("1", target, delta, "10", event)
+
+@pytest.fixture
+def sinks():
+    return Sinks()
+
+@pytest.fixture
+def buffer(sinks):
+    return ScoreDeltaBuffer(sinks.apply_deltas, sinks.insert_events, flush_interval=60, max_pending=1000)
+
+async def test_partial_insert_is_not_counted_twice_or_undercounted(sinks, buffer):
+    rate(buffer, "a", 1.0)
+    rate(buffer, "b", 2.0)
+    sinks.fail_insert_after = 1 # "a" is stored, "b" isn't, and the flush sees an error
+    await buffer.flush()
+    assert list(sinks.ledger) == ["a"]
+    assert sinks.scores[("1", "2")] == 3.0
+    assert buffer.stats()["pending_events"] == 2
+
+    rate(buffer, "c", 4.0)
+    await buffer.flush()
+    assert sorted(sinks.ledger) == ["a", "b", "c"]
+    assert sinks.scores[("1", "2")] == 7.0
+    assert buffer.pending("1") == {}
+    assert buffer.stats()["pending_events"] == 0
+    assert buffer.stats()["duplicates"] == 0
+
+async def test_duplicates_in_the_batch_are_still_taken_back(sinks, buffer):
+    rate(buffer, "a", 1.0)
+    await buffer.flush()
+    rate(buffer, "a", 1.0) # a client retry that slipped past the key check
+    rate(buffer, "b", 2.0)
+    await buffer.flush()
+    assert sinks.scores[("1", "2")] == 3.0
+    assert buffer.stats()["duplicates"] == 1
+
+async def test_discard_drops_the_pairs_queued_events(sinks, buffer):
+    rate(buffer, "a", 1.0)
+    rate(buffer, "b", 2.0, target="3")
+    sinks.fail_insert_after = 0
+    await buffer.flush()
+
+    await buffer.discard("1", "2")
+    assert buffer.stats()["pending_events"] == 1
+    rate(buffer, "c", 4.0)
+    await buffer.flush()
+    assert sorted(sinks.ledger) == ["b", "c"]
+    assert sinks.scores[("1", "2")] == 1.0 + 4.0
+    assert sinks.scores[("1", "3")] == 2.0
+
+async def test_reads_during_a_flush_count_each_delta_once(sinks, buffer):
+    rate(buffer, "a", 1.0)
+    await buffer.flush()
+    rate(buffer, "b", 2.0)
+    sinks.hold_apply = asyncio.Event()
+    flush = asyncio.create_task(buffer.flush())
+    await asyncio.sleep(0) # The flush has written "b" and is waiting on the write to return
+
+    async def read():
+        return sinks.scores.get(("1", "2"), 0.0)
+
+    def total(result):
+        stored, pending = result
+        return stored + sum(delta["score_delta"] for delta in pending.values())
+
+    reading = asyncio.create_task(buffer.read_with_pending("1", read))
+    await asyncio.sleep(0)
+    assert not reading.done() # Held until the write is over
+    rate(buffer, "c", 4.0)
+    sinks.hold_apply.set()
+    await flush
+    assert total(await reading) == 7.0
+    assert total(await buffer.read_with_pending("1", read)) == 7.0
+
+async def test_a_read_overlapped_by_a_flush_is_done_again(sinks, buffer):
+    rate(buffer, "a", 1.0)
+    reads = []
+
+    async def read():
+        if not reads:
+            await buffer.flush() # Lands while the first read is in flight, after pending() was taken
+        reads.append(sinks.scores.get(("1", "2"), 0.0))
+        return reads[-1]
+
+    stored, pending = await buffer.read_with_pending("1", read)
+    assert reads == [1.0, 1.0]
+    assert stored == 1.0 and pending == {}
@@ -278,6 +278,44 @@ const MainLayout: React.FC = () => {
     }
   }, [currentUser?.user_id, fetchRatedUsersData]);
 
+  // Latest rated users for the push handlers below, which are set up once per user
+  const ratedUsersDataRef = useRef(ratedUsersData);
+  useEffect(() => {
+    ratedUsersDataRef.current = ratedUsersData;
+  }, [ratedUsersData]);
+
+  // Effect to apply pushed score changes instead of refetching
+  useEffect(() => {
+    const token = localStorage.getItem('app_access_token');
+    if (!currentUser?.user_id || !token) {
+      return;
+    }
+    const userId = currentUser.user_id;
+    const source = new EventSource(`http://localhost:8000/events/stream?token=${encodeURIComponent(token)}`);
+
+    source.addEventListener('score', (message: MessageEvent) => {
+      const event = JSON.parse(message.data);
+      if (event.acting_user_id !== userId) {
+        return; // A score someone else gave us; the rated-users list only holds ours
+      }
+      if (!ratedUsersDataRef.current.some(rated => rated.profile.id === event.target_user_id)) {
+        fetchRatedUsersData(); // First rating of a new target: need its profile
+        return;
+      }
+      setRatedUsersData(prev => prev.map(rated =>
+        rated.profile.id === event.target_user_id ? { ...rated, current_score: event.current_score } : rated
+      ));
+    });
+    source.addEventListener('score_removed', (message: MessageEvent) => {
+      const event = JSON.parse(message.data);
+      setRatedUsersData(prev => prev.filter(rated => rated.profile.id !== event.target_user_id));
+    });
+    // Sent when we fell behind and events were dropped
+    source.addEventListener('resync', () => fetchRatedUsersData());
+
+    return () => source.close();
+  }, [currentUser?.user_id, fetchRatedUsersData]);
+
   // --- Effect for Login Button Floating Animation ---
   useEffect(() => {
     if (!currentUser) { // Only run when login screen is visible
@@ -2,7 +2,7 @@
  * @name SocialCreditPlugin
  * @author YourName
  * @authorId YourDiscordId
- * @version 1.3.6
+ * @version 1.4.0
  * @description Allows assigning social credit scores via message context menu. Uses BDFDB Library.
  * @source https://github.com/yourusername/SocialCreditPlugin
  * @updateUrl https://raw.githubusercontent.com/yourusername/SocialCreditPlugin/main/SocialCreditPlugin.plugin.js
@@ -10,6 +10,7 @@
 
 module.exports = (_ => {
   const changeLog = {
+      "1.4.0": "Buffered score submissions: ratings are queued and sent to the backend in batches on a short interval instead of one request per click.",
       "1.3.6": "Corrected modal closing logic when submitting with Enter key. Removed erroneous BDFDB.ModalUtils.close call.",
       "1.3.5": "Corrected API key saving to BDFDB.DataUtils.save. Enhanced modal: empty default, scroll to change score, Enter to submit, style tweaks. Addressed passive listener warning context.",
       // ... previous changelog entries
@@ -173,6 +174,15 @@ module.exports = (_ => {
                   }
               };
               this.API_ENDPOINT = "http://localhost:8000/plugin/ratings";
+              this.BATCH_API_ENDPOINT = "http://localhost:8000/plugin/ratings/batch";
+              this.BATCH_FLUSH_INTERVAL_MS = 2000; // How long clicks are buffered before being sent
+              this.BATCH_MAX_SIZE = 100; // Must not exceed the backend's PLUGIN_RATING_BATCH_MAX_ITEMS
+              this.BATCH_RETRY_BASE_MS = 2000; // First retry delay after a failed flush; doubles per failure
+              this.BATCH_RETRY_MAX_MS = 60000;
+              this.pendingRatings = [];
+              this.flushTimer = null;
+              this.flushFailures = 0; // Consecutive failed flushes
+              this.retryAt = 0; // No flush before this time (ms since epoch) while backing off
               let loadedSettings = BDFDB.DataUtils.load(this, "settings");
               console.log(`[${this.getName()}] Initial settings loaded by BDFDB:`, loadedSettings);
           }
@@ -185,9 +195,15 @@ module.exports = (_ => {
               }
               let currentSettings = BDFDB.DataUtils.get(this, "settings");
               console.log(`[${this.getName()}] Settings onStart:`, currentSettings);
+              this.flushTimer = setInterval(() => this.flushPendingRatings(), this.BATCH_FLUSH_INTERVAL_MS);
           }
 
           onStop() {
+              if (this.flushTimer) {
+                  clearInterval(this.flushTimer);
+                  this.flushTimer = null;
+              }
+              this.flushPendingRatings(true); // Don't drop clicks that are still buffered, even while backing off
               console.log(`[${this.getName()}] Stopped.`);
           }
 
@@ -343,50 +359,93 @@ module.exports = (_ => {
                   return;
               }
 
+              // Buffered; flushPendingRatings sends it with the next batch
+              this.pendingRatings.push(payload);
+              if (this.pendingRatings.length >= this.BATCH_MAX_SIZE) {
+                  this.flushPendingRatings();
+              }
+          }
+
+          // Puts a batch that didn't get through back at the front of the buffer and backs off.
+          // Resending is safe: the server derives each rating's idempotency key from its content.
+          requeueRatings(ratings) {
+              this.pendingRatings.unshift(...ratings);
+              this.flushFailures += 1;
+              const delay = Math.min(this.BATCH_RETRY_BASE_MS * 2 ** (this.flushFailures - 1), this.BATCH_RETRY_MAX_MS);
+              this.retryAt = Date.now() + delay;
+              console.warn(`[${this.getName()}] ${ratings.length} ratings requeued; retrying in ${delay} ms.`);
+          }
+
+          async flushPendingRatings(force = false) {
+              if (this.pendingRatings.length === 0) return;
+              if (!force && Date.now() < this.retryAt) return; // Backing off after a failed flush
+
+              let settings = BDFDB.DataUtils.get(this, "settings");
+              if (!settings || !settings.apiKey) {
+                  BDFDB.NotificationUtils.toast("API Key is missing. Aborting submission.", { type: "error" });
+                  console.error(`[${this.getName()}] API Key is missing in flushPendingRatings. Settings:`, settings);
+                  return;
+              }
               if (!BdApi.Net || typeof BdApi.Net.fetch !== 'function') {
                   console.error(`[${this.getName()}] BdApi.Net.fetch is not available! Cannot make network request.`);
                   BDFDB.NotificationUtils.toast("Network request function is missing. Plugin cannot contact server.", { type: "error" });
                   return;
               }
 
+              // Take the whole buffer; anything clicked while this request is in flight goes in the next batch
+              const ratings = this.pendingRatings.splice(0, this.BATCH_MAX_SIZE);
+
               const requestOptions = {
                   method: "POST",
                   headers: {
                       "Content-Type": "application/json",
                       "X-Plugin-API-Key": settings.apiKey,
-                      "X-Acting-User-ID": payload.acting_user_id
+                      "X-Acting-User-ID": ratings[0].acting_user_id
                   },
-                  body: JSON.stringify(payload)
+                  body: JSON.stringify({ ratings: ratings })
               };
 
-              // console.log(`[${this.getName()}] Attempting to submit score with BdApi.Net.fetch. Endpoint: ${this.API_ENDPOINT}, Options:`, requestOptions);
-
               try {
-                  const response = await BdApi.Net.fetch(this.API_ENDPOINT, requestOptions);
+                  const response = await BdApi.Net.fetch(this.BATCH_API_ENDPOINT, requestOptions);
 
                   if (!response) {
                       BDFDB.NotificationUtils.toast("Submission failed: No response from server (BdApi.Net.fetch returned undefined/null).", { type: "error" });
-                      console.error(`[${this.getName()}] BdApi.Net.fetch returned undefined/null. Payload:`, payload);
+                      console.error(`[${this.getName()}] BdApi.Net.fetch returned undefined/null. Ratings:`, ratings);
+                      this.requeueRatings(ratings);
                       return;
                   }
-                  
-                  const responseBodyText = await response.text(); 
-
-                  if (response.status === 201) {
-                      BDFDB.NotificationUtils.toast("Social credit score submitted successfully!", { type: "success" });
-                      // console.log(`[${this.getName()}] Social credit score submitted successfully (Status 201). Payload:`, payload, "Response Body:", responseBodyText);
-                  } else if (response.ok) { 
-                      BDFDB.NotificationUtils.toast(`Score submission acknowledged (Status: ${response.status})!`, { type: "info" });
-                      // console.log(`[${this.getName()}] Score submission acknowledged with status ${response.status}. Payload:`, payload, "Response Body:", responseBodyText);
-                  } else { 
+
+                  const responseBodyText = await response.text();
+
+                  if (response.ok) {
+                      this.flushFailures = 0;
+                      this.retryAt = 0;
+                      let results = [];
+                      try {
+                          results = JSON.parse(responseBodyText).results || [];
+                      } catch (parseError) {
+                          console.warn(`[${this.getName()}] Could not parse batch response:`, responseBodyText);
+                      }
+                      const failed = results.filter(result => !result.ok);
+                      if (failed.length === 0) {
+                          const noun = ratings.length === 1 ? "score" : "scores";
+                          BDFDB.NotificationUtils.toast(`${ratings.length} social credit ${noun} submitted successfully!`, { type: "success" });
+                      } else {
+                          BDFDB.NotificationUtils.toast(`${failed.length} of ${ratings.length} scores were rejected: ${failed[0].detail || "Unknown error"}`, { type: "error", timeout: 7000 });
+                          console.error(`[${this.getName()}] Rejected ratings:`, failed, "Ratings:", ratings);
+                      }
+                  } else {
                       BDFDB.NotificationUtils.toast(`API Error: ${response.status} - ${responseBodyText || response.statusText || "Unknown server error"}`, { type: "error", timeout: 7000 });
-                      console.error(`[${this.getName()}] API Error: Status: ${response.status}, StatusText: ${response.statusText}, Body: ${responseBodyText}, Payload:`, payload);
+                      console.error(`[${this.getName()}] API Error: Status: ${response.status}, StatusText: ${response.statusText}, Body: ${responseBodyText}, Ratings:`, ratings);
+                      // A batch the server can't parse (422) or won't take (413) fails the same way every time; anything else is retried
+                      if (response.status !== 413 && response.status !== 422) this.requeueRatings(ratings);
                   }
-              } catch (error) { 
-                  BDFDB.NotificationUtils.toast("Failed to send score. Network error or server issue. Check console.", { type: "error", timeout: 7000 });
-                  console.error(`[${this.getName()}] Network or other error submitting score with BdApi.Net.fetch:`, error, "Payload:", payload);
+              } catch (error) {
+                  BDFDB.NotificationUtils.toast("Failed to send scores. Network error or server issue. Check console.", { type: "error", timeout: 7000 });
+                  console.error(`[${this.getName()}] Network or other error submitting scores with BdApi.Net.fetch:`, error, "Ratings:", ratings);
                   if (error && error.message) console.error(`[${this.getName()}] Error message: ${error.message}`);
                   if (error && error.response) console.error(`[${this.getName()}] Error response object:`, error.response);
+                  this.requeueRatings(ratings);
               }
           }
       };